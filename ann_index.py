@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Approximate Nearest Neighbours (IVF)
+- Spherical k-means splits the enrolled embeddings into inverted lists
+- A query only scores the rows of the `nprobe` lists whose centroids are
+  closest, so search cost grows with rows / lists instead of the roster
+- Pure NumPy; the lists live in the memory-mapped index file (embedding_index)
+"""
+
+import numpy as np
+
+# Below this many rows exact search is as fast as probing lists
+IVF_MIN_ROWS = 2048
+
+
+def ivf_lists_for(rows):
+    """Default list count: ~sqrt(rows), at least 16"""
+    return max(16, int(np.sqrt(rows))) if rows >= IVF_MIN_ROWS else 0
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def assign_lists(matrix, centroids, chunk=8192):
+    """Closest centroid (by cosine) of every row"""
+    lists = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), chunk):
+        lists[start:start + chunk] = np.argmax(matrix[start:start + chunk] @ centroids.T, axis=1)
+    return lists
+
+
+def train_centroids(matrix, nlist, iterations=10, sample=64, seed=0):
+    """
+    Spherical k-means on a sample of the rows.
+
+    Args:
+        matrix: (rows, dim) L2-normalized embeddings
+        nlist: number of centroids
+        sample: training rows per centroid
+
+    Returns:
+        np.ndarray: (nlist, dim) float32 unit centroids
+    """
+    rng = np.random.default_rng(seed)
+    rows = len(matrix)
+    train = matrix[np.sort(rng.choice(rows, min(rows, nlist * sample), replace=False))]
+    train = np.ascontiguousarray(train, dtype=np.float32)
+    centroids = train[rng.choice(len(train), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        lists = assign_lists(train, centroids)
+        order = np.argsort(lists, kind='stable')
+        sorted_lists = lists[order]
+        starts = np.flatnonzero(np.r_[True, sorted_lists[1:] != sorted_lists[:-1]])
+        sums = np.zeros_like(centroids)
+        sums[sorted_lists[starts]] = np.add.reduceat(train[order], starts, axis=0)
+        # An empty list restarts from a random training row
+        empty = np.setdiff1d(np.arange(nlist), sorted_lists[starts])
+        sums[empty] = train[rng.choice(len(train), len(empty))]
+        centroids = _normalize(sums).astype(np.float32)
+    return centroids
+
+
+def build_ivf(matrix, nlist, seed=0):
+    """
+    Train the centroids and bucket every row.
+
+    Returns:
+        tuple: (centroids, list offsets (nlist + 1), row numbers ordered by list)
+    """
+    centroids = train_centroids(matrix, nlist, seed=seed)
+    lists = assign_lists(matrix, centroids)
+    list_rows = np.argsort(lists, kind='stable').astype(np.int32)
+    offsets = np.zeros(nlist + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(lists, minlength=nlist))
+    return centroids, offsets, list_rows
+
+
+def probe_rows(query, centroids, offsets, list_rows, nprobe):
+    """Rows of the nprobe lists closest to one query, in ascending row order"""
+    nprobe = min(nprobe, len(centroids))
+    closest = np.argpartition(-(centroids @ query), nprobe - 1)[:nprobe]
+    rows = np.concatenate([list_rows[offsets[lst]:offsets[lst + 1]] for lst in closest])
+    rows.sort()
+    return rows
@@ -0,0 +1,4 @@
+"""
+Offline benchmarks for the face image pipeline.
+Run from the repository root, e.g. python -m benchmarks.bench_detection_resolution
+"""
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Detection Resolution Benchmark
+- Runs the tiered cascade detector on proxies of different sizes
+- Reports latency and recall against the synthetic corpus ground truth
+
+Usage:
+    python -m benchmarks.bench_detection_resolution --dims 0,720,480,320,240
+"""
+
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+from benchmarks.corpus import build_corpus, count_matches
+from face_detection import TieredFaceDetector, CASCADE_TIERS, LIVE_TIERS
+
+
+def load_cascade():
+    cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    if cascade.empty():
+        raise RuntimeError('Failed to load cascade classifier')
+    return cascade
+
+
+def run(dims, tiers, repeat):
+    """Benchmark every detection size over the corpus"""
+    detector = TieredFaceDetector(load_cascade())
+    corpus = build_corpus()
+    total_faces = sum(len(item['faces']) for item in corpus)
+    results = []
+
+    for max_dim in dims:
+        timings = []
+        matched = 0
+        false_positives = 0
+        for item in corpus:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                detection = detector.detect(item['image'], tiers, max_dim or None)
+                timings.append((time.perf_counter() - start) * 1000)
+            hits = count_matches(detection.faces, item['faces'])
+            matched += hits
+            false_positives += len(detection.faces) - hits
+
+        timings = np.array(timings)
+        results.append({
+            'max_dim': max_dim or 'full',
+            'mean_ms': round(float(timings.mean()), 2),
+            'p95_ms': round(float(np.percentile(timings, 95)), 2),
+            'recall': round(matched / total_faces, 3) if total_faces else None,
+            'false_positives': false_positives,
+        })
+    return {'frames': len(corpus), 'faces': total_faces, 'results': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Detection speed vs recall by proxy size')
+    parser.add_argument('--dims', default='0,720,480,320,240', help='Comma separated max dims (0 = full size)')
+    parser.add_argument('--chain', choices=['live', 'full'], default='full', help='Tier chain to evaluate')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per frame')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    dims = [int(d) for d in args.dims.split(',')]
+    tiers = LIVE_TIERS if args.chain == 'live' else CASCADE_TIERS
+    report = run(dims, tiers, args.repeat)
+    report['chain'] = args.chain
+
+    print(f"{report['frames']} frames, {report['faces']} faces, chain: {args.chain}")
+    print(f"{'max_dim':>8} {'mean ms':>9} {'p95 ms':>9} {'recall':>7} {'false+':>7}")
+    for row in report['results']:
+        print(f"{row['max_dim']:>8} {row['mean_ms']:>9} {row['p95_ms']:>9} {row['recall']:>7} {row['false_positives']:>7}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f'Results written to {args.json}')
+
+
+if __name__ == '__main__':
+    main()
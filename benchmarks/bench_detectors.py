@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Detector Engine Benchmark
+- Haar fallback chain vs the OpenCV DNN engines (YuNet, res10 SSD) on CPU
+- Latency (mean, p95, p99) and recall / false positives on the synthetic corpus
+- Engines whose model files are missing are skipped
+
+Usage:
+    python -m benchmarks.bench_detectors --engines haar,yunet,ssd --max-dim 320
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks.bench_detection_resolution import load_cascade
+from benchmarks.corpus import build_corpus, count_matches
+from face_detection import create_detector, DETECTOR_ENGINES, CASCADE_TIERS
+
+
+def build_engine(engine, args):
+    return create_detector(
+        engine,
+        cascade=load_cascade() if engine == 'haar' else None,
+        yunet_model=args.yunet_model,
+        ssd_prototxt=args.ssd_prototxt,
+        ssd_model=args.ssd_model,
+        score_threshold=args.score_threshold
+    )
+
+
+def run_engine(detector, corpus, max_dim, repeat):
+    timings = []
+    matched = 0
+    false_positives = 0
+    for item in corpus:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            detection = detector.detect(item['image'], CASCADE_TIERS, max_dim or None)
+            timings.append((time.perf_counter() - start) * 1000)
+        hits = count_matches(detection.faces, item['faces'])
+        matched += hits
+        false_positives += len(detection.faces) - hits
+
+    timings = np.array(timings)
+    total_faces = sum(len(item['faces']) for item in corpus)
+    return {
+        'mean_ms': round(float(timings.mean()), 2),
+        'p95_ms': round(float(np.percentile(timings, 95)), 2),
+        'p99_ms': round(float(np.percentile(timings, 99)), 2),
+        'recall': round(matched / total_faces, 3) if total_faces else None,
+        'false_positives': false_positives,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Speed and recall of the detector engines')
+    parser.add_argument('--engines', default=','.join(DETECTOR_ENGINES), help='Comma separated engines')
+    parser.add_argument('--max-dim', type=int, default=320, help='Detection proxy size (0 = full size)')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per frame')
+    parser.add_argument('--score-threshold', type=float, default=0.6, help='DNN confidence threshold')
+    parser.add_argument('--yunet-model', default='models/face_detection_yunet_2023mar.onnx')
+    parser.add_argument('--ssd-prototxt', default='models/deploy.prototxt')
+    parser.add_argument('--ssd-model', default='models/res10_300x300_ssd_iter_140000.caffemodel')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    corpus = build_corpus()
+    report = {'frames': len(corpus), 'max_dim': args.max_dim, 'results': []}
+    for engine in args.engines.split(','):
+        try:
+            detector = build_engine(engine, args)
+        except (FileNotFoundError, ValueError) as e:
+            print(f'Skipping {engine}: {e}')
+            continue
+        row = run_engine(detector, corpus, args.max_dim, args.repeat)
+        row['engine'] = engine
+        report['results'].append(row)
+
+    print(f"{report['frames']} frames, max_dim {args.max_dim or 'full'}")
+    print(f"{'engine':>8} {'mean ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'recall':>7} {'false+':>7}")
+    for row in report['results']:
+        print(f"{row['engine']:>8} {row['mean_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9} "
+              f"{row['recall']:>7} {row['false_positives']:>7}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f'Results written to {args.json}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Identification Search Benchmark
+- Exact matrix-multiply search vs IVF (ann_index) at several nprobe values
+- Synthetic rosters: students drawn around cluster centres (campuses, lighting
+  conditions), a few noisy embeddings per student
+- Recall against exact search (top-1 agreement, top-k overlap), latency
+  (mean, p95) and index build / open time per roster size
+
+Usage:
+    python -m benchmarks.bench_identify --students 1000,10000,50000 --nprobe 4,8,16,32
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from ann_index import ivf_lists_for
+from embedding_index import EmbeddingIndex, write_index_file
+
+
+def _unit(matrix):
+    return (matrix / np.linalg.norm(matrix, axis=-1, keepdims=True)).astype(np.float32)
+
+
+def make_roster(students, images, dim, clusters, spread, seed):
+    """
+    Returns:
+        tuple: ({student id: (name, [(position, embedding), ...])}, identity vectors)
+    """
+    rng = np.random.default_rng(seed)
+    centres = _unit(rng.standard_normal((clusters, dim)))
+    offsets = spread * _unit(rng.standard_normal((students, dim)))
+    identities = _unit(centres[rng.integers(clusters, size=students)] + offsets)
+    roster = {}
+    for number, identity in enumerate(identities):
+        views = _unit(identity + 0.45 * _unit(rng.standard_normal((images, dim))))
+        roster[f'S{number:06d}'] = (f'Student {number}', [(f'{view:03d}', views[view]) for view in range(images)])
+    return roster, identities
+
+
+def make_queries(identities, count, seed):
+    """Fresh noisy views of random enrolled students"""
+    rng = np.random.default_rng(seed + 1)
+    chosen = rng.integers(len(identities), size=count)
+    dim = identities.shape[1]
+    return _unit(identities[chosen] + 0.45 * _unit(rng.standard_normal((count, dim))))
+
+
+def timed_search(index, queries, k, batch):
+    timings, results = [], []
+    for start in range(0, len(queries), batch):
+        t0 = time.perf_counter()
+        results.extend(index.search(queries[start:start + batch], k))
+        timings.append((time.perf_counter() - t0) * 1000)
+    return results, np.array(timings)
+
+
+def compare(exact, approx):
+    top1 = np.mean([bool(a) and bool(e) and a[0][0] == e[0][0] for a, e in zip(approx, exact)])
+    topk = np.mean([len({sid for sid, _ in a} & {sid for sid, _ in e}) / max(1, len(e))
+                    for a, e in zip(approx, exact)])
+    return round(float(top1), 4), round(float(topk), 4)
+
+
+def run_size(students, args, tmp_dir):
+    roster, identities = make_roster(students, args.images, args.dim, args.clusters, args.spread, args.seed)
+    queries = make_queries(identities, args.queries, args.seed)
+    path = os.path.join(tmp_dir, f'bench_{students}.idx')
+
+    nlist = args.nlist or ivf_lists_for(students * args.images) or 16
+    start = time.perf_counter()
+    write_index_file(path, roster, args.dim, 'bench', nlist)
+    build_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    exact_index = EmbeddingIndex.open(path)
+    open_ms = (time.perf_counter() - start) * 1000
+
+    # Warm the page cache so both searches read from memory
+    timed_search(exact_index, queries[:args.batch], args.k, args.batch)
+    exact, exact_ms = timed_search(exact_index, queries, args.k, args.batch)
+    rows = [{'search': 'exact', 'nprobe': None, 'mean_ms': round(float(exact_ms.mean()), 2),
+             'p95_ms': round(float(np.percentile(exact_ms, 95)), 2), 'recall_at_1': 1.0, 'recall_at_k': 1.0}]
+    for nprobe in args.nprobe:
+        approx_index = EmbeddingIndex.open(path, nprobe=nprobe)
+        approx, approx_ms = timed_search(approx_index, queries, args.k, args.batch)
+        recall_1, recall_k = compare(exact, approx)
+        rows.append({'search': 'ivf', 'nprobe': nprobe, 'mean_ms': round(float(approx_ms.mean()), 2),
+                     'p95_ms': round(float(np.percentile(approx_ms, 95)), 2),
+                     'recall_at_1': recall_1, 'recall_at_k': recall_k})
+    os.remove(path)
+    return {'students': students, 'rows': students * args.images, 'nlist': nlist,
+            'build_s': round(build_s, 2), 'open_ms': round(open_ms, 2), 'results': rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recall and latency of exact vs IVF identification search')
+    parser.add_argument('--students', default='1000,10000,30000', help='Comma separated roster sizes')
+    parser.add_argument('--images', type=int, default=3, help='Embeddings per student')
+    parser.add_argument('--dim', type=int, default=256, help='Embedding length (lbp: 256, sface: 128)')
+    parser.add_argument('--clusters', type=int, default=64, help='Cluster centres the students are drawn around')
+    parser.add_argument('--spread', type=float, default=1.5, help='Student spread around the centres (higher = harder)')
+    parser.add_argument('--nlist', type=int, default=0, help='IVF lists (0 = ~sqrt(rows))')
+    parser.add_argument('--nprobe', default='4,8,16,32', help='Comma separated lists probed per query')
+    parser.add_argument('--queries', type=int, default=300, help='Query faces per roster size')
+    parser.add_argument('--batch', type=int, default=1, help='Faces per search call (faces in one frame)')
+    parser.add_argument('-k', type=int, default=5, help='Candidates per face')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+    args.nprobe = [int(n) for n in args.nprobe.split(',')]
+
+    report = {'settings': {k: v for k, v in vars(args).items() if k != 'json'}, 'sizes': []}
+    with tempfile.TemporaryDirectory(prefix='bench_identify_') as tmp_dir:
+        for students in (int(n) for n in args.students.split(',')):
+            size = run_size(students, args, tmp_dir)
+            report['sizes'].append(size)
+            print(f"\n{size['students']} students, {size['rows']} rows, {size['nlist']} lists "
+                  f"(build {size['build_s']} s, open {size['open_ms']} ms)")
+            print(f"{'search':>7} {'nprobe':>7} {'mean ms':>9} {'p95 ms':>9} {'recall@1':>9} {'recall@k':>9}")
+            for row in size['results']:
+                print(f"{row['search']:>7} {row['nprobe'] or '-':>7} {row['mean_ms']:>9} {row['p95_ms']:>9} "
+                      f"{row['recall_at_1']:>9} {row['recall_at_k']:>9}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f'Results written to {args.json}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Image Pipeline Micro-benchmarks
+- Drives FaceProcessor (detect_faces, detect, crop_face, draw_bounding_box),
+  the codecs and the full /api/process-image path
+- Fixed corpus: synthetic frames with 0, 1 and 3 faces at several resolutions
+- Reports ops/sec and latency per stage, plus allocations per call (tracemalloc)
+- JSON output, and --compare to diff against a previous run
+
+Usage:
+    python -m benchmarks.bench_pipeline --json results.json
+    python -m benchmarks.bench_pipeline --compare results.json
+"""
+
+import argparse
+import base64
+import json
+import logging
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+# Never touch Firebase, the real upload spool or the real enrollment log from
+# a benchmark - set unconditionally, an exported STORAGE_BACKEND must not win
+os.environ['STORAGE_BACKEND'] = 'memory'
+os.environ['UPLOAD_SPOOL_DIR'] = tempfile.mkdtemp(prefix='bench_spool_')
+os.environ['FACE_STORE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='bench_faces_'), 'face_embeddings.log')
+
+import cv2
+import numpy as np
+
+from benchmarks.corpus import RESOLUTIONS, make_frame
+import facial_recognition_backend as backend
+
+# Per-request INFO logs would dominate the timings of the cheap stages
+logging.getLogger('facial_recognition_backend').setLevel(logging.WARNING)
+
+# (case name, face height fractions)
+FRAME_CASES = (
+    ('noface', []),
+    ('1face', [0.3]),
+    ('3faces', [0.25, 0.3, 0.2]),
+)
+
+
+def build_cases(resolutions):
+    """Frames of every case at every resolution, with their JPEG encoding"""
+    cases = []
+    seed = 100
+    for res_name in resolutions:
+        for case_name, fractions in FRAME_CASES:
+            seed += 1
+            image, faces = make_frame(RESOLUTIONS[res_name], fractions, 1.0, seed)
+            _, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+            cases.append({
+                'name': f'{res_name}_{case_name}',
+                'resolution': res_name,
+                'faces': len(faces),
+                'image': image,
+                'boxes': faces,
+                'jpeg': encoded.tobytes(),
+            })
+    return cases
+
+
+def stage_functions(case, processor, client):
+    """Benchmarked stages of one case: name -> zero-argument callable"""
+    image = case['image']
+    jpeg = case['jpeg']
+    jpeg_array = np.frombuffer(jpeg, np.uint8)
+    jpeg_base64 = base64.b64encode(jpeg).decode()
+    box = max(case['boxes'], key=lambda f: f[2] * f[3]) if case['boxes'] else None
+    crop = processor.crop_face(image, box)[0] if box else None
+    request_json = {
+        'image': f'data:image/jpeg;base64,{jpeg_base64}',
+        'studentId': 'BENCH001',
+        'studentName': 'Benchmark',
+        'className': 'bench',
+        'position': 'front',
+    }
+
+    stages = {
+        'base64_decode': lambda: base64.b64decode(jpeg_base64),
+        'imdecode': lambda: cv2.imdecode(jpeg_array, cv2.IMREAD_COLOR),
+        'detect_faces': lambda: processor.detect_faces(image),
+        'detect_full_chain': lambda: processor.detect(image),
+        'draw_bounding_box': lambda: processor.draw_bounding_box(image, case['boxes']),
+        'process_image': lambda: client.post('/api/process-image', json=request_json),
+    }
+    if box is not None:
+        stages['crop_face'] = lambda: processor.crop_face(image, box)
+        stages['imencode'] = lambda: cv2.imencode('.jpg', crop, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    return stages
+
+
+def time_stage(fn, repeat, warmup=2):
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return np.array(timings) * 1000
+
+
+def measure_allocations(fn, calls=5):
+    """Allocated blocks and peak traced memory per call (after one untraced warm-up call)"""
+    fn()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        for _ in range(calls):
+            fn()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    stats = after.compare_to(before, 'lineno')
+    new_blocks = sum(max(0, stat.count_diff) for stat in stats)
+    return {
+        'retained_blocks_per_call': round(new_blocks / calls, 1),
+        'peak_kb': round((peak - base) / 1024, 1),
+    }
+
+
+def run(resolutions, repeat, allocations=True, stages=None):
+    processor = backend.get_face_processor()
+    client = backend.app.test_client()
+    results = []
+    for case in build_cases(resolutions):
+        for stage, fn in stage_functions(case, processor, client).items():
+            if stages and stage not in stages:
+                continue
+            timings = time_stage(fn, repeat)
+            row = {
+                'case': case['name'],
+                'resolution': case['resolution'],
+                'faces': case['faces'],
+                'stage': stage,
+                'ops_per_sec': round(1000 / float(timings.mean()), 1),
+                'mean_ms': round(float(timings.mean()), 3),
+                'p50_ms': round(float(np.percentile(timings, 50)), 3),
+                'p95_ms': round(float(np.percentile(timings, 95)), 3),
+            }
+            if allocations:
+                row.update(measure_allocations(fn))
+            results.append(row)
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'detection_max_dim': backend.DETECTION_MAX_DIM,
+    }
+
+
+def compare(report, baseline_path):
+    """Print the mean latency change of every stage against a previous run"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = {(row['case'], row['stage']): row for row in baseline['results']}
+    print(f"\nvs {baseline_path} (commit {baseline['environment'].get('commit')})")
+    print(f"{'case':<16} {'stage':<18} {'old ms':>9} {'new ms':>9} {'change':>8}")
+    for row in report['results']:
+        old = previous.get((row['case'], row['stage']))
+        if old is None:
+            continue
+        change = (row['mean_ms'] - old['mean_ms']) / old['mean_ms'] * 100 if old['mean_ms'] else 0.0
+        print(f"{row['case']:<16} {row['stage']:<18} {old['mean_ms']:>9} {row['mean_ms']:>9} {change:>+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-stage micro-benchmarks of the image pipeline')
+    parser.add_argument('--resolutions', default=','.join(RESOLUTIONS), help='Comma separated: ' + ', '.join(RESOLUTIONS))
+    parser.add_argument('--repeat', type=int, default=20, help='Timed calls per stage and case')
+    parser.add_argument('--stages', help='Only run these comma separated stages')
+    parser.add_argument('--no-allocations', action='store_true', help='Skip the tracemalloc pass')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    parser.add_argument('--compare', help='Previous JSON results to compare against')
+    args = parser.parse_args()
+
+    resolutions = args.resolutions.split(',')
+    stages = set(args.stages.split(',')) if args.stages else None
+    report = {
+        'environment': environment(),
+        'repeat': args.repeat,
+        'results': run(resolutions, args.repeat, not args.no_allocations, stages),
+    }
+
+    print(f"{'case':<16} {'stage':<18} {'ops/s':>9} {'mean ms':>9} {'p95 ms':>9} {'blocks':>7} {'peak KB':>9}")
+    for row in report['results']:
+        print(f"{row['case']:<16} {row['stage']:<18} {row['ops_per_sec']:>9} {row['mean_ms']:>9} {row['p95_ms']:>9} "
+              f"{row.get('retained_blocks_per_call', '-'):>7} {row.get('peak_kb', '-'):>9}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f'Results written to {args.json}')
+
+
+if __name__ == '__main__':
+    main()
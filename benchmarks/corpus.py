@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Benchmark Image Corpus
+- Bundled sample faces with known face boxes (benchmarks/data)
+- Deterministic synthetic camera frames at several resolutions and face counts
+- Ground truth boxes for recall measurement
+"""
+
+import os
+
+import cv2
+import numpy as np
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# Bundled sample images and the (x, y, w, h) face box in each
+SAMPLE_FACES = {
+    'astronaut.jpg': (177, 66, 94, 94),
+}
+
+# Frame sizes of the capture stations and uploads we see in practice
+RESOLUTIONS = {
+    '480p': (640, 480),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+}
+
+# Face height as a fraction of the frame height
+FACE_FRACTIONS = (0.15, 0.25, 0.4, 0.6)
+
+# Brightness multipliers (1.0 = as captured, lower = poorly lit room)
+BRIGHTNESS = (1.0, 0.45)
+
+
+def load_sample_faces():
+    """Load the bundled sample images as (name, image, face_box) tuples"""
+    samples = []
+    for name, box in SAMPLE_FACES.items():
+        image = cv2.imread(os.path.join(DATA_DIR, name), cv2.IMREAD_COLOR)
+        if image is None:
+            raise FileNotFoundError(f'Missing benchmark sample: {name}')
+        samples.append((name, image, box))
+    return samples
+
+
+def make_background(width, height, rng):
+    """Smooth, noisy background that does not contain faces"""
+    small = rng.integers(40, 200, size=(9, 16, 3), dtype=np.uint8)
+    background = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    noise = rng.normal(0, 6, size=background.shape)
+    return np.clip(background + noise, 0, 255).astype(np.uint8)
+
+
+def head_crop(image, box, context=0.8):
+    """Crop the face plus some head/shoulder context, returning the face box inside the crop"""
+    x, y, w, h = box
+    x1 = max(0, int(x - context * w))
+    y1 = max(0, int(y - context * h))
+    x2 = min(image.shape[1], int(x + w + context * w))
+    y2 = min(image.shape[0], int(y + h + 1.5 * context * h))
+    return image[y1:y2, x1:x2], (x - x1, y - y1, w, h)
+
+
+def paste_face(frame, sample, face_height, center):
+    """
+    Paste a scaled sample face into a frame.
+
+    Returns:
+        tuple: ground truth (x, y, w, h) of the pasted face, or None if it fell outside
+    """
+    crop, (fx, fy, fw, fh) = head_crop(sample[1], sample[2])
+    scale = face_height / fh
+    crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+    fx, fy, fw, fh = (int(round(v * scale)) for v in (fx, fy, fw, fh))
+
+    # Top-left of the crop so the face is centered on the requested point
+    ox = int(center[0] - fx - fw / 2)
+    oy = int(center[1] - fy - fh / 2)
+
+    frame_h, frame_w = frame.shape[:2]
+    x1, y1 = max(0, ox), max(0, oy)
+    x2, y2 = min(frame_w, ox + crop.shape[1]), min(frame_h, oy + crop.shape[0])
+    if x2 <= x1 or y2 <= y1:
+        return None
+    frame[y1:y2, x1:x2] = crop[y1 - oy:y2 - oy, x1 - ox:x2 - ox]
+
+    face = (ox + fx, oy + fy, fw, fh)
+    if face[0] < 0 or face[1] < 0 or face[0] + fw > frame_w or face[1] + fh > frame_h:
+        return None
+    return face
+
+
+def make_frame(resolution, face_fractions, brightness=1.0, seed=0):
+    """
+    Build one synthetic camera frame.
+
+    Args:
+        resolution: (width, height)
+        face_fractions: face height / frame height for each face (empty = no face)
+        brightness: multiplier applied to the whole frame
+        seed: RNG seed, frames are fully deterministic
+
+    Returns:
+        tuple: (BGR image, list of ground truth face boxes)
+    """
+    width, height = resolution
+    rng = np.random.default_rng(seed)
+    frame = make_background(width, height, rng)
+    samples = load_sample_faces()
+
+    faces = []
+    count = len(face_fractions)
+    for idx, fraction in enumerate(face_fractions):
+        sample = samples[(seed + idx) % len(samples)]
+        face_height = fraction * height
+        # Single faces near the center, multiple faces spread horizontally
+        cx = width * (idx + 1) / (count + 1) if count > 1 else width * rng.uniform(0.4, 0.6)
+        cy = height * rng.uniform(0.4, 0.55)
+        box = paste_face(frame, sample, face_height, (cx, cy))
+        if box is not None:
+            faces.append(box)
+
+    if brightness != 1.0:
+        frame = cv2.convertScaleAbs(frame, alpha=brightness)
+    return frame, faces
+
+
+def build_corpus(resolutions=RESOLUTIONS, face_fractions=FACE_FRACTIONS, brightness=BRIGHTNESS, multi_face=True, negatives=True):
+    """
+    Build the fixed benchmark corpus.
+
+    Returns:
+        list: dicts with name, image, faces (ground truth boxes)
+    """
+    corpus = []
+    seed = 0
+    for res_name, resolution in resolutions.items():
+        for fraction in face_fractions:
+            for level in brightness:
+                seed += 1
+                image, faces = make_frame(resolution, [fraction], level, seed)
+                corpus.append({'name': f'{res_name}_face{int(fraction * 100)}_b{level}', 'image': image, 'faces': faces})
+        if multi_face:
+            seed += 1
+            image, faces = make_frame(resolution, [0.25, 0.3, 0.2], 1.0, seed)
+            corpus.append({'name': f'{res_name}_3faces', 'image': image, 'faces': faces})
+        if negatives:
+            seed += 1
+            image, faces = make_frame(resolution, [], 1.0, seed)
+            corpus.append({'name': f'{res_name}_noface', 'image': image, 'faces': faces})
+    return corpus
+
+
+def iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union else 0.0
+
+
+def count_matches(detected, truth, threshold=0.4):
+    """Number of ground truth faces matched by a detection with IoU >= threshold"""
+    remaining = [tuple(int(v) for v in box) for box in detected]
+    matched = 0
+    for gt in truth:
+        best = max(remaining, key=lambda box: iou(box, gt), default=None)
+        if best is not None and iou(best, gt) >= threshold:
+            remaining.remove(best)
+            matched += 1
+    return matched
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+API Load Test
+- Simulated capture stations replaying frame streams against the Flask API
+- Live overlay frames (/api/detect-faces) at a fixed rate per station, plus
+  periodic captures (/api/process-image or /api/batch-process, then /api/upload-image)
+- Runs the app in-process on a threaded server, with an in-memory fake cloud
+  (configurable Storage/Firestore latency), or against --url
+- Reports latency percentiles, throughput and error rates per endpoint and
+  station count
+
+Usage:
+    python -m benchmarks.load_test --stations 1,2,4,8 --duration 20
+    python -m benchmarks.load_test --url http://localhost:8000 --stations 4
+"""
+
+import argparse
+import base64
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+
+# The in-process server must never touch Firebase, the real upload spool
+# or the real enrollment log - set unconditionally, whatever the shell exports
+os.environ['STORAGE_BACKEND'] = 'memory'
+os.environ['UPLOAD_SPOOL_DIR'] = tempfile.mkdtemp(prefix='loadtest_spool_')
+os.environ['FACE_STORE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='loadtest_faces_'), 'face_embeddings.log')
+
+import cv2
+import numpy as np
+import requests
+
+from benchmarks.corpus import RESOLUTIONS, make_frame
+from storage_backends import MemoryStorage
+
+# p95 /api/detect-faces latency a station count must stay under
+DEFAULT_P95_BUDGET_MS = 200
+
+CAPTURE_POSITIONS = ('front', 'left', 'right')
+
+
+class FakeCloudStorage(MemoryStorage):
+    """MemoryStorage with the round-trip latency of Cloud Storage and Firestore"""
+
+    name = 'fake-cloud'
+
+    def __init__(self, upload_latency=0.15, metadata_latency=0.05, failure_rate=0.0):
+        super().__init__()
+        self.upload_latency = upload_latency
+        self.metadata_latency = metadata_latency
+        self.failure_rate = failure_rate
+
+    def _round_trip(self, latency):
+        time.sleep(latency * random.uniform(0.7, 1.5))
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise ConnectionError('Simulated storage failure')
+
+    def upload_blob(self, path, data, content_type='image/jpeg'):
+        self._round_trip(self.upload_latency)
+        super().upload_blob(path, data, content_type)
+
+    def write_metadata(self, records):
+        self._round_trip(self.metadata_latency)
+        super().write_metadata(records)
+
+
+def build_frame_stream(resolution='480p', frames=30, quality=80, seed=7):
+    """
+    Base64 JPEG frames of a face drifting across the view, like a webcam
+    stream sent by the capture page.
+    """
+    image, _ = make_frame(RESOLUTIONS[resolution], [0.3], 1.0, seed)
+    stream = []
+    for idx in range(frames):
+        dx = int(20 * np.sin(idx / 5))
+        dy = int(8 * np.cos(idx / 7))
+        shifted = np.roll(image, (dy, dx), axis=(0, 1))
+        _, encoded = cv2.imencode('.jpg', shifted, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        stream.append('data:image/jpeg;base64,' + base64.b64encode(encoded).decode())
+    return stream
+
+
+class Recorder:
+    """Thread-safe per-endpoint latency and status collector"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}  # endpoint -> list of (latency ms, status)
+
+    def record(self, endpoint, latency_ms, status):
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append((latency_ms, status))
+
+    def summary(self, duration):
+        report = {}
+        with self._lock:
+            samples = {endpoint: list(values) for endpoint, values in self.samples.items()}
+        for endpoint, values in sorted(samples.items()):
+            latencies = np.array([latency for latency, _ in values])
+            statuses = [status for _, status in values]
+            # 429/503 are load shedding (busy detector, full upload queue), not failures
+            shed = sum(1 for status in statuses if status in (429, 503))
+            errors = sum(1 for status in statuses if status == 0 or status >= 400) - shed
+            report[endpoint] = {
+                'requests': len(values),
+                'throughput_rps': round(len(values) / duration, 2),
+                'p50_ms': round(float(np.percentile(latencies, 50)), 1),
+                'p95_ms': round(float(np.percentile(latencies, 95)), 1),
+                'p99_ms': round(float(np.percentile(latencies, 99)), 1),
+                'max_ms': round(float(latencies.max()), 1),
+                'error_rate': round(errors / len(values), 4),
+                'shed_rate': round(shed / len(values), 4),
+            }
+        return report
+
+
+class Station:
+    """
+    One capture station: a browser streaming overlay frames, capturing a
+    student every `capture_every` seconds and uploading the crops.
+    """
+
+    def __init__(self, idx, base_url, frames, recorder, fps, capture_every, batch, stop):
+        self.idx = idx
+        self.base_url = base_url
+        self.frames = frames
+        self.recorder = recorder
+        self.interval = 1.0 / fps
+        self.capture_every = capture_every
+        self.batch = batch
+        self.stop = stop
+        self.session = requests.Session()
+        self.session_id = f'loadtest-{idx}'
+
+    def post(self, endpoint, payload):
+        start = time.perf_counter()
+        try:
+            response = self.session.post(f'{self.base_url}{endpoint}', json=payload, timeout=30)
+            status = response.status_code
+            body = response.json() if status < 500 else {}
+        except (requests.RequestException, ValueError):
+            status, body = 0, {}
+        name = endpoint
+        if endpoint == '/api/detect-faces' and body.get('status') == 'superseded':
+            name = '/api/detect-faces (superseded)'
+        self.recorder.record(name, (time.perf_counter() - start) * 1000, status)
+        return status, body
+
+    def capture(self, frame_idx):
+        student = {'studentId': f'LT{self.idx:04d}', 'studentName': f'Load Test {self.idx}', 'className': 'load'}
+        images = [self.frames[(frame_idx + k) % len(self.frames)] for k in range(len(CAPTURE_POSITIONS))]
+        if self.batch:
+            self.post('/api/batch-process', dict(student, images=[
+                {'image': image, 'position': position} for image, position in zip(images, CAPTURE_POSITIONS)
+            ]))
+        else:
+            for image, position in zip(images, CAPTURE_POSITIONS):
+                self.post('/api/process-image', dict(student, image=image, position=position))
+        for image, position in zip(images, CAPTURE_POSITIONS):
+            self.post('/api/upload-image', dict(student, image=image, position=position))
+
+    def run(self):
+        # Stagger the stations so their frames do not arrive in lockstep
+        time.sleep(random.uniform(0, self.interval))
+        frame_idx = 0
+        next_frame = time.monotonic()
+        next_capture = next_frame + random.uniform(0.5, 1.0) * self.capture_every
+        while not self.stop.is_set():
+            frame = self.frames[frame_idx % len(self.frames)]
+            self.post('/api/detect-faces', {'image': frame, 'sessionId': self.session_id})
+            frame_idx += 1
+            if self.capture_every and time.monotonic() >= next_capture:
+                self.capture(frame_idx)
+                next_capture = time.monotonic() + self.capture_every
+            # Fixed frame rate; a slow response delays the next frame like the browser loop does
+            next_frame = max(next_frame + self.interval, time.monotonic())
+            self.stop.wait(max(0.0, next_frame - time.monotonic()))
+
+
+def start_local_server(storage):
+    """Serve the app in this process on a free port, uploads going to storage"""
+    from werkzeug.serving import make_server
+    import facial_recognition_backend as backend
+
+    logging.getLogger('facial_recognition_backend').setLevel(logging.WARNING)
+    logging.getLogger('upload_queue').setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    backend.storage_backend = storage
+    backend.upload_queue.storage = storage
+    backend.warm_up.start(background=False)
+
+    server = make_server('127.0.0.1', 0, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='load-test-server', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def run_level(base_url, stations, duration, frames, fps, capture_every, batch):
+    recorder = Recorder()
+    stop = threading.Event()
+    threads = []
+    for idx in range(stations):
+        station = Station(idx, base_url, frames, recorder, fps, capture_every, batch, stop)
+        thread = threading.Thread(target=station.run, name=f'station-{idx}', daemon=True)
+        thread.start()
+        threads.append(thread)
+    start = time.perf_counter()
+    stop.wait(duration)
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=30)
+    return recorder.summary(time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the face API with simulated capture stations')
+    parser.add_argument('--url', help='Target server (default: in-process server with a fake cloud)')
+    parser.add_argument('--stations', default='1,2,4', help='Comma separated station counts to run')
+    parser.add_argument('--duration', type=float, default=15, help='Seconds per station count')
+    parser.add_argument('--fps', type=float, default=5, help='Overlay frames per second per station')
+    parser.add_argument('--capture-every', type=float, default=10, help='Seconds between captures (0 = overlay only)')
+    parser.add_argument('--batch', action='store_true', help='Send captures to /api/batch-process')
+    parser.add_argument('--resolution', default='480p', choices=list(RESOLUTIONS), help='Camera frame size')
+    parser.add_argument('--upload-latency', type=float, default=0.15, help='Fake Storage upload seconds')
+    parser.add_argument('--metadata-latency', type=float, default=0.05, help='Fake Firestore batch write seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of fake cloud calls that fail')
+    parser.add_argument('--p95-budget', type=float, default=DEFAULT_P95_BUDGET_MS, help='detect-faces p95 budget (ms)')
+    parser.add_argument('--max-shed', type=float, default=0.05, help='Max fraction of detect-faces frames shed with 429')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        storage = FakeCloudStorage(args.upload_latency, args.metadata_latency, args.failure_rate)
+        server, base_url = start_local_server(storage)
+
+    frames = build_frame_stream(args.resolution)
+    levels = []
+    try:
+        for stations in (int(n) for n in args.stations.split(',')):
+            endpoints = run_level(base_url, stations, args.duration, frames, args.fps, args.capture_every, args.batch)
+            # Shed frames answer fast - a level that sheds too much is over capacity
+            detect = endpoints.get('/api/detect-faces', {})
+            levels.append({
+                'stations': stations,
+                'within_budget': bool(detect) and detect['p95_ms'] <= args.p95_budget and detect['shed_rate'] <= args.max_shed,
+                'endpoints': endpoints,
+            })
+
+            print(f'\n{stations} station(s), {args.duration:.0f}s')
+            print(f"{'endpoint':<34} {'reqs':>6} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'err%':>6} {'shed%':>6}")
+            for endpoint, row in endpoints.items():
+                print(f"{endpoint:<34} {row['requests']:>6} {row['throughput_rps']:>7} {row['p50_ms']:>8} "
+                      f"{row['p95_ms']:>8} {row['p99_ms']:>8} {row['error_rate'] * 100:>6.1f} {row['shed_rate'] * 100:>6.1f}")
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    supported = [level['stations'] for level in levels if level['within_budget']]
+    print(f"\nMax stations with detect-faces p95 <= {args.p95_budget:.0f} ms and <= {args.max_shed:.0%} shed: "
+          f"{max(supported) if supported else 'none'}")
+
+    if args.json:
+        report = {
+            'target': args.url or 'in-process',
+            'settings': {k: v for k, v in vars(args).items() if k != 'json'},
+            'levels': levels,
+        }
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f'Results written to {args.json}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Capture Pipeline (make_dataset.py)
+- Reader thread: pulls camera frames as fast as the camera delivers them and
+  keeps only the newest one (no backlog, no dropped driver buffers)
+- Detection thread: runs the face detector on the newest frame it has not
+  seen yet and publishes the result together with that frame
+- The UI thread only draws the latest frame and the latest result, so the
+  preview frame rate does not depend on detection cost
+- Optional frame skipping: full detection every N frames, template-match
+  tracking of the face in between
+"""
+
+import threading
+import time
+from collections import deque
+
+import cv2
+
+
+class RateMeter:
+    """Events per second over a sliding window"""
+
+    def __init__(self, window=30):
+        self._times = deque(maxlen=window)
+
+    def tick(self):
+        self._times.append(time.monotonic())
+
+    @property
+    def rate(self):
+        if len(self._times) < 2:
+            return 0.0
+        span = self._times[-1] - self._times[0]
+        return (len(self._times) - 1) / span if span > 0 else 0.0
+
+
+class LatestValue:
+    """Single-slot mailbox: writers overwrite, readers wait for a newer sequence number"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._value = None
+        self._seq = 0
+        self.closed = False
+
+    def put(self, value):
+        with self._cond:
+            self._value = value
+            self._seq += 1
+            self._cond.notify_all()
+
+    def get(self):
+        """Newest value and its sequence number (value is None before the first put)"""
+        with self._cond:
+            return self._value, self._seq
+
+    def wait_newer(self, seq, timeout=None):
+        """Block until a value newer than seq arrives (or close()); returns (value, seq)"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > seq or self.closed, timeout)
+            return self._value, self._seq
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class FrameReader:
+    """
+    Reads the camera on its own thread and keeps only the newest frame.
+
+    Args:
+        camera: cv2.VideoCapture (or anything with read() / release())
+        mirror: flip frames horizontally for the preview mirror effect
+    """
+
+    def __init__(self, camera, mirror=True):
+        self.camera = camera
+        self.mirror = mirror
+        self.frames = LatestValue()
+        self.fps = RateMeter()
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='camera-reader', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                success, frame = self.camera.read()
+                if not success:
+                    self.error = 'Failed to capture frame.'
+                    break
+                if self.mirror:
+                    frame = cv2.flip(frame, 1)
+                self.frames.put(frame)
+                self.fps.tick()
+        finally:
+            self.frames.close()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=2)
+
+
+class DetectionResult:
+    """Faces found in one frame; `frame` is the exact frame the boxes refer to"""
+
+    def __init__(self, frame, frame_seq, faces, best_face, quality, latency_ms):
+        self.frame = frame
+        self.frame_seq = frame_seq
+        self.faces = faces
+        self.best_face = best_face
+        self.quality = quality
+        self.latency_ms = latency_ms
+
+
+class DetectionWorker:
+    """
+    Runs detect(frame) -> (faces, best_face, quality) on the newest frame of a
+    FrameReader. Frames that arrive while a detection is running are skipped.
+    """
+
+    def __init__(self, reader, detect):
+        self.reader = reader
+        self.detect = detect
+        self.results = LatestValue()
+        self.fps = RateMeter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='face-detector', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        seq = 0
+        while not self._stop.is_set():
+            frame, newest = self.reader.frames.wait_newer(seq, timeout=0.5)
+            if self.reader.frames.closed:
+                break
+            if frame is None or newest == seq:
+                continue  # timed out: the camera stalled, do not re-detect the same frame
+            seq = newest
+            start = time.perf_counter()
+            faces, best_face, quality = self.detect(frame)
+            latency_ms = (time.perf_counter() - start) * 1000
+            self.results.put(DetectionResult(frame, seq, faces, best_face, quality, latency_ms))
+            self.fps.tick()
+        self.results.close()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=2)
+
+
+class TemplateTracker:
+    """
+    Follows one face box between detections by normalized cross-correlation
+    of the last detected face against a window around its previous position.
+    Matching runs on a downscaled copy (face ~`template_width` px wide).
+    """
+
+    def __init__(self, template_width=48, search_margin=0.5):
+        self.template_width = template_width
+        self.search_margin = search_margin
+        self.box = None
+        self._template = None
+        self._scale = 1.0
+
+    def reset(self, gray, box):
+        """Start following `box`; the template stays fixed until the next reset (no drift)"""
+        x, y, w, h = (int(v) for v in box)
+        self._scale = min(1.0, self.template_width / max(w, 1))
+        face = gray[y:y + h, x:x + w]
+        self._template = cv2.resize(face, None, fx=self._scale, fy=self._scale, interpolation=cv2.INTER_AREA)
+        self.box = (x, y, w, h)
+
+    def clear(self):
+        self.box = None
+        self._template = None
+
+    def track(self, gray):
+        """
+        Returns:
+            tuple: (new box, match confidence in [-1, 1]); (None, 0.0) if the
+                search window left the frame
+        """
+        x, y, w, h = self.box
+        margin_x, margin_y = int(w * self.search_margin), int(h * self.search_margin)
+        x0, y0 = max(0, x - margin_x), max(0, y - margin_y)
+        x1, y1 = min(gray.shape[1], x + w + margin_x), min(gray.shape[0], y + h + margin_y)
+        window = cv2.resize(gray[y0:y1, x0:x1], None, fx=self._scale, fy=self._scale, interpolation=cv2.INTER_AREA)
+        if window.shape[0] < self._template.shape[0] or window.shape[1] < self._template.shape[1]:
+            return None, 0.0
+        scores = cv2.matchTemplate(window, self._template, cv2.TM_CCOEFF_NORMED)
+        _, confidence, _, (best_x, best_y) = cv2.minMaxLoc(scores)
+        box = (x0 + int(round(best_x / self._scale)), y0 + int(round(best_y / self._scale)), w, h)
+        return box, float(confidence)
+
+
+class TrackingDetector:
+    """
+    Detection stage that runs the full detector only every `detect_every`
+    frames and follows the best face with a TemplateTracker in between. The
+    detector runs again as soon as the match confidence drops below
+    `min_confidence` or the face is lost.
+
+    Args:
+        detect: gray frame -> (faces, best face, quality)
+        select: (faces, frame shape) -> (best face, quality), applied to tracked boxes
+    """
+
+    def __init__(self, detect, select, detect_every=5, min_confidence=0.6, tracker=None):
+        self.detect = detect
+        self.select = select
+        self.detect_every = max(1, detect_every)
+        self.min_confidence = min_confidence
+        self.tracker = tracker or TemplateTracker()
+        self.mode = 'detect'
+        self.confidence = None
+        self._since_detection = 0
+
+    def __call__(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        self._since_detection += 1
+        if self.tracker.box is not None and self._since_detection < self.detect_every:
+            box, self.confidence = self.tracker.track(gray)
+            if box is not None and self.confidence >= self.min_confidence:
+                best_face, quality = self.select([box], gray.shape)
+                if best_face is not None:
+                    self.tracker.box = box
+                    self.mode = 'track'
+                    return [box], best_face, quality
+
+        faces, best_face, quality = self.detect(gray)
+        self._since_detection = 0
+        self.mode = 'detect'
+        self.confidence = None
+        if best_face is not None:
+            self.tracker.reset(gray, best_face)
+        else:
+            self.tracker.clear()
+        return faces, best_face, quality
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Capture Uploader (make_dataset.py)
+- Every saved crop is journaled to a spool directory (image + record, fsync'd)
+  before it is queued, so uploads survive crashes and restarts
+- Worker threads post spooled crops to the web upload API through one
+  keep-alive requests.Session; the capture loop never waits on the network
+- While the API is unreachable the workers back off together instead of
+  timing out on every image; entries stay spooled until they are accepted
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class UploadRejected(Exception):
+    """The upload API answered but refused the image (retrying will not help)"""
+
+
+def post_face_image(session, api_url, jpeg_bytes, record, timeout=30):
+    """
+    Post one face crop to the web upload API.
+
+    Returns:
+        str: storage URL of the uploaded image (may be None)
+
+    Raises:
+        UploadRejected: on a 4xx answer or an API-level error
+        requests.RequestException: connection problems, timeouts and 5xx answers
+    """
+    files = {'image': ('face.jpg', jpeg_bytes, 'image/jpeg')}
+    data = {
+        'studentId': str(record['studentId']),
+        'studentName': str(record['studentName']),
+        'className': str(record['className']),
+        'position': str(record['position'])
+    }
+    response = session.post(api_url, files=files, data=data, timeout=timeout)
+    if 400 <= response.status_code < 500:
+        raise UploadRejected(f'HTTP {response.status_code}: {response.text[:200].strip()}')
+    response.raise_for_status()
+    result = response.json()
+    if not result.get('success'):
+        raise UploadRejected(result.get('error', 'Unknown error'))
+    return result.get('data', {}).get('storageUrl')
+
+
+class UploadSpool:
+    """
+    Journal of crops waiting for upload: <id>.jpg plus <id>.json, the record
+    written last so a crash mid-write never leaves a half entry behind.
+    """
+
+    def __init__(self, spool_dir):
+        self.spool_dir = spool_dir
+
+    def _path(self, entry_id, ext):
+        return os.path.join(self.spool_dir, f'{entry_id}.{ext}')
+
+    def _write_durably(self, path, data):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def add(self, jpeg_bytes, record):
+        """Journal one crop; returns the record with its spool id"""
+        os.makedirs(self.spool_dir, exist_ok=True)
+        # Time-ordered ids so recovery uploads in capture order
+        record = dict(record, id=f'{time.time_ns():020d}_{uuid.uuid4().hex[:8]}', state='pending')
+        self._write_durably(self._path(record['id'], 'jpg'), jpeg_bytes)
+        self._write_durably(self._path(record['id'], 'json'), json.dumps(record).encode())
+        return record
+
+    def read_image(self, record):
+        with open(self._path(record['id'], 'jpg'), 'rb') as f:
+            return f.read()
+
+    def remove(self, record):
+        for ext in ('json', 'jpg'):
+            try:
+                os.remove(self._path(record['id'], ext))
+            except FileNotFoundError:
+                pass
+
+    def mark_failed(self, record, error):
+        """Keep a rejected crop on disk, out of the upload queue"""
+        record.update(state='failed', error=str(error))
+        self._write_durably(self._path(record['id'], 'json'), json.dumps(record).encode())
+
+    def entries(self, state='pending'):
+        """Spooled records in capture order (unreadable records are skipped)"""
+        if not os.path.isdir(self.spool_dir):
+            return []
+        records = []
+        for name in sorted(os.listdir(self.spool_dir)):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.spool_dir, name), 'r', encoding='utf-8') as f:
+                    record = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Skipping spooled upload {name}: {e}")
+                continue
+            if record.get('state') == state:
+                records.append(record)
+        return records
+
+
+class BackgroundUploader:
+    """
+    Upload spooled face crops on worker threads.
+
+    submit() journals the crop and returns; workers post it with a shared
+    keep-alive session and delete the entry once the API accepted it.
+    Entries spooled by an earlier run are queued again by start().
+
+    Args:
+        api_url: web upload endpoint (UPLOAD_API_URL)
+        spool_dir: journal directory (CAPTURE_SPOOL_DIR)
+        workers: concurrent uploads (also the connection pool size)
+        max_backoff: longest wait between attempts while the API is unreachable
+    """
+
+    def __init__(self, api_url, spool_dir, workers=2, timeout=30, max_backoff=60.0):
+        self.api_url = api_url
+        self.spool = UploadSpool(spool_dir)
+        self.workers = workers
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._offline_until = 0.0
+        self._failures = 0
+        self.uploaded = 0
+        self.failed = 0
+        self.last_error = None
+
+    def start(self):
+        """Queue the entries left over from earlier runs and start the workers"""
+        recovered = self.spool.entries()
+        for record in recovered:
+            self._queue.put(record)
+        if recovered:
+            print(f"📤 Resuming {len(recovered)} spooled upload(s) from {os.path.abspath(self.spool.spool_dir)}")
+        for idx in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'capture-upload-{idx}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def submit(self, jpeg_bytes, student_id, student_name, class_name, position, local_path=None):
+        """Journal a crop for upload; returns its spool record (never touches the network)"""
+        record = self.spool.add(jpeg_bytes, {
+            'studentId': str(student_id),
+            'studentName': student_name,
+            'className': class_name,
+            'position': position,
+            'localPath': local_path,
+            'created_at': time.strftime("%Y-%m-%dT%H:%M:%S")
+        })
+        self._queue.put(record)
+        return record
+
+    @property
+    def pending(self):
+        return self._queue.unfinished_tasks
+
+    @property
+    def offline(self):
+        return time.monotonic() < self._offline_until
+
+    def _wait_online(self):
+        """Sleep while the API is known to be unreachable; False once stopping"""
+        while not self._stop.is_set():
+            delay = self._offline_until - time.monotonic()
+            if delay <= 0:
+                return True
+            self._stop.wait(min(delay, 1.0))
+        return False
+
+    def _went_offline(self, error):
+        with self._lock:
+            self._failures += 1
+            delay = min(self.max_backoff, 2 ** (self._failures - 1))
+            self._offline_until = max(self._offline_until, time.monotonic() + delay)
+            self.last_error = str(error)
+        return delay
+
+    def _upload(self, record):
+        """True once the entry is settled (uploaded or rejected), False to retry"""
+        try:
+            url = post_face_image(self.session, self.api_url, self.spool.read_image(record), record, self.timeout)
+        except FileNotFoundError:
+            return True  # removed by hand or by a sync in the meantime
+        except UploadRejected as e:
+            self.spool.mark_failed(record, e)
+            with self._lock:
+                self.failed += 1
+                self.last_error = str(e)
+            print(f"  ❌ Upload rejected for {record['studentName']} position {record['position']}: {e} "
+                  f"(kept in {os.path.abspath(self.spool.spool_dir)})")
+            return True
+        except (requests.RequestException, ValueError) as e:
+            delay = self._went_offline(e)
+            if self._failures == 1:
+                print(f"  ⚠️ Could not reach upload API at {self.api_url} ({e.__class__.__name__}); "
+                      f"images stay spooled, retrying in the background")
+            elif delay >= self.max_backoff and self._failures % 10 == 0:
+                print(f"  ⚠️ Upload API still unreachable, {self.pending} image(s) spooled")
+            return False
+        self.spool.remove(record)
+        with self._lock:
+            if self._failures:
+                print("  ✅ Upload API reachable again")
+            self._failures = 0
+            self._offline_until = 0.0
+            self.uploaded += 1
+        print(f"  ✅ Firebase upload successful: {url or 'N/A'}")
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                record = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                while self._wait_online() and not self._upload(record):
+                    pass
+            finally:
+                self._queue.task_done()
+
+    def close(self, timeout=10.0):
+        """
+        Give pending uploads up to `timeout` seconds, then stop the workers.
+        Whatever is left stays spooled for the next run.
+
+        Returns:
+            int: uploads still pending
+        """
+        deadline = time.monotonic() + timeout
+        while self.pending and time.monotonic() < deadline and not self.offline:
+            time.sleep(0.1)
+        self._stop.set()
+        # An upload still in flight is repeated next run (its entry is still spooled)
+        for thread in self._threads:
+            thread.join(timeout=1)
+        self.session.close()
+        return len(self.spool.entries())
@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+"""
+Embedding Index
+- Every enrolled face embedding in contiguous float32 matrices
+- Exact nearest-neighbour identification with a single matrix multiply per batch
+- Best score per student without Python loops over the roster
+- Rows keyed by (student id, image position): re-enrolling a position or
+  removing a student tombstones rows instead of rebuilding the matrix
+- On-disk index file: fixed-stride float32 matrix + ID tables, opened with
+  np.memmap so gunicorn workers share the pages and start in constant time
+- Optional IVF lists in the index file (ann_index) for approximate search
+"""
+
+import os
+import struct
+import threading
+import uuid
+
+import numpy as np
+
+from ann_index import build_ivf, probe_rows
+from metrics import time_stage
+
+INDEX_MAGIC = b'FACEIDX1'
+INDEX_VERSION = 2
+# magic, version, dim, engine, rows, students, position/id/name widths, generation
+INDEX_HEADER = struct.Struct('<8sHH16sQQHHHQ')
+# Added in version 2: IVF list count (0 = exact search only)
+INDEX_HEADER_V2 = struct.Struct('<I')
+PAGE_SIZE = 4096
+
+
+def _align(offset, alignment=64):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def _layout(dim, rows, students, position_width, id_width, name_width, nlist=0):
+    """Byte offsets of the sections of an index file"""
+    layout = {'matrix': PAGE_SIZE}
+    offset = PAGE_SIZE + rows * dim * 4
+    ivf_sizes = (('centroids', nlist * dim * 4), ('list_offsets', (nlist + 1) * 8 if nlist else 0),
+                 ('list_rows', rows * 4 if nlist else 0), ('row_owners', rows * 4 if nlist else 0))
+    for section, size in (('starts', students * 8), ('positions', rows * position_width),
+                          ('student_ids', students * id_width), ('names', students * name_width)) + ivf_sizes:
+        offset = _align(offset)
+        layout[section] = offset
+        offset += size
+    layout['end'] = offset
+    return layout
+
+
+class IndexFile:
+    """
+    Read-only view of an index file written by write_index_file().
+
+    Rows are grouped by student (students sorted by id), so the best row per
+    student is one np.maximum.reduceat over `starts`. Every array is a
+    np.memmap: opening costs the same for 10 or 100k students, and all
+    processes mapping the file share one copy in the page cache. Version 2
+    files may carry IVF lists (`nlist` > 0); version 1 files are still read.
+
+    Raises:
+        ValueError: not an index file, or written by another format version
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            raw = f.read(INDEX_HEADER.size)
+        if len(raw) < INDEX_HEADER.size:
+            raise ValueError(f'{path} is not a face index file')
+        (magic, version, self.dim, engine, self.rows, self.students,
+         position_width, id_width, name_width, self.generation) = INDEX_HEADER.unpack(raw)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f'{path} is not a face index file')
+        if not 1 <= version <= INDEX_VERSION:
+            raise ValueError(f'{path} is index format v{version}, this version reads up to v{INDEX_VERSION}')
+        self.engine = engine.rstrip(b'\0').decode() or None
+        self.nlist = 0
+        if version >= 2:
+            with open(path, 'rb') as f:
+                f.seek(INDEX_HEADER.size)
+                self.nlist, = INDEX_HEADER_V2.unpack(f.read(INDEX_HEADER_V2.size))
+
+        layout = _layout(self.dim, self.rows, self.students, position_width, id_width, name_width, self.nlist)
+        self.matrix = self._map(layout['matrix'], np.float32, (self.rows, self.dim))
+        self.starts = self._map(layout['starts'], np.int64, (self.students,))
+        self.positions = self._map(layout['positions'], f'S{position_width or 1}', (self.rows,), position_width)
+        self.student_ids = self._map(layout['student_ids'], f'S{id_width or 1}', (self.students,), id_width)
+        self.names = self._map(layout['names'], f'S{name_width or 1}', (self.students,), name_width)
+        if self.nlist:
+            self.centroids = self._map(layout['centroids'], np.float32, (self.nlist, self.dim))
+            self.list_offsets = self._map(layout['list_offsets'], np.int64, (self.nlist + 1,))
+            self.list_rows = self._map(layout['list_rows'], np.int32, (self.rows,))
+            self.row_owners = self._map(layout['row_owners'], np.int32, (self.rows,))
+
+    def _map(self, offset, dtype, shape, width=None):
+        if not np.prod(shape) or width == 0:
+            return np.zeros(shape, dtype=dtype)  # Nothing stored (empty section)
+        return np.memmap(self.path, dtype=dtype, mode='r', offset=offset, shape=shape)
+
+    def student_number(self, student_id):
+        """Position of a student in the sorted id table, or None"""
+        key = student_id.encode()
+        number = int(np.searchsorted(self.student_ids, key))
+        if number < self.students and self.student_ids[number] == key:
+            return number
+        return None
+
+    def rows_of(self, number):
+        end = self.starts[number + 1] if number + 1 < self.students else self.rows
+        return range(int(self.starts[number]), int(end))
+
+
+def write_index_file(path, students, dim, engine, nlist=0):
+    """
+    Write an index file and atomically swap it in place of `path`.
+
+    Args:
+        students: {student id: (name, [(position, embedding), ...])}
+        nlist: IVF lists to train for approximate search (0 = none)
+    """
+    student_ids = sorted((sid for sid, (_, images) in students.items() if images), key=str.encode)
+    encoded_ids = [sid.encode() for sid in student_ids]
+    encoded_names = [(students[sid][0] or '').encode() for sid in student_ids]
+    positions = [(position or '').encode() for sid in student_ids for position, _ in students[sid][1]]
+    rows = len(positions)
+    widths = (max(map(len, positions), default=0), max(map(len, encoded_ids), default=0),
+              max(map(len, encoded_names), default=0))
+    nlist = min(nlist, rows)
+    layout = _layout(dim, rows, len(student_ids), *widths, nlist)
+
+    starts = np.zeros(len(student_ids), dtype=np.int64)
+    matrix = np.zeros((rows, dim), dtype=np.float32)
+    row_owners = np.zeros(rows, dtype=np.int32)
+    row = 0
+    for number, sid in enumerate(student_ids):
+        starts[number] = row
+        for _, embedding in students[sid][1]:
+            matrix[row] = embedding
+            row_owners[row] = number
+            row += 1
+
+    sections = [('matrix', matrix, 4), ('starts', starts, 8), ('positions', positions, widths[0]),
+                ('student_ids', encoded_ids, widths[1]), ('names', encoded_names, widths[2])]
+    if nlist:
+        centroids, list_offsets, list_rows = build_ivf(matrix, nlist)
+        sections += [('centroids', centroids, 4), ('list_offsets', list_offsets, 8),
+                     ('list_rows', list_rows, 4), ('row_owners', row_owners, 4)]
+
+    header = INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, dim, (engine or '').encode()[:16], rows,
+                               len(student_ids), *widths, uuid.uuid4().int & (2 ** 64 - 1))
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header + INDEX_HEADER_V2.pack(nlist))
+        for section, data, width in sections:
+            if len(data) and width:
+                f.seek(layout[section])
+                f.write(np.asarray(data, dtype=f'S{width}' if isinstance(data, list) else None).tobytes())
+        f.truncate(layout['end'])
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class EmbeddingIndex:
+    """
+    Enrolled embeddings, one row per face image.
+
+    An optional memory-mapped IndexFile holds the bulk of the rows; rows
+    enrolled since it was written are appended to an in-memory matrix (spare
+    capacity, doubling when full), so a search works on a consistent snapshot
+    without blocking writers. Removed or replaced rows are only marked dead;
+    they are left out of the search and dropped when the index file is
+    rewritten.
+
+    Args:
+        dim: embedding length
+        engine: name of the embedder that produced the vectors
+        base: IndexFile with the rows enrolled so far
+        nprobe: search the file rows through this many IVF lists instead of
+            exhaustively (when the file has lists; 0 = exact)
+    """
+
+    def __init__(self, dim, engine=None, capacity=1024, base=None, nprobe=0):
+        self.dim = dim
+        self.engine = engine
+        self.nprobe = nprobe if base is not None and base.nlist else 0
+        self._lock = threading.Lock()
+        self._base = base
+        self._base_students = base.students if base is not None else 0
+        self._base_alive = None  # bool per base row, allocated on the first removal
+        self._base_rows = {}  # (student id, position) -> base row, for the students touched so far
+        self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self._owners = np.zeros(capacity, dtype=np.int32)  # row -> student number
+        self._positions = [None] * capacity  # row -> image position
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._count = 0
+        self._dead = 0
+        self._rows = {}  # (student id, position) -> row
+        self._new_ids = []  # student number - base students -> student id
+        self._student_numbers = {}  # student id -> student number, for the students touched so far
+        self._names = {}  # student id -> name, overriding the index file
+        self._live_rows = {}  # student number -> live row count, for the students touched so far
+        self._students = self._base_students
+        self._grouping = None  # Cached (row order, group starts, group student numbers, dead base rows)
+
+    def __len__(self):
+        base_rows = self._base.rows if self._base is not None else 0
+        return base_rows + self._count - self._dead
+
+    @property
+    def students(self):
+        """Students with at least one live row"""
+        return self._students
+
+    @property
+    def dead(self):
+        """Tombstoned rows still taking space"""
+        return self._dead
+
+    def student_id(self, number):
+        if number < self._base_students:
+            return self._base.student_ids[number].decode()
+        return self._new_ids[number - self._base_students]
+
+    def name(self, student_id):
+        """Enrolled name of a student, or None"""
+        if student_id in self._names:
+            return self._names[student_id]
+        number = self._base.student_number(student_id) if self._base is not None else None
+        return (self._base.names[number].decode() or None) if number is not None else None
+
+    def _number(self, student_id, create=False):
+        """Student number of an id (lock held); base students are looked up on first touch"""
+        number = self._student_numbers.get(student_id)
+        if number is not None:
+            return number
+        if self._base is not None:
+            number = self._base.student_number(student_id)
+            if number is not None:
+                rows = self._base.rows_of(number)
+                for row in rows:
+                    self._base_rows[(student_id, self._base.positions[row].decode() or None)] = row
+                self._live_rows[number] = len(rows)
+        if number is None and create:
+            number = self._base_students + len(self._new_ids)
+            self._new_ids.append(student_id)
+            self._live_rows[number] = 0
+        if number is not None:
+            self._student_numbers[student_id] = number
+        return number
+
+    def _grow(self, needed):
+        capacity = len(self._matrix)
+        while capacity < needed:
+            capacity *= 2
+        if capacity == len(self._matrix):
+            return
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        matrix[:self._count] = self._matrix[:self._count]
+        owners = np.zeros(capacity, dtype=np.int32)
+        owners[:self._count] = self._owners[:self._count]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self._count] = self._alive[:self._count]
+        self._positions.extend([None] * (capacity - len(self._positions)))
+        # Swap in whole arrays - running searches keep their old snapshot
+        self._matrix, self._owners, self._alive = matrix, owners, alive
+
+    def _kill(self, key, number):
+        """Tombstone the live row of a key (lock held)"""
+        row = self._rows.pop(key, None)
+        if row is not None:
+            self._alive[row] = False
+        else:
+            row = self._base_rows.pop(key, None)
+            if row is None:
+                return 0
+            if self._base_alive is None:
+                self._base_alive = np.ones(self._base.rows, dtype=bool)
+            self._base_alive[row] = False
+        self._dead += 1
+        self._live_rows[number] -= 1
+        if not self._live_rows[number]:
+            self._students -= 1
+        return 1
+
+    def add(self, student_id, embeddings, positions=None, name=None):
+        """
+        Enroll one or more embeddings of a student.
+
+        Args:
+            embeddings: (dim,) vector or (n, dim) matrix, L2-normalized
+            positions: image position of every row (e.g. 'front'); a position
+                the student already has replaces the old row
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        positions = list(positions) if positions is not None else [None] * len(embeddings)
+        student_id = str(student_id)
+        with self._lock:
+            number = self._number(student_id, create=True)
+            if name:
+                self._names[student_id] = name
+            start = self._count
+            self._grow(start + len(embeddings))
+            self._matrix[start:start + len(embeddings)] = embeddings
+            self._owners[start:start + len(embeddings)] = number
+            self._positions[start:start + len(embeddings)] = positions
+            self._alive[start:start + len(embeddings)] = True
+            if not self._live_rows[number]:
+                self._students += 1
+            self._live_rows[number] += len(embeddings)
+            self._count = start + len(embeddings)
+            for row, position in enumerate(positions, start):
+                if position is None:
+                    continue
+                self._kill((student_id, position), number)
+                self._rows[(student_id, position)] = row
+            self._grouping = None
+
+    def remove(self, student_id, position=None):
+        """
+        Tombstone one image position of a student, or all of its rows.
+
+        Returns:
+            int: rows removed
+        """
+        student_id = str(student_id)
+        with self._lock:
+            number = self._number(student_id)
+            if number is None:
+                return 0
+            if position is not None:
+                removed = self._kill((student_id, position), number)
+            else:
+                keys = [key for key in list(self._rows) + list(self._base_rows) if key[0] == student_id]
+                removed = sum(self._kill(key, number) for key in keys)
+                # Rows enrolled without a position have no key
+                for row in np.flatnonzero(self._alive[:self._count] & (self._owners[:self._count] == number)):
+                    self._alive[row] = False
+                    self._dead += 1
+                    self._live_rows[number] -= 1
+                    removed += 1
+                    if not self._live_rows[number]:
+                        self._students -= 1
+            if removed:
+                self._grouping = None
+            return removed
+
+    def _group_rows(self, owners, alive):
+        """Order of the live rows that groups them by student, for np.maximum.reduceat"""
+        rows = np.flatnonzero(alive)
+        order = rows[np.argsort(owners[rows], kind='stable')]
+        sorted_owners = owners[order]
+        starts = np.flatnonzero(np.r_[len(order) > 0, sorted_owners[1:] != sorted_owners[:-1]])
+        return order, starts, sorted_owners[starts]
+
+    def snapshot(self):
+        """
+        Consistent view of the rows enrolled so far.
+
+        Returns:
+            tuple: (base IndexFile or None, dead base rows or None, in-memory
+                matrix, grouping as in _group_rows, student numbers in use)
+        """
+        with self._lock:
+            count = self._count
+            if self._grouping is None:
+                dead_base = np.flatnonzero(~self._base_alive) if self._base_alive is not None else None
+                self._grouping = self._group_rows(self._owners[:count], self._alive[:count]) + (dead_base,)
+            order, starts, group_students, dead_base = self._grouping
+            total = self._base_students + len(self._new_ids)
+            return self._base, dead_base, self._matrix[:count], (order, starts, group_students), total
+
+    def search(self, queries, k=1):
+        """
+        Best matching students for a batch of query embeddings.
+
+        Args:
+            queries: (q, dim) L2-normalized embeddings
+            k: students returned per query
+
+        Returns:
+            list: per query, up to k (student id, cosine similarity) pairs, best first
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        base, dead_base, matrix, (order, starts, group_students), total = self.snapshot()
+        if total == 0 or len(queries) == 0:
+            return [[] for _ in range(len(queries))]
+
+        if self.nprobe:
+            return self._search_ivf(queries, k, base, dead_base, matrix, order, starts, group_students)
+
+        with time_stage('identify_search'):
+            # Best image score per student number, -inf = no live rows
+            per_student = np.full((len(queries), total), -np.inf, dtype=np.float32)
+            if base is not None and base.rows:
+                scores = queries @ base.matrix.T  # (q, file rows), grouped by student on disk
+                if dead_base is not None and len(dead_base):
+                    scores[:, dead_base] = -np.inf
+                per_student[:, :base.students] = np.maximum.reduceat(scores, base.starts, axis=1)
+            if len(order):
+                scores = queries @ matrix.T  # (q, in-memory rows)
+                group_best = np.maximum.reduceat(scores[:, order], starts, axis=1)
+                per_student[:, group_students] = np.maximum(per_student[:, group_students], group_best)
+
+            k = min(k, total)
+            top = np.argpartition(-per_student, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(per_student, top, axis=1)
+            ranking = np.argsort(-top_scores, axis=1)
+            top = np.take_along_axis(top, ranking, axis=1)
+            top_scores = np.take_along_axis(top_scores, ranking, axis=1)
+
+        return [
+            [(self.student_id(int(number)), float(score))
+             for number, score in zip(top[q], top_scores[q]) if score != -np.inf]
+            for q in range(len(queries))
+        ]
+
+    def _search_ivf(self, queries, k, base, dead_base, matrix, order, starts, group_students):
+        """search() with the file rows limited to the nprobe closest IVF lists"""
+        results = []
+        with time_stage('identify_search_ivf'):
+            memory_scores = queries @ matrix.T if len(order) else None
+            base_alive = None
+            if dead_base is not None and len(dead_base):
+                base_alive = np.ones(base.rows, dtype=bool)
+                base_alive[dead_base] = False
+            for q, query in enumerate(queries):
+                rows = probe_rows(query, base.centroids, base.list_offsets, base.list_rows, self.nprobe)
+                if base_alive is not None:
+                    rows = rows[base_alive[rows]]
+                numbers, best = [], []
+                if len(rows):
+                    # Rows ascend, and file rows are grouped by student: reduceat per owner run
+                    owners = base.row_owners[rows]
+                    runs = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+                    numbers.append(owners[runs])
+                    best.append(np.maximum.reduceat(base.matrix[rows] @ query, runs))
+                if memory_scores is not None:
+                    numbers.append(group_students)
+                    best.append(np.maximum.reduceat(memory_scores[q, order], starts))
+                if not numbers:
+                    results.append([])
+                    continue
+                numbers = np.concatenate(numbers)
+                best = np.concatenate(best)
+                # Best first; a student in both the file and memory keeps its best score
+                ranking = np.argsort(-best, kind='stable')
+                _, first = np.unique(numbers[ranking], return_index=True)
+                top = ranking[np.sort(first)][:k]
+                results.append([(self.student_id(int(numbers[i])), float(best[i])) for i in top])
+        return results
+
+    def entries(self):
+        """
+        Live rows per student, for write_index_file().
+
+        Returns:
+            dict: {student id: (name, [(position, embedding), ...])}
+        """
+        with self._lock:
+            base, count = self._base, self._count
+            base_alive = self._base_alive.copy() if self._base_alive is not None else None
+            matrix = self._matrix[:count]
+            owners = self._owners[:count].copy()
+            alive = self._alive[:count].copy()
+            positions = self._positions[:count]
+        students = {}
+        if base is not None:
+            for number in range(base.students):
+                student_id = base.student_ids[number].decode()
+                images = [(base.positions[row].decode() or None, base.matrix[row])
+                          for row in base.rows_of(number) if base_alive is None or base_alive[row]]
+                students[student_id] = (self.name(student_id), images)
+        for row in np.flatnonzero(alive):
+            student_id = self.student_id(int(owners[row]))
+            _, images = students.setdefault(student_id, (self.name(student_id), []))
+            images.append((positions[row], matrix[row]))
+        return students
+
+    def save(self, path, nlist=0):
+        """Write the live rows to an index file (atomically replaced)"""
+        write_index_file(path, self.entries(), self.dim, self.engine, nlist)
+
+    @classmethod
+    def open(cls, path, nprobe=0):
+        """Memory-map an index file; rows added later stay in memory until the next save()"""
+        base = IndexFile(path)
+        return cls(base.dim, base.engine, base=base, nprobe=nprobe)
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Embedding Store
+- Append-only log of enrolled face embeddings, keyed by (student id, image position)
+- Enrollment appends one record; removal appends a tombstone - no full rebuilds
+- Every process tails the log, so a student enrolled by the capture tool or by
+  another worker is searchable on the next request
+- Compaction folds the log into the memory-mapped index file (embedding_index)
+  and starts an empty log; both files are swapped in atomically
+"""
+
+import logging
+import os
+import struct
+import threading
+import uuid
+
+import numpy as np
+
+from ann_index import ivf_lists_for
+from embedding_index import EmbeddingIndex, IndexFile, write_index_file
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-writer use only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'FEMBLOG1'
+VERSION = 1
+# magic, version, dim, generation, engine
+HEADER = struct.Struct('<8sHHQ16s')
+# record length (after this field), op
+RECORD_PREFIX = struct.Struct('<IB')
+# student id, position, name byte lengths
+RECORD_FIELDS = struct.Struct('<HHH')
+
+OP_ADD = 1
+OP_REMOVE = 2
+
+# Fold the log into the index file once it holds this many records
+COMPACT_LOG_RECORDS = 1024
+
+
+class EmbeddingStore:
+    """
+    Append-only embedding log file, continuing the index file at `index_path`
+    (default: the log path with an .idx extension). With `nprobe` > 0 the
+    index file gets IVF lists and loaded indexes search approximately.
+
+    Layout: a fixed header (magic, version, dim, generation, engine) followed
+    by length-prefixed records. Appends and compaction hold an exclusive lock
+    on `<path>.lock`; a record cut short by a crash is ignored by readers and
+    truncated away by the next append.
+
+    Raises:
+        ValueError: the log was written with a different engine or dimension
+    """
+
+    def __init__(self, path, dim, engine, index_path=None, nprobe=0):
+        self.path = path
+        self.nprobe = nprobe
+        self.index_path = index_path or os.path.splitext(path)[0] + '.idx'
+        self.dim = dim
+        self.engine = engine
+        self._tail = (None, 0)  # (inode, offset of the last complete record end)
+        if not os.path.exists(path):
+            with self._locked():
+                if not os.path.exists(path):
+                    self._write_log(path, [])
+        header = self.read_header()
+        if header['engine'] != engine or header['dim'] != dim:
+            raise ValueError(f"{path} holds {header['engine']} embeddings ({header['dim']}d), "
+                             f'not {engine} ({dim}d)')
+
+    def _locked(self, shared=False):
+        return _FileLock(self.path + '.lock', shared)
+
+    def read_header(self):
+        with open(self.path, 'rb') as f:
+            raw = f.read(HEADER.size)
+        if len(raw) < HEADER.size:
+            raise ValueError(f'{self.path} is not an embedding log')
+        magic, version, dim, generation, engine = HEADER.unpack(raw)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{self.path} is not a version {VERSION} embedding log')
+        return {'dim': dim, 'generation': generation, 'engine': engine.rstrip(b'\0').decode()}
+
+    def _encode(self, op, student_id, position, name=None, embedding=None):
+        sid = str(student_id).encode()
+        pos = (position or '').encode()
+        nam = (name or '').encode()
+        body = RECORD_FIELDS.pack(len(sid), len(pos), len(nam)) + sid + pos + nam
+        if op == OP_ADD:
+            vector = np.asarray(embedding, dtype=np.float32).reshape(self.dim)
+            body += vector.tobytes()
+        return RECORD_PREFIX.pack(len(body) + 1, op) + body
+
+    def _write_log(self, path, records):
+        """Write a fresh log (new generation) to a temp file and swap it in"""
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        header = HEADER.pack(MAGIC, VERSION, self.dim, uuid.uuid4().int & (2 ** 64 - 1),
+                             self.engine.encode()[:16])
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            for record in records:
+                f.write(record)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def append(self, records):
+        """Append encoded records in one write so concurrent readers never see half of one"""
+        data = b''.join(records)
+        with self._locked():
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+            try:
+                self._repair_tail(fd)
+                os.write(fd, data)
+                self._tail = (self._tail[0], self._tail[1] + len(data))
+            finally:
+                os.close(fd)
+
+    def _repair_tail(self, fd):
+        """Drop a partial record left by a crashed writer (lock held)"""
+        stat = os.fstat(fd)
+        inode, offset = self._tail
+        if inode != stat.st_ino:
+            offset = 0
+        if offset != stat.st_size:
+            _, offset = self.read(offset)
+            if offset < stat.st_size:
+                logger.warning(f'{self.path}: dropping {stat.st_size - offset} bytes of a partial record')
+                os.truncate(self.path, offset)
+        self._tail = (stat.st_ino, offset)
+
+    def add(self, student_id, position, embedding, name=None):
+        self.append([self._encode(OP_ADD, student_id, position, name, embedding)])
+
+    def add_many(self, student_id, positions, embeddings, name=None):
+        """Enroll several images of a student with a single append"""
+        self.append([self._encode(OP_ADD, student_id, position, name, embedding)
+                     for position, embedding in zip(positions, embeddings)])
+
+    def remove(self, student_id, position=None):
+        """Tombstone one image position, or every image of the student"""
+        self.append([self._encode(OP_REMOVE, student_id, position)])
+
+    def read(self, offset=0):
+        """
+        Parse the complete records after `offset`.
+
+        Returns:
+            tuple: (list of (op, student id, position, name, embedding), end offset)
+        """
+        offset = max(offset, HEADER.size)
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        records = []
+        pos = 0
+        while pos + RECORD_PREFIX.size <= len(data):
+            length, op = RECORD_PREFIX.unpack_from(data, pos)
+            end = pos + 4 + length
+            if end > len(data):
+                break  # Record still being written (or cut short by a crash)
+            field_pos = pos + RECORD_PREFIX.size
+            sid_len, pos_len, name_len = RECORD_FIELDS.unpack_from(data, field_pos)
+            field_pos += RECORD_FIELDS.size
+            student_id = data[field_pos:field_pos + sid_len].decode()
+            field_pos += sid_len
+            position = data[field_pos:field_pos + pos_len].decode() or None
+            field_pos += pos_len
+            name = data[field_pos:field_pos + name_len].decode() or None
+            field_pos += name_len
+            embedding = None
+            if op == OP_ADD:
+                embedding = np.frombuffer(data, np.float32, self.dim, field_pos)
+            records.append((op, student_id, position, name, embedding))
+            pos = end
+        return records, offset + pos
+
+    def open_index_file(self):
+        """Memory-map the index file, or None before the first compaction"""
+        if not os.path.exists(self.index_path):
+            return None
+        base = IndexFile(self.index_path)
+        if base.engine != self.engine or base.dim != self.dim:
+            raise ValueError(f'{self.index_path} holds {base.engine} embeddings ({base.dim}d), '
+                             f'not {self.engine} ({self.dim}d)')
+        return base
+
+    def load_index(self):
+        """
+        Index file + every record of the log, read under a shared lock so a
+        compaction cannot swap the files in between.
+
+        Returns:
+            tuple: (EmbeddingIndex, log records applied, log end offset, (log inode, index inode))
+        """
+        with self._locked(shared=True):
+            base = self.open_index_file()
+            index = EmbeddingIndex(self.dim, self.engine, base=base, nprobe=self.nprobe)
+            records, offset = self.read()
+            apply_records(index, records)
+            inodes = (os.stat(self.path).st_ino, os.stat(self.index_path).st_ino if base is not None else None)
+        return index, len(records), offset, inodes
+
+    def live_keys(self):
+        """(student id, position) of every live embedding"""
+        index = self.load_index()[0]
+        return {(sid, position) for sid, (_, images) in index.entries().items() for position, _ in images}
+
+    def compact(self):
+        """
+        Fold the log into a new index file and start an empty log.
+
+        A crash between the two swaps leaves the old log next to the new index
+        file; replaying it again is harmless (adds are upserts by key).
+
+        Returns:
+            int: dead index rows and log records dropped
+        """
+        with self._locked():
+            base = self.open_index_file()
+            index = EmbeddingIndex(self.dim, self.engine, base=base, nprobe=self.nprobe)
+            records, _ = self.read()
+            apply_records(index, records)
+            nlist = ivf_lists_for(len(index)) if self.nprobe else 0
+            write_index_file(self.index_path, index.entries(), self.dim, self.engine, nlist)
+            self._write_log(self.path, [])
+        return (base.rows if base is not None else 0) + len(records) - len(index)
+
+
+def apply_records(index, records):
+    """Replay log records onto an EmbeddingIndex"""
+    for op, student_id, position, name, embedding in records:
+        if op == OP_ADD:
+            index.add(student_id, embedding, [position], name)
+        else:
+            index.remove(student_id, position)
+
+
+class LiveFaceIndex:
+    """
+    EmbeddingIndex kept in step with an EmbeddingStore.
+
+    `current()` replays the records appended since the last call (one stat()
+    when nothing changed) and reopens the index file when a compaction
+    swapped the files.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._inodes = None  # (log inode, index file inode) of the loaded state
+        self._log_size = 0
+        self._offset = 0
+        self._records = 0  # Log records applied to the current index
+        self._compacting = False
+        self.index, self._records, self._offset, self._inodes = store.load_index()
+        self._log_size = self._offset
+
+    def _index_inode(self):
+        try:
+            return os.stat(self.store.index_path).st_ino
+        except FileNotFoundError:
+            return None
+
+    def refresh(self):
+        """Pick up records appended by this or any other process"""
+        try:
+            stat = os.stat(self.store.path)
+        except FileNotFoundError:
+            return self.index
+        inodes = (stat.st_ino, self._index_inode())
+        if inodes == self._inodes and stat.st_size == self._log_size:
+            return self.index
+        with self._lock:
+            if inodes != self._inodes:
+                # New or compacted files: map the index file, replay the log, swap the index in
+                try:
+                    self.index, self._records, self._offset, self._inodes = self.store.load_index()
+                except ValueError as e:
+                    logger.error(f'Keeping the loaded face index: {e}')
+                    self._inodes = inodes
+            else:
+                records, self._offset = self.store.read(self._offset)
+                apply_records(self.index, records)
+                self._records += len(records)
+            self._log_size = stat.st_size
+        return self.index
+
+    def current(self):
+        """The up-to-date index"""
+        return self.refresh()
+
+    def enroll(self, student_id, position, embedding, name=None):
+        self.store.add(student_id, position, embedding, name)
+        self.refresh()
+        self._maybe_compact()
+
+    def unenroll(self, student_id, position=None):
+        self.store.remove(student_id, position)
+        index = self.refresh()
+        self._maybe_compact()
+        return index
+
+    def _maybe_compact(self):
+        if self._compacting or self._records < COMPACT_LOG_RECORDS:
+            return
+        self._compacting = True
+        threading.Thread(target=self._compact, name='embedding-compaction', daemon=True).start()
+
+    def _compact(self):
+        try:
+            dropped = self.store.compact()
+            logger.info(f'✓ Embedding log compacted into {self.store.index_path}: {dropped} stale entries dropped')
+            self.refresh()
+        except Exception as e:
+            logger.error(f'Embedding log compaction failed: {e}')
+        finally:
+            self._compacting = False
+
+
+class _FileLock:
+    """Advisory lock on a lock file (no-op without fcntl)"""
+
+    def __init__(self, path, shared=False):
+        self.path = path
+        self.shared = shared
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
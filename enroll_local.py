@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Local Enrollment
+- Walks face_dataset/<Class>/<Name>/ (metadata.json + 224x224 face crops)
+- Embeds the crops with the configured EMBEDDING_ENGINE into the enrollment
+  log used by /api/identify (FACE_STORE_PATH)
+- Incremental by default: only images missing from the log are embedded,
+  images (or whole students) deleted from the dataset are tombstoned
+- Dataset crops are enrolled under 'local:<file name>' positions; entries
+  other writers add to the same log (/api/upload-image 'front', 'left', ...)
+  are never removed
+- --rebuild re-embeds everything (e.g. after changing EMBEDDING_ENGINE)
+
+Usage:
+    python enroll_local.py
+    python enroll_local.py --dataset face_dataset --rebuild
+"""
+
+import argparse
+import glob
+import json
+import os
+
+import cv2
+from dotenv import load_dotenv
+
+from embedding_store import EmbeddingStore
+from face_embedding import create_embedder, embed_faces, EMBEDDING_ENGINES
+
+load_dotenv()
+
+# Position namespace of the enrollments this tool (and make_dataset.py) owns
+LOCAL_POSITION_PREFIX = 'local:'
+
+
+def local_position(image_name):
+    """Log position of a dataset crop, e.g. '000' -> 'local:000'"""
+    return LOCAL_POSITION_PREFIX + image_name
+
+
+def is_local_position(position):
+    return position.startswith(LOCAL_POSITION_PREFIX)
+
+
+def iter_students(dataset_path):
+    """Yield (student id, name, {position: image path}) for every person folder"""
+    for meta_path in sorted(glob.glob(os.path.join(dataset_path, '*', '*', 'metadata.json'))):
+        person_folder = os.path.dirname(meta_path)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Skipping {person_folder}: unreadable metadata.json ({e})")
+            continue
+        student_id = str(meta.get('id') or '').strip()
+        if not student_id:
+            print(f"⚠️ Skipping {person_folder}: metadata.json has no student id")
+            continue
+        images = {
+            os.path.splitext(os.path.basename(path))[0]: path
+            for path in sorted(glob.glob(os.path.join(person_folder, '*.jpg')))
+        }
+        yield student_id, meta.get('name') or os.path.basename(person_folder), images
+
+
+def embed_images(embedder, images):
+    """Embed the given {position: path} images; returns (positions, embeddings)"""
+    crops, positions = [], []
+    for position, path in images.items():
+        image = cv2.imread(path)
+        if image is None:
+            print(f"⚠️ Could not read {path}")
+            continue
+        crops.append(image)
+        positions.append(position)
+    return positions, embed_faces(embedder, crops)
+
+
+def open_store(path, embedder, rebuild, nprobe):
+    if rebuild:
+        for stale in (path, os.path.splitext(path)[0] + '.idx'):
+            if os.path.exists(stale):
+                os.remove(stale)
+    try:
+        return EmbeddingStore(path, embedder.dim, embedder.name, nprobe=nprobe)
+    except ValueError as e:
+        raise SystemExit(f"❌ {e}\n   Run with --rebuild to re-embed the dataset with {embedder.name}.")
+
+
+def sync_store(store, embedder, dataset_path):
+    """
+    Bring the dataset's enrollments in the log up to date.
+
+    Embeds crops missing from the log and tombstones 'local:' entries whose
+    crop (or whole student folder) is gone. Entries written before the
+    namespace existed are replaced by their 'local:' key when a crop of the
+    same name is still in the dataset.
+
+    Returns:
+        tuple: (added, removed)
+    """
+    enrolled = store.live_keys()
+    seen = set()
+    added = removed = 0
+    for student_id, name, images in iter_students(dataset_path):
+        seen.add(student_id)
+        positions = {local_position(image_name): path for image_name, path in images.items()}
+        new_images = {position: path for position, path in positions.items() if (student_id, position) not in enrolled}
+        if new_images:
+            embedded, embeddings = embed_images(embedder, new_images)
+            store.add_many(student_id, embedded, embeddings, name)
+            added += len(embedded)
+            print(f"✅ {name} ({student_id}): {len(embedded)} new image(s)")
+        for key in sorted(key for key in enrolled if key[0] == student_id):
+            position = key[1]
+            stale = position not in positions if is_local_position(position) else \
+                local_position(position) in positions  # pre-namespace key of a dataset crop
+            if stale:
+                store.remove(*key)
+                removed += 1
+                print(f"🗑️ {name} ({student_id}): {position} removed")
+    for key in sorted(key for key in enrolled if key[0] not in seen and is_local_position(key[1])):
+        store.remove(*key)
+        removed += 1
+        print(f"🗑️ {key[0]}: {key[1]} removed (no longer in the dataset)")
+    return added, removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Enroll face_dataset into the face identification log')
+    parser.add_argument('--dataset', default='face_dataset', help='Dataset root (face_dataset/<Class>/<Name>/)')
+    parser.add_argument('--store', default=os.getenv('FACE_STORE_PATH', 'face_embeddings.log'), help='Enrollment log')
+    parser.add_argument('--engine', default=os.getenv('EMBEDDING_ENGINE', 'lbp'), choices=EMBEDDING_ENGINES)
+    parser.add_argument('--sface-model', default=os.getenv('SFACE_MODEL_PATH', 'models/face_recognition_sface_2021dec.onnx'))
+    parser.add_argument('--rebuild', action='store_true', help='Re-embed every image into a fresh log')
+    parser.add_argument('--search', default=os.getenv('IDENTIFY_SEARCH', 'exact'), choices=('exact', 'ivf'),
+                        help='ivf: train IVF lists into the index file for approximate search')
+    args = parser.parse_args()
+
+    embedder = create_embedder(args.engine, args.sface_model)
+    nprobe = int(os.getenv('IVF_NPROBE', '8')) if args.search == 'ivf' else 0
+    store = open_store(args.store, embedder, args.rebuild, nprobe)
+    added, removed = sync_store(store, embedder, args.dataset)
+
+    dropped = store.compact()
+    print(f"\n📦 {added} added, {removed} removed, {dropped} stale entries compacted ({args.engine}) "
+          f"-> {os.path.abspath(store.index_path)}")
+    print("   Running backends pick up the changes on their next request.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+Face Detection Engine
+- Tiered Haar Cascade detection (strict -> aggressive fallback chain)
+- Raw cascade windows are scanned once per image and shared by all tiers
+- Reports which tier found the face so the chain can be tuned
+- Optional downscaled detection proxy, boxes mapped back to full resolution
+- ROI tracking for live camera streams
+- Reusable scratch buffers (one detector per thread)
+- Resize, grayscale and per-tier timings recorded in metrics
+- Single-pass CNN engines (YuNet, res10 SSD) through cv2.dnn, same interface
+"""
+
+import os
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from metrics import time_stage
+
+# Same grouping epsilon that CascadeClassifier.detectMultiScale uses internally
+GROUP_EPS = 0.2
+
+# One sensitivity tier of the fallback chain.
+# source: 'equalized' (histogram equalized gray) or 'gray'
+# min_size/max_size: square window limits in pixels
+# crop_equalized: crop from the equalized image when this tier hits
+DetectionTier = namedtuple(
+    'DetectionTier',
+    ['name', 'source', 'scale_factor', 'min_neighbors', 'min_size', 'max_size', 'crop_equalized'],
+    defaults=[False]
+)
+
+# Full fallback chain used by /api/process-image, strictest first
+CASCADE_TIERS = (
+    DetectionTier('equalized', 'equalized', 1.1, 4, 30, 400),
+    DetectionTier('sensitive', 'gray', 1.05, 3, 20, 500),
+    DetectionTier('equalized_sensitive', 'equalized', 1.05, 3, 20, 500, crop_equalized=True),
+    DetectionTier('aggressive', 'gray', 1.05, 2, 15, 700),
+)
+
+# Cheaper chain used for the live camera overlay
+LIVE_TIERS = CASCADE_TIERS[:2]
+
+# faces: array of (x, y, w, h) in the coordinates of the image passed to detect()
+# tier: DetectionTier that hit (None on a miss)
+# scan: CascadeScan of the detection proxy
+# scale: factor mapping proxy coordinates back to the original image
+# scores: confidence per face (cascade: neighbour windows, DNN: network score)
+DetectionResult = namedtuple('DetectionResult', ['faces', 'tier', 'scan', 'scale', 'scores'], defaults=(None,))
+
+
+class ScratchBuffers:
+    """
+    Named output buffers reused across calls, reallocated only when the shape changes.
+    Not thread-safe: every thread (FaceProcessor) owns its own set.
+    """
+
+    def __init__(self):
+        self._buffers = {}
+
+    def get(self, name, shape, dtype=np.uint8):
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = self._buffers[name] = np.empty(shape, dtype)
+        return buffer
+
+
+def make_detection_proxy(image_array, max_dim, buffers=None):
+    """
+    Downscale an image so its longest side is at most max_dim pixels.
+
+    Returns:
+        tuple: (proxy image, scale from proxy to original coordinates)
+    """
+    height, width = image_array.shape[:2]
+    if not max_dim or max(height, width) <= max_dim:
+        return image_array, 1.0
+    scale = max(height, width) / max_dim
+    size = (max(1, round(width / scale)), max(1, round(height / scale)))
+    dst = buffers.get('proxy', (size[1], size[0]) + image_array.shape[2:]) if buffers else None
+    proxy = cv2.resize(image_array, size, dst=dst, interpolation=cv2.INTER_AREA)
+    return proxy, scale
+
+
+def scale_faces(faces, scale, image_shape):
+    """Map face boxes from proxy coordinates back onto the original image"""
+    if len(faces) == 0 or scale == 1.0:
+        return faces
+    boxes = np.rint(np.asarray(faces, dtype=np.float64) * scale).astype(np.int32)
+    height, width = image_shape[:2]
+    boxes[:, 0] = np.clip(boxes[:, 0], 0, width - 1)
+    boxes[:, 1] = np.clip(boxes[:, 1], 0, height - 1)
+    boxes[:, 2] = np.minimum(boxes[:, 2], width - boxes[:, 0])
+    boxes[:, 3] = np.minimum(boxes[:, 3], height - boxes[:, 1])
+    return boxes
+
+
+class CascadeScan:
+    """
+    Raw (ungrouped) cascade windows for one image.
+
+    detectMultiScale is a raw window scan followed by groupRectangles, and the
+    pyramid levels only depend on the scale factor. Tiers that share a source
+    image and scale factor therefore share their raw windows: each pyramid
+    level is scanned at most once, and every tier just regroups the cached
+    windows with its own minNeighbors and size limits.
+    """
+
+    def __init__(self, cascade, image_array, buffers=None):
+        self.cascade = cascade
+        self.buffers = buffers
+        if image_array.ndim == 3:
+            dst = buffers.get('gray', image_array.shape[:2]) if buffers else None
+            self.gray = cv2.cvtColor(image_array, cv2.COLOR_BGR2GRAY, dst=dst)
+        else:
+            self.gray = image_array
+        self._equalized = None
+        self._windows = {}  # (source, scale_factor) -> [min_size, max_size, [rect arrays]]
+
+    @property
+    def equalized(self):
+        """Histogram equalized grayscale image, computed on first use"""
+        if self._equalized is None:
+            dst = self.buffers.get('equalized', self.gray.shape) if self.buffers else None
+            self._equalized = cv2.equalizeHist(self.gray, dst=dst)
+        return self._equalized
+
+    def _source(self, name):
+        return self.equalized if name == 'equalized' else self.gray
+
+    def _scan(self, image, scale_factor, min_size, max_size):
+        """Scan the pyramid levels whose window size lies in [min_size, max_size]"""
+        rects = self.cascade.detectMultiScale(
+            image,
+            scaleFactor=scale_factor,
+            minNeighbors=0,  # No grouping - keep raw windows
+            minSize=(min_size, min_size),
+            maxSize=(max_size, max_size)
+        )
+        return np.asarray(rects, dtype=np.int32).reshape(-1, 4)
+
+    def raw_windows(self, source, scale_factor, min_size, max_size):
+        """Raw windows for a size range, scanning only the levels not cached yet"""
+        key = (source, scale_factor)
+        entry = self._windows.get(key)
+        image = self._source(source)
+
+        if entry is None:
+            entry = [min_size, max_size, [self._scan(image, scale_factor, min_size, max_size)]]
+            self._windows[key] = entry
+        else:
+            if min_size < entry[0]:
+                entry[2].append(self._scan(image, scale_factor, min_size, entry[0] - 1))
+                entry[0] = min_size
+            if max_size > entry[1]:
+                entry[2].append(self._scan(image, scale_factor, entry[1] + 1, max_size))
+                entry[1] = max_size
+
+        rects = entry[2][0] if len(entry[2]) == 1 else np.concatenate(entry[2])
+        sizes = rects[:, 2]
+        return rects[(sizes >= min_size) & (sizes <= max_size)]
+
+    def evaluate(self, tier):
+        """Faces found by a single tier and the number of raw windows grouped into each"""
+        rects = self.raw_windows(tier.source, tier.scale_factor, tier.min_size, tier.max_size)
+        if len(rects) == 0:
+            return (), ()
+        faces, weights = cv2.groupRectangles(rects.tolist(), tier.min_neighbors, GROUP_EPS)
+        return faces, weights
+
+
+class TieredFaceDetector:
+    """
+    Evaluate a chain of sensitivity tiers, stopping at the first that hits.
+
+    The proxy, grayscale and equalized images are written into scratch buffers
+    reused by the next detect() call, so a detector (like its cascade) must
+    only be used by one thread, and a DetectionResult's scan is only valid
+    until that detector runs again.
+    """
+
+    name = 'haar'
+
+    def __init__(self, cascade, buffers=None):
+        self.cascade = cascade
+        self.buffers = buffers if buffers is not None else ScratchBuffers()
+
+    def detect(self, image_array, tiers=CASCADE_TIERS, max_dim=None):
+        """
+        Detect faces with the fallback chain.
+
+        Args:
+            image_array: BGR or grayscale image
+            tiers: sensitivity tiers to evaluate in order
+            max_dim: run detection on a proxy no larger than this (None = full size)
+
+        Returns:
+            DetectionResult: faces in image_array coordinates, the tier that
+            found them, the shared scan and the proxy scale
+        """
+        with time_stage('resize'):
+            proxy, scale = make_detection_proxy(image_array, max_dim, self.buffers)
+        with time_stage('grayscale'):
+            scan = CascadeScan(self.cascade, proxy, self.buffers)
+        for tier in tiers:
+            # Includes the pyramid levels this tier is the first to scan
+            with time_stage(f'tier_{tier.name}'):
+                faces, weights = scan.evaluate(tier)
+            if len(faces) > 0:
+                return DetectionResult(scale_faces(faces, scale, image_array.shape), tier, scan, scale,
+                                       np.asarray(weights, dtype=np.float32).ravel())
+        return DetectionResult((), None, scan, scale)
+
+
+class DnnFaceDetector:
+    """
+    Single-pass CNN face detector with the TieredFaceDetector interface.
+
+    There is no fallback chain: detect() ignores `tiers` and reports the
+    engine's own pseudo tier when it finds a face. The network runs on the
+    detection proxy. Like the cascade, a network instance must only be used
+    by one thread.
+    """
+
+    name = 'dnn'
+
+    def __init__(self, score_threshold=0.6, buffers=None):
+        self.score_threshold = score_threshold
+        self.buffers = buffers if buffers is not None else ScratchBuffers()
+        self.tier = DetectionTier(self.name, 'color', 1.0, 0, 0, 0)
+
+    def _forward(self, image):
+        """Rows (x, y, w, h, score) as floats in the coordinates of image"""
+        raise NotImplementedError
+
+    def detect(self, image_array, tiers=None, max_dim=None):
+        with time_stage('resize'):
+            proxy, scale = make_detection_proxy(image_array, max_dim, self.buffers)
+        if proxy.ndim == 2:
+            proxy = cv2.cvtColor(proxy, cv2.COLOR_GRAY2BGR)
+        with time_stage(f'dnn_{self.name}'):
+            boxes = np.asarray(self._forward(proxy), dtype=np.float64).reshape(-1, 5)
+        if len(boxes) == 0:
+            return DetectionResult((), None, None, scale)
+
+        # Networks can return boxes that stick out of the image
+        height, width = proxy.shape[:2]
+        x1 = np.clip(boxes[:, 0], 0, width - 1)
+        y1 = np.clip(boxes[:, 1], 0, height - 1)
+        x2 = np.clip(boxes[:, 0] + boxes[:, 2], 0, width)
+        y2 = np.clip(boxes[:, 1] + boxes[:, 3], 0, height)
+        faces = np.rint(np.stack([x1, y1, x2 - x1, y2 - y1], axis=1)).astype(np.int32)
+        keep = (faces[:, 2] > 0) & (faces[:, 3] > 0)
+        faces, scores = faces[keep], boxes[keep, 4].astype(np.float32)
+        if len(faces) == 0:
+            return DetectionResult((), None, None, scale)
+        return DetectionResult(scale_faces(faces, scale, image_array.shape), self.tier, None, scale, scores)
+
+
+class YuNetDetector(DnnFaceDetector):
+    """
+    YuNet (OpenCV Zoo face_detection_yunet ONNX model) via cv2.FaceDetectorYN.
+    Fast on small inputs - pair it with a detection proxy of about 320 px.
+    """
+
+    name = 'yunet'
+
+    def __init__(self, model_path, score_threshold=0.6, nms_threshold=0.3, top_k=50, buffers=None):
+        super().__init__(score_threshold, buffers)
+        if not os.path.isfile(model_path):
+            raise FileNotFoundError(f'YuNet model not found: {model_path}')
+        self.model = cv2.FaceDetectorYN.create(model_path, '', (320, 320), score_threshold, nms_threshold, top_k)
+        self._input_size = (320, 320)
+
+    def _forward(self, image):
+        size = (image.shape[1], image.shape[0])
+        if size != self._input_size:
+            self.model.setInputSize(size)
+            self._input_size = size
+        _, faces = self.model.detect(image)
+        if faces is None:
+            return ()
+        # Columns: x, y, w, h, 5 landmarks (x, y), score
+        return faces[:, [0, 1, 2, 3, 14]]
+
+
+class SsdFaceDetector(DnnFaceDetector):
+    """ResNet-10 SSD face detector (res10_300x300 Caffe model) via cv2.dnn"""
+
+    name = 'ssd'
+    INPUT_SIZE = (300, 300)
+    MEAN = (104.0, 177.0, 123.0)
+
+    def __init__(self, prototxt_path, model_path, score_threshold=0.6, buffers=None):
+        super().__init__(score_threshold, buffers)
+        for path in (prototxt_path, model_path):
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f'SSD model file not found: {path}')
+        self.net = cv2.dnn.readNetFromCaffe(prototxt_path, model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+    def _forward(self, image):
+        height, width = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(image, 1.0, self.INPUT_SIZE, self.MEAN, swapRB=False, crop=False)
+        self.net.setInput(blob)
+        # 1 x 1 x N x 7: image id, class id, confidence, x1, y1, x2, y2 (relative)
+        detections = self.net.forward().reshape(-1, 7)
+        detections = detections[detections[:, 2] >= self.score_threshold]
+        corners = detections[:, 3:7] * np.array([width, height, width, height])
+        return np.column_stack([corners[:, 0], corners[:, 1], corners[:, 2] - corners[:, 0],
+                                corners[:, 3] - corners[:, 1], detections[:, 2]])
+
+
+DETECTOR_ENGINES = ('haar', 'yunet', 'ssd')
+
+
+def create_detector(engine='haar', cascade=None, buffers=None, yunet_model=None,
+                    ssd_prototxt=None, ssd_model=None, score_threshold=0.6):
+    """
+    Build a face detector engine.
+
+    Args:
+        engine: 'haar' (tiered cascade, needs cascade), 'yunet' or 'ssd'
+        yunet_model: path of the YuNet ONNX model
+        ssd_prototxt, ssd_model: paths of the res10 SSD Caffe files
+
+    Raises:
+        ValueError: unknown engine or missing cascade
+        FileNotFoundError: model files missing
+    """
+    if engine == 'haar':
+        if cascade is None:
+            raise ValueError('The haar engine needs a cascade classifier')
+        return TieredFaceDetector(cascade, buffers)
+    if engine == 'yunet':
+        return YuNetDetector(yunet_model, score_threshold, buffers=buffers)
+    if engine == 'ssd':
+        return SsdFaceDetector(ssd_prototxt, ssd_model, score_threshold, buffers=buffers)
+    raise ValueError(f'Unknown detector engine: {engine}')
+
+
+class FaceTracker:
+    """
+    Follow a face across consecutive frames of a live camera stream.
+
+    While the face is tracked only an expanded region around the last box is
+    searched, downscaled so the face is about `roi_face_size` pixels and with
+    the window sizes limited to what the face can grow or shrink to between
+    frames. A full-frame search runs every `full_search_interval` frames and
+    whenever the face is lost. The face followed is the most confident
+    detection (not the largest), so a big false positive does not pin the
+    search to a region without a face.
+    """
+
+    def __init__(self, tiers=LIVE_TIERS, max_dim=None, full_search_interval=10,
+                 roi_expand=0.5, roi_face_size=64):
+        self.tiers = tiers
+        self.max_dim = max_dim
+        self.full_search_interval = full_search_interval
+        self.roi_expand = roi_expand
+        self.roi_face_size = roi_face_size
+        self.last_box = None
+        self.frames_since_full = 0
+
+    def reset(self):
+        self.last_box = None
+        self.frames_since_full = 0
+
+    def _roi_tiers(self, face_size):
+        """Tiers limited to faces between 0.6x and 1.6x the tracked size"""
+        min_size = max(20, int(face_size * 0.6))
+        max_size = int(face_size * 1.6) + 1
+        return tuple(tier._replace(min_size=min_size, max_size=max_size) for tier in self.tiers)
+
+    def _search_roi(self, detector, image_array):
+        x, y, w, h = self.last_box
+        pad_x, pad_y = int(w * self.roi_expand), int(h * self.roi_expand)
+        x1, y1 = max(0, x - pad_x), max(0, y - pad_y)
+        x2 = min(image_array.shape[1], x + w + pad_x)
+        y2 = min(image_array.shape[0], y + h + pad_y)
+        roi = image_array[y1:y2, x1:x2]
+
+        # Downscale so the tracked face is about roi_face_size pixels
+        scale = max(1.0, max(w, h) / self.roi_face_size)
+        detection = detector.detect(roi, self._roi_tiers(max(w, h) / scale), max(roi.shape[:2]) / scale)
+        if len(detection.faces) == 0:
+            return detection
+        faces = np.asarray(detection.faces, dtype=np.int32).copy()
+        faces[:, 0] += x1
+        faces[:, 1] += y1
+        return detection._replace(faces=faces)
+
+    def update(self, detector, image_array):
+        """
+        Detect faces in the next frame.
+
+        Returns:
+            tuple: (faces, search mode 'roi' or 'full', tier that hit or None)
+        """
+        detection = None
+        mode = 'roi'
+        if self.last_box is not None and self.frames_since_full < self.full_search_interval:
+            detection = self._search_roi(detector, image_array)
+            self.frames_since_full += 1
+
+        if detection is None or len(detection.faces) == 0:
+            # Periodic refresh, first frame or lost face
+            mode = 'full'
+            detection = detector.detect(image_array, self.tiers, self.max_dim)
+            self.frames_since_full = 0
+
+        faces = detection.faces
+        if len(faces) > 0:
+            self.last_box = tuple(int(v) for v in faces[best_face_index(detection)])
+        else:
+            self.last_box = None
+        return faces, mode, detection.tier
+
+
+def best_face_index(detection):
+    """Index of the most confident face (the largest when the detector reports no scores)"""
+    if detection.scores is not None and len(detection.scores) == len(detection.faces):
+        return int(np.argmax(detection.scores))
+    return max(range(len(detection.faces)), key=lambda i: detection.faces[i][2] * detection.faces[i][3])
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Face Embeddings
+- Fixed-length, L2-normalized float32 vectors from the 224x224 face crops
+- LBP engine: uniform LBP histograms per grid cell, randomly projected to a
+  compact vector (no model files, works offline)
+- SFace engine: OpenCV Zoo SFace CNN via cv2.FaceRecognizerSF (model not bundled)
+
+Cosine similarity of two embeddings is their dot product.
+"""
+
+import os
+
+import cv2
+import numpy as np
+
+from metrics import time_stage
+
+EMBEDDING_ENGINES = ('lbp', 'sface')
+
+
+def _uniform_lbp_table():
+    """Map the 256 LBP codes to 59 bins: 58 uniform patterns + 1 for the rest"""
+    table = np.full(256, 58, dtype=np.int64)
+    next_bin = 0
+    for code in range(256):
+        bits = [(code >> i) & 1 for i in range(8)]
+        transitions = sum(bits[i] != bits[(i + 1) % 8] for i in range(8))
+        if transitions <= 2:
+            table[code] = next_bin
+            next_bin += 1
+    return table
+
+
+class LbpEmbedder:
+    """
+    Spatial uniform-LBP histogram embedding.
+
+    The face is split into a grid; each cell contributes a 59-bin histogram of
+    uniform local binary patterns. The concatenated histograms are square
+    rooted (Hellinger kernel -> dot product) and projected to `dim` dimensions
+    with a fixed random Gaussian matrix, which keeps cosine similarities while
+    making the index small.
+    """
+
+    name = 'lbp'
+    BINS = 59
+
+    def __init__(self, dim=256, grid=7, size=112, seed=2024):
+        self.dim = dim
+        self.grid = grid
+        self.size = size
+        self._table = _uniform_lbp_table()
+        cells = size - 2  # LBP codes exist for the interior pixels
+        cell_index = np.minimum(np.arange(cells) * grid // cells, grid - 1)
+        # Histogram slot offset of every interior pixel: cell number * BINS
+        self._offsets = ((cell_index[:, None] * grid + cell_index[None, :]) * self.BINS).ravel()
+        rng = np.random.default_rng(seed)
+        raw_dim = grid * grid * self.BINS
+        self._projection = (rng.standard_normal((raw_dim, dim)) / np.sqrt(dim)).astype(np.float32)
+
+    def _lbp_codes(self, gray):
+        g = gray.astype(np.int16)
+        center = g[1:-1, 1:-1]
+        codes = np.zeros(center.shape, dtype=np.uint8)
+        # Neighbours clockwise from the top-left
+        neighbours = ((0, 0), (0, 1), (0, 2), (1, 2), (2, 2), (2, 1), (2, 0), (1, 0))
+        height, width = center.shape
+        for bit, (dy, dx) in enumerate(neighbours):
+            codes |= ((g[dy:dy + height, dx:dx + width] >= center).astype(np.uint8) << bit)
+        return codes
+
+    def embed(self, face_crop):
+        """Embedding of one BGR or grayscale face crop"""
+        gray = cv2.cvtColor(face_crop, cv2.COLOR_BGR2GRAY) if face_crop.ndim == 3 else face_crop
+        gray = cv2.resize(gray, (self.size, self.size), interpolation=cv2.INTER_AREA)
+        bins = self._table[self._lbp_codes(gray).ravel()] + self._offsets
+        histogram = np.bincount(bins, minlength=self.grid * self.grid * self.BINS).astype(np.float32)
+        histogram = np.sqrt(histogram / histogram.sum())
+        vector = histogram @ self._projection
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+
+class SFaceEmbedder:
+    """
+    SFace (OpenCV Zoo face_recognition_sface ONNX model) via cv2.FaceRecognizerSF.
+    Not thread-safe: one instance per thread.
+    """
+
+    name = 'sface'
+    dim = 128
+
+    def __init__(self, model_path):
+        if not os.path.isfile(model_path):
+            raise FileNotFoundError(f'SFace model not found: {model_path}')
+        self.model = cv2.FaceRecognizerSF.create(model_path, '')
+
+    def embed(self, face_crop):
+        if face_crop.ndim == 2:
+            face_crop = cv2.cvtColor(face_crop, cv2.COLOR_GRAY2BGR)
+        # SFace expects a 112x112 face; the crops are already centered on the face
+        face = cv2.resize(face_crop, (112, 112), interpolation=cv2.INTER_AREA)
+        vector = self.model.feature(face).reshape(-1).astype(np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+
+def embed_faces(embedder, face_crops):
+    """Stack the embeddings of several crops into a (n, dim) float32 matrix"""
+    with time_stage(f'embed_{embedder.name}'):
+        if not face_crops:
+            return np.empty((0, embedder.dim), dtype=np.float32)
+        return np.ascontiguousarray(np.stack([embedder.embed(crop) for crop in face_crops]), dtype=np.float32)
+
+
+def create_embedder(engine='lbp', sface_model=None):
+    """
+    Build a face embedder.
+
+    Raises:
+        ValueError: unknown engine
+        FileNotFoundError: model file missing
+    """
+    if engine == 'lbp':
+        return LbpEmbedder()
+    if engine == 'sface':
+        return SFaceEmbedder(sface_model)
+    raise ValueError(f'Unknown embedding engine: {engine}')
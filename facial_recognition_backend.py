@@ -6,21 +6,29 @@ Facial Recognition Backend API
 - Firebase upload
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 import cv2
 import numpy as np
 import base64
 import os
+import time
 from datetime import datetime
 from io import BytesIO
 import json
 import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
 
-# Firebase imports
-import firebase_admin
-from firebase_admin import credentials, storage, firestore
+import metrics
+from metrics import time_stage, record_tier
+from storage_backends import create_storage, init_firebase
+from upload_queue import UploadQueue, QueueFullError
+from face_embedding import create_embedder, embed_faces
+from embedding_store import EmbeddingStore, LiveFaceIndex
+from face_detection import create_detector, FaceTracker, ScratchBuffers, CASCADE_TIERS, LIVE_TIERS
 
 # Configure logging
 logging.basicConfig(
@@ -36,53 +44,6 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)
 
-# Initialize Firebase
-def init_firebase():
-    """Initialize Firebase Admin SDK"""
-    try:
-        # Check if app already exists
-        try:
-            firebase_admin.get_app()
-            logger.info('✓ Firebase app already initialized')
-            return True
-        except ValueError:
-            # App doesn't exist, initialize it
-            pass
-        
-        project_id = os.getenv('FIREBASE_PROJECT_ID')
-        private_key_id = os.getenv('FIREBASE_PRIVATE_KEY_ID')
-        private_key = os.getenv('FIREBASE_PRIVATE_KEY', '').replace('\\n', '\n')
-        client_email = os.getenv('FIREBASE_CLIENT_EMAIL')
-        client_id = os.getenv('FIREBASE_CLIENT_ID')
-        storage_bucket = os.getenv('FIREBASE_STORAGE_BUCKET')
-        
-        if not all([project_id, private_key_id, private_key, client_email, client_id, storage_bucket]):
-            logger.error('Missing Firebase environment variables')
-            return False
-        
-        service_account = {
-            "type": "service_account",
-            "project_id": project_id,
-            "private_key_id": private_key_id,
-            "private_key": private_key,
-            "client_email": client_email,
-            "client_id": client_id,
-            "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-            "token_uri": "https://oauth2.googleapis.com/token",
-            "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-        }
-        
-        cred = credentials.Certificate(service_account)
-        firebase_admin.initialize_app(cred, {
-            'storageBucket': storage_bucket,
-        })
-        
-        logger.info('✓ Firebase initialized successfully')
-        return True
-    except Exception as e:
-        logger.error(f'Firebase initialization failed: {e}')
-        return False
-
 # Initialize face cascade classifier
 def init_cascade():
     """Load Haar Cascade classifier for face detection"""
@@ -94,45 +55,135 @@ def init_cascade():
     logger.info('✓ Cascade classifier loaded')
     return cascade
 
-# Global instances
-cascade = init_cascade()
-firebase_initialized = init_firebase()
+# Longest side of the downscaled copy used for detection (0 = detect at full size).
+# Faces are still cropped from the full resolution image. The tier min sizes
+# apply to the proxy, so going below 480 loses small faces
+# (benchmarks/bench_detection_resolution.py).
+DETECTION_MAX_DIM = int(os.getenv('DETECTION_MAX_DIM', '480'))
+
+# Detector engine: haar (tiered cascade), yunet or ssd (OpenCV DNN on CPU).
+# The DNN model files are not bundled; a missing model falls back to haar.
+DETECTOR_ENGINE = os.getenv('DETECTOR_ENGINE', 'haar')
+YUNET_MODEL_PATH = os.getenv('YUNET_MODEL_PATH', 'models/face_detection_yunet_2023mar.onnx')
+SSD_PROTOTXT_PATH = os.getenv('SSD_PROTOTXT_PATH', 'models/deploy.prototxt')
+SSD_MODEL_PATH = os.getenv('SSD_MODEL_PATH', 'models/res10_300x300_ssd_iter_140000.caffemodel')
+DNN_SCORE_THRESHOLD = float(os.getenv('DNN_SCORE_THRESHOLD', '0.6'))
+
+# Identification (/api/identify): embedding engine (lbp needs no model file,
+# sface = OpenCV Zoo SFace), the append-only enrollment log shared with
+# make_dataset.py / enroll_local.py, and the cosine similarity a match needs
+EMBEDDING_ENGINE = os.getenv('EMBEDDING_ENGINE', 'lbp')
+SFACE_MODEL_PATH = os.getenv('SFACE_MODEL_PATH', 'models/face_recognition_sface_2021dec.onnx')
+FACE_STORE_PATH = os.getenv('FACE_STORE_PATH', 'face_embeddings.log')
+# Enroll every /api/upload-image crop into the log (0 = upload only)
+ENROLL_ON_UPLOAD = os.getenv('ENROLL_ON_UPLOAD', '1') in ('1', 'true')
+IDENTIFY_THRESHOLD = float(os.getenv('IDENTIFY_THRESHOLD', '0.8' if EMBEDDING_ENGINE == 'lbp' else '0.363'))
+IDENTIFY_MAX_CANDIDATES = int(os.getenv('IDENTIFY_MAX_CANDIDATES', '5'))
+# exact | ivf (approximate: probe IVF_NPROBE k-means lists, built at compaction)
+IDENTIFY_SEARCH = os.getenv('IDENTIFY_SEARCH', 'exact')
+IVF_NPROBE = int(os.getenv('IVF_NPROBE', '8'))
+
+# Worker threads shared by all /api/batch-process requests, and how many
+# images of a single batch may be in flight at once
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', str(min(4, os.cpu_count() or 1))))
+BATCH_MAX_IN_FLIGHT = int(os.getenv('BATCH_MAX_IN_FLIGHT', str(BATCH_WORKERS)))
+
+# Longest side and JPEG quality of "preview" visualizations
+VISUALIZATION_PREVIEW_DIM = int(os.getenv('VISUALIZATION_PREVIEW_DIM', '480'))
+VISUALIZATION_PREVIEW_QUALITY = int(os.getenv('VISUALIZATION_PREVIEW_QUALITY', '70'))
+
+# Live overlay sessions: full-frame search every N frames (ROI search in between),
+# sessions idle longer than the TTL (seconds) are dropped
+LIVE_FULL_SEARCH_INTERVAL = int(os.getenv('LIVE_FULL_SEARCH_INTERVAL', '10'))
+LIVE_SESSION_TTL = int(os.getenv('LIVE_SESSION_TTL', '30'))
+LIVE_MAX_SESSIONS = int(os.getenv('LIVE_MAX_SESSIONS', '256'))
+
+# /api/detect-faces admission control: frames detected at once across all
+# clients (more get 429), and how long (seconds) a frame may wait for the
+# previous frame of the same client before it is rejected
+DETECT_MAX_CONCURRENCY = int(os.getenv('DETECT_MAX_CONCURRENCY', str(BATCH_WORKERS)))
+DETECT_QUEUE_TIMEOUT = float(os.getenv('DETECT_QUEUE_TIMEOUT', '2'))
+
+# Background uploads: worker threads, queue capacity, attempts per image and
+# the directory where queued images are spooled until Firestore has them
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', '2'))
+UPLOAD_QUEUE_SIZE = int(os.getenv('UPLOAD_QUEUE_SIZE', '256'))
+UPLOAD_MAX_ATTEMPTS = int(os.getenv('UPLOAD_MAX_ATTEMPTS', '5'))
+UPLOAD_SPOOL_DIR = os.getenv('UPLOAD_SPOOL_DIR', 'upload_spool')
+
+# Where uploads go: firebase, local (LOCAL_STORAGE_DIR) or memory.
+# STORAGE_CACHE_DIR keeps the most recent uploads on local disk as a read cache.
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'firebase')
+LOCAL_STORAGE_DIR = os.getenv('LOCAL_STORAGE_DIR', 'local_storage')
+STORAGE_CACHE_DIR = os.getenv('STORAGE_CACHE_DIR', '')
+STORAGE_CACHE_ENTRIES = int(os.getenv('STORAGE_CACHE_ENTRIES', '500'))
+
+# FaceProcessors built and warmed up per process before /api/ready turns green,
+# one per request thread
+WARMUP_PROCESSORS = int(os.getenv('WARMUP_PROCESSORS', os.getenv('WEB_THREADS', '4')))
+
+# Firebase is initialized lazily, once per process (after gunicorn forks)
+firebase_lock = threading.Lock()
+firebase_state = {'pid': None, 'initialized': False}
+
+
+def ensure_firebase():
+    """Initialize Firebase in the current process on first use"""
+    pid = os.getpid()
+    if firebase_state['pid'] != pid:
+        with firebase_lock:
+            if firebase_state['pid'] != pid:
+                firebase_state['initialized'] = init_firebase()
+                firebase_state['pid'] = pid
+    return firebase_state['initialized']
+
+
+def init_detector(buffers):
+    """Build the configured detector engine, falling back to the Haar cascade"""
+    if DETECTOR_ENGINE != 'haar':
+        try:
+            detector = create_detector(
+                DETECTOR_ENGINE,
+                buffers=buffers,
+                yunet_model=YUNET_MODEL_PATH,
+                ssd_prototxt=SSD_PROTOTXT_PATH,
+                ssd_model=SSD_MODEL_PATH,
+                score_threshold=DNN_SCORE_THRESHOLD
+            )
+            logger.info(f'✓ {detector.name} detector loaded')
+            return detector
+        except Exception as e:
+            logger.error(f'{DETECTOR_ENGINE} detector unavailable ({e}), falling back to Haar cascade')
+    cascade = init_cascade()
+    if cascade is None:
+        return None
+    return create_detector('haar', cascade, buffers)
 
 
 class FaceProcessor:
     """Handle face detection, cropping, and enhancement"""
     
-    def __init__(self, cascade_classifier):
-        self.cascade = cascade_classifier
+    def __init__(self, detector, detection_max_dim=DETECTION_MAX_DIM):
+        # Detector engine (see init_detector) and its scratch buffers, which the
+        # crop/LAB/resize outputs reuse across requests as well
+        self.detector = detector
+        self.buffers = detector.buffers
+        self._embedder = None
+        self.detection_max_dim = detection_max_dim
         self.face_size = (224, 224)  # Standard size for face recognition models
+        # CLAHE (Contrast Limited Adaptive Histogram Equalization), created once
+        self.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
     
     def detect_faces(self, image_array):
-        """Detect faces in image using Haar Cascade with optimized parameters"""
-        gray = cv2.cvtColor(image_array, cv2.COLOR_BGR2GRAY)
-        
-        # Apply histogram equalization to improve detection in poor lighting
-        gray_eq = cv2.equalizeHist(gray)
-        
-        # Try detection with equalized image first
-        faces = self.cascade.detectMultiScale(
-            gray_eq, 
-            scaleFactor=1.1,      # More sensitive
-            minNeighbors=4,        # More sensitive
-            minSize=(30, 30),      # Allow smaller faces
-            maxSize=(400, 400)     # Reasonable max
-        )
-        
-        # If no faces found, try original gray image with even more sensitivity
-        if len(faces) == 0:
-            faces = self.cascade.detectMultiScale(
-                gray,
-                scaleFactor=1.05,    # Even more sensitive
-                minNeighbors=3,      # Less strict
-                minSize=(20, 20),    # Allow very small faces
-                maxSize=(500, 500)   # Larger max
-            )
-        
-        return faces
+        """Detect faces with the configured engine (DETECTOR_ENGINE: tiered Haar, YuNet or SSD)"""
+        # Haar runs the live tiers over one shared scan; the DNN engines ignore the tiers
+        detection = self.detector.detect(image_array, LIVE_TIERS, self.detection_max_dim)
+        record_tier(detection.tier and detection.tier.name)
+        return detection.faces
+    
+    def detect(self, image_array, tiers=CASCADE_TIERS):
+        """Run the full fallback chain and report which tier found the faces"""
+        return self.detector.detect(image_array, tiers, self.detection_max_dim)
     
     def crop_face(self, image_array, face_rect):
         """Crop and enhance face region with better padding"""
@@ -156,19 +207,20 @@ class FaceProcessor:
             raise ValueError("Invalid face crop dimensions")
         
         # Resize to standard size with high quality
-        face_resized = cv2.resize(face_crop, self.face_size, interpolation=cv2.INTER_CUBIC)
+        size = (self.face_size[1], self.face_size[0])
+        face_resized = cv2.resize(face_crop, self.face_size, dst=self.buffers.get('face', size + (3,)),
+                                  interpolation=cv2.INTER_CUBIC)
         
         # Enhance contrast with histogram equalization (better than lab)
         # Convert to LAB color space for better equalization
-        lab = cv2.cvtColor(face_resized, cv2.COLOR_BGR2LAB)
-        l, a, b = cv2.split(lab)
+        lab = cv2.cvtColor(face_resized, cv2.COLOR_BGR2LAB, dst=self.buffers.get('lab', size + (3,)))
+        l = cv2.extractChannel(lab, 0, dst=self.buffers.get('lab_l', size))
         
-        # Apply CLAHE (Contrast Limited Adaptive Histogram Equalization)
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        l = clahe.apply(l)
+        # Apply CLAHE on the lightness channel only
+        l = self.clahe.apply(l, dst=self.buffers.get('lab_l_eq', size))
         
-        lab = cv2.merge([l, a, b])
-        enhanced = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
+        lab = cv2.insertChannel(l, lab, 0)
+        enhanced = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)  # Fresh array - returned to the caller
         
         return enhanced, (x1, y1, x2, y2)
     
@@ -199,45 +251,591 @@ class FaceProcessor:
                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 136), 2)
         
         return image_copy
+    
+    def draw_preview(self, image_array, faces, max_dim):
+        """Downscale first, then draw the bounding boxes on the small copy"""
+        height, width = image_array.shape[:2]
+        if max(height, width) <= max_dim:
+            return self.draw_bounding_box(image_array, faces)
+        
+        scale = max_dim / max(height, width)
+        preview = cv2.resize(image_array, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+        scaled_faces = [tuple(int(v * scale) for v in face) for face in faces]
+        return self.draw_bounding_box(preview, scaled_faces)
+    
+    @property
+    def embedder(self):
+        """Face embedder of this processor, created on first use (None if unavailable)"""
+        if self._embedder is None:
+            try:
+                self._embedder = create_embedder(EMBEDDING_ENGINE, SFACE_MODEL_PATH)
+            except Exception as e:
+                logger.error(f'{EMBEDDING_ENGINE} embedder unavailable: {e}')
+        return self._embedder
+    
+    def warm_up(self):
+        """Run one dummy detection and crop so the first request pays no setup cost"""
+        frame = np.zeros((480, 640, 3), dtype=np.uint8)
+        self.detect(frame)
+        self.detect_faces(frame)
+        crop, _ = self.crop_face(frame, (240, 160, 160, 160))
+        if self.embedder is not None:
+            self.embedder.embed(crop)
 
 
-# Initialize face processor
-face_processor = FaceProcessor(cascade) if cascade else None
+class FaceProcessorPool:
+    """
+    One FaceProcessor per serving thread.
+    
+    CascadeClassifier and the scratch buffers are not thread-safe, so every
+    thread (gunicorn gthread workers, batch pool workers) gets its own
+    cascade, CLAHE object and buffers, and reuses them for all its requests.
+    Processors built ahead of time by prewarm() are handed out first.
+    """
+    
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._spares = []
+        self.size = 0
+        self.engine = None  # Detector engine actually in use (after any fallback)
+    
+    def _create(self):
+        detector = init_detector(ScratchBuffers())
+        if detector is None:
+            return None
+        with self._lock:
+            self.size += 1
+            self.engine = detector.name
+        return FaceProcessor(detector)
+    
+    def prewarm(self, count):
+        """Build and warm up processors until `count` exist"""
+        while self.size < count:
+            processor = self._create()
+            if processor is None:
+                return False
+            processor.warm_up()
+            with self._lock:
+                self._spares.append(processor)
+        return self.size > 0
+    
+    def get(self):
+        """Return the FaceProcessor owned by the current thread"""
+        processor = getattr(self._local, 'processor', None)
+        if processor is None:
+            with self._lock:
+                processor = self._spares.pop() if self._spares else None
+            if processor is None:
+                processor = self._create()
+                if processor is None:
+                    return None
+                logger.info(f'✓ FaceProcessor created for {threading.current_thread().name} (pool size: {self.size})')
+            self._local.processor = processor
+        return processor
+
+
+face_processor_pool = FaceProcessorPool()
+
+batch_pool = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='batch')
+
 
+def get_face_processor():
+    """Return the FaceProcessor owned by the current thread"""
+    return face_processor_pool.get()
 
-def upload_to_firebase(image_data, student_name, student_id, position):
-    """Upload processed image to Firebase Storage"""
+
+face_index_state = {'live': None, 'error': None}
+face_index_lock = threading.Lock()
+
+
+def load_face_index():
+    """Replay the enrollment log into a LiveFaceIndex (None if unusable)"""
     try:
-        if not firebase_initialized:
-            logger.warning('Firebase not initialized, skipping upload')
-            return None
-        
-        bucket = storage.bucket()
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        blob_path = f"face_dataset/{student_name}/{student_id}_{position}_{timestamp}.jpg"
-        
-        blob = bucket.blob(blob_path)
-        blob.upload_from_string(image_data, content_type='image/jpeg')
-        
-        logger.info(f'✓ Uploaded to Firebase: {blob_path}')
-        
-        # Save metadata to Firestore
-        db = firestore.client()
-        db.collection('students').document(student_id).collection('images').add({
-            'fileName': f'{student_id}_{position}_{timestamp}.jpg',
-            'position': position,
-            'uploadedAt': datetime.now(),
-            'path': blob_path,
-            'studentName': student_name,
-            'studentId': student_id
-        })
-        
-        logger.info('✓ Metadata saved to Firestore')
-        return blob_path
-        
+        dim = create_embedder(EMBEDDING_ENGINE, SFACE_MODEL_PATH).dim
+        nprobe = IVF_NPROBE if IDENTIFY_SEARCH == 'ivf' else 0
+        live = LiveFaceIndex(EmbeddingStore(FACE_STORE_PATH, dim, EMBEDDING_ENGINE, nprobe=nprobe))
     except Exception as e:
-        logger.error(f'Firebase upload failed: {e}')
+        logger.error(f'Face index unavailable: {e}')
+        face_index_state['error'] = str(e)
         return None
+    logger.info(f'✓ Face index loaded: {live.index.students} students, {len(live.index)} embeddings')
+    return live
+
+
+def get_live_index():
+    """The LiveFaceIndex of this process, loaded on first use"""
+    if face_index_state['live'] is None and face_index_state['error'] is None:
+        with face_index_lock:
+            if face_index_state['live'] is None and face_index_state['error'] is None:
+                face_index_state['live'] = load_face_index()
+    return face_index_state['live']
+
+
+def get_face_index():
+    """Up-to-date enrolled embeddings, including students enrolled since the last call"""
+    live = get_live_index()
+    return live.current() if live is not None else None
+
+
+def enroll_image(image_data, student_id, student_name, position):
+    """Embed an uploaded face crop and append it to the enrollment log"""
+    live = get_live_index()
+    embedder = get_face_processor().embedder
+    if live is None or embedder is None:
+        return False
+    image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return False
+    embedding = embed_faces(embedder, [image])[0]
+    with time_stage('enroll'):
+        live.enroll(student_id, position, embedding, student_name)
+    return True
+
+
+def crop_source_image(image, detection):
+    """Image the faces are cropped from: equalized when the hitting tier asks for it"""
+    if detection.tier is not None and detection.tier.crop_equalized:
+        gray_eq = cv2.equalizeHist(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+        return cv2.cvtColor(gray_eq, cv2.COLOR_GRAY2BGR)
+    return image
+
+
+def map_bounded(fn, items, limit, ordered=True):
+    """
+    Run fn over items on the batch pool with at most `limit` calls in flight.
+    Results are yielded in input order, or as soon as they finish when
+    ordered is False. Calls not started yet are cancelled if the consumer stops.
+    """
+    pending = deque()
+    items = iter(items)
+    try:
+        for item in items:
+            if len(pending) >= limit:
+                if ordered:
+                    yield pending.popleft().result()
+                else:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        pending.remove(future)
+                        yield future.result()
+            pending.append(batch_pool.submit(fn, item))
+        while pending:
+            if ordered:
+                yield pending.popleft().result()
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+class LiveSession:
+    """Face tracking state of one live camera overlay client"""
+    
+    def __init__(self):
+        self.tracker = FaceTracker(LIVE_TIERS, DETECTION_MAX_DIM, LIVE_FULL_SEARCH_INTERVAL)
+        self.lock = threading.Lock()  # Frames of one session are tracked in order
+        self.last_seen = time.monotonic()
+
+
+class FrameGate:
+    """
+    Latest-frame-wins admission for the frames of one overlay client.
+    
+    Only one frame per client is detected at a time. A frame waiting for its
+    turn is superseded as soon as a newer frame of the same client arrives.
+    """
+    
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.latest = 0  # Ticket of the newest frame received
+        self.busy = False
+        self.last_seen = time.monotonic()
+    
+    def enter(self, timeout):
+        """
+        Wait for this client's previous frame to finish.
+        
+        Returns:
+            str: 'admitted', 'superseded' or 'timeout'
+        """
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            self.latest += 1
+            ticket = self.latest
+            self.cond.notify_all()  # Older waiting frames are now superseded
+            while self.busy and ticket == self.latest:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return 'timeout'
+                self.cond.wait(remaining)
+            if ticket != self.latest:
+                return 'superseded'
+            self.busy = True
+            return 'admitted'
+    
+    def leave(self):
+        with self.cond:
+            self.busy = False
+            self.cond.notify_all()
+
+
+live_sessions = {}
+live_sessions_lock = threading.Lock()
+frame_gates = {}
+frame_gates_lock = threading.Lock()
+detect_slots = threading.BoundedSemaphore(DETECT_MAX_CONCURRENCY)
+
+
+def get_client_state(store, store_lock, key, factory):
+    """Return the per-client state for key, creating it and dropping idle clients as needed"""
+    now = time.monotonic()
+    with store_lock:
+        state = store.get(key)
+        if state is None:
+            # Drop state of clients that stopped sending frames
+            expired = [k for k, value in store.items() if now - value.last_seen > LIVE_SESSION_TTL]
+            for k in expired:
+                del store[k]
+            if len(store) >= LIVE_MAX_SESSIONS:
+                oldest = min(store, key=lambda k: store[k].last_seen)
+                del store[oldest]
+            state = store[key] = factory()
+        state.last_seen = now
+    return state
+
+
+def get_live_session(session_id):
+    """Return the live session for a client id, creating it on first use"""
+    return get_client_state(live_sessions, live_sessions_lock, session_id, LiveSession)
+
+
+def get_frame_gate(client_id):
+    """Return the frame gate for a client id, creating it on first use"""
+    return get_client_state(frame_gates, frame_gates_lock, client_id, FrameGate)
+
+
+# Visualization modes for /api/process-image:
+# none    - no visualization (default)
+# boxes   - face coordinates only, for drawing on the client
+# preview - downscaled JPEG with bounding boxes
+# full    - full size JPEG with bounding boxes
+VISUALIZATION_MODES = ('none', 'boxes', 'preview', 'full')
+
+
+def parse_visualization_mode(value):
+    """Normalize the "visualization" request field to one of VISUALIZATION_MODES"""
+    if value is True or value in ('1', 'true'):
+        return 'preview'
+    return value if value in VISUALIZATION_MODES else 'none'
+
+
+# Content types accepted as a raw encoded image body
+BINARY_IMAGE_TYPES = ('image/jpeg', 'image/png', 'application/octet-stream')
+
+
+def decode_base64_image(image_base64):
+    """Decode a base64 string or data URL into raw image bytes"""
+    with time_stage('base64_decode'):
+        return base64.b64decode(image_base64.split(',')[1] if ',' in image_base64 else image_base64)
+
+
+def read_upload_buffer(file_storage):
+    """Return the bytes of an uploaded file, reusing the in-memory buffer when possible"""
+    stream = file_storage.stream
+    if hasattr(stream, 'getbuffer'):
+        # Small uploads are spooled into a BytesIO - view it without copying
+        return stream.getbuffer()
+    return stream.read()
+
+
+def read_image_payload():
+    """
+    Extract the encoded image and the form fields from the current request.
+
+    Supported request formats:
+    - Raw body (Content-Type: image/jpeg): fields in the query string
+    - Multipart (multipart/form-data): file part "image", fields as form values
+    - JSON: base64 "image" plus fields in the body (legacy format)
+
+    Returns:
+        tuple: (uint8 numpy buffer or None, mapping of request fields)
+    """
+    mimetype = request.mimetype
+
+    if mimetype in BINARY_IMAGE_TYPES:
+        body = request.get_data(cache=False)
+        buffer = np.frombuffer(body, np.uint8) if body else None
+        return buffer, request.args
+
+    if mimetype == 'multipart/form-data':
+        upload = request.files.get('image')
+        body = read_upload_buffer(upload) if upload else None
+        buffer = np.frombuffer(body, np.uint8) if body is not None and len(body) else None
+        return buffer, request.form
+
+    data = request.get_json(silent=True) or {}
+    image_base64 = data.get('image')
+    if not image_base64:
+        return None, data
+    return np.frombuffer(decode_base64_image(image_base64), np.uint8), data
+
+
+storage_backend = create_storage(STORAGE_BACKEND, LOCAL_STORAGE_DIR, STORAGE_CACHE_DIR or None, STORAGE_CACHE_ENTRIES)
+
+
+def storage_ready():
+    """Whether uploads can be accepted (Firebase needs its SDK initialized)"""
+    return STORAGE_BACKEND != 'firebase' or ensure_firebase()
+
+
+upload_queue = UploadQueue(
+    storage_backend,
+    UPLOAD_SPOOL_DIR,
+    workers=UPLOAD_WORKERS,
+    max_size=UPLOAD_QUEUE_SIZE,
+    max_attempts=UPLOAD_MAX_ATTEMPTS
+)
+
+
+class WarmUp:
+    """
+    Per-process warm-up behind /api/ready.
+    
+    Initializes Firebase, builds WARMUP_PROCESSORS FaceProcessors (each runs
+    one dummy detection) and starts the upload workers. Runs once per process,
+    in the background, after gunicorn has forked the worker.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        self.state = 'pending'  # pending -> warming -> ready | failed
+        self.error = None
+        self.duration_ms = None
+        self.pid = os.getpid()
+    
+    @property
+    def ready(self):
+        return self.state == 'ready'
+    
+    def start(self, background=True):
+        """Start warming up unless this process already did"""
+        with self._lock:
+            if self.pid != os.getpid():
+                self.reset()
+            if self.state != 'pending':
+                return
+            self.state = 'warming'
+        if background:
+            threading.Thread(target=self._run, name='warm-up', daemon=True).start()
+        else:
+            self._run()
+    
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            if STORAGE_BACKEND == 'firebase':
+                ensure_firebase()
+            if not face_processor_pool.prewarm(max(1, WARMUP_PROCESSORS)):
+                raise RuntimeError('Face detector could not be loaded')
+            get_face_index()
+            if storage_ready():
+                upload_queue.start()
+            self.duration_ms = round((time.perf_counter() - start) * 1000, 1)
+            self.state = 'ready'
+            logger.info(f'✓ Warm-up finished in {self.duration_ms} ms ({face_processor_pool.size} face processors)')
+        except Exception as e:
+            self.error = str(e)
+            self.state = 'failed'
+            logger.error(f'Warm-up failed: {e}')
+    
+    def to_dict(self):
+        return {
+            'ready': self.ready,
+            'state': self.state,
+            'error': self.error,
+            'warmup_ms': self.duration_ms,
+            'face_processors': face_processor_pool.size,
+            'detector': face_processor_pool.engine,
+            'firebase': firebase_state['initialized']
+        }
+
+
+warm_up = WarmUp()
+
+
+def reset_after_fork():
+    """
+    Drop per-process state inherited from the parent (gunicorn --preload):
+    threads do not survive fork() and SDK clients/gRPC channels must not be
+    shared between processes. The child warms up on its own.
+    """
+    global batch_pool
+    batch_pool = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='batch')
+    storage_backend.after_fork()
+    upload_queue.after_fork()
+    face_index_state.update(live=None, error=None)
+    warm_up.reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_after_fork)
+
+
+def process_face_image(nparr, student_name, student_id, position, visualization='none'):
+    """
+    Detect, crop and enhance the main face of an encoded image.
+    Safe to call from worker threads (uses the thread's own FaceProcessor).
+    The bounding box visualization is only rendered when requested
+    (see VISUALIZATION_MODES).
+    
+    Returns:
+        tuple: (response dict, HTTP status code)
+    """
+    processor = get_face_processor()
+    
+    # Decode image
+    logger.info(f'Processing image for {student_name} (ID: {student_id}, Pos: {position})')
+    
+    with time_stage('imdecode'):
+        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    
+    if image is None:
+        return {
+            'success': False,
+            'error': 'Failed to decode image'
+        }, 400
+    
+    logger.info(f'Image decoded: {image.shape}')
+    
+    # Detect faces on a downscaled proxy - all fallback tiers share a single
+    # cascade scan and the boxes come back in full resolution coordinates
+    detection = processor.detect(image)
+    faces = detection.faces
+    record_tier(detection.tier and detection.tier.name)
+    
+    if len(faces) == 0:
+        return {
+            'success': False,
+            'error': 'No faces detected. Try: better lighting, closer face, or face straight to camera',
+            'faces_detected': 0,
+            'suggestion': 'Ensure good lighting and position face clearly in frame'
+        }, 400
+    
+    logger.info(f'Faces detected: {len(faces)} (tier: {detection.tier.name})')
+    image = crop_source_image(image, detection)
+    
+    # Get largest face (main subject)
+    largest_face = max(faces, key=lambda f: f[2] * f[3])
+    
+    try:
+        # Crop and enhance face
+        with time_stage('crop_clahe'):
+            cropped_face, coords = processor.crop_face(image, largest_face)
+    except Exception as e:
+        logger.error(f'Cropping error: {e}')
+        return {
+            'success': False,
+            'error': f'Failed to crop face: {str(e)}'
+        }, 400
+    
+    # Encode cropped face to base64 with lower quality for speed
+    with time_stage('imencode'):
+        _, cropped_encoded = cv2.imencode('.jpg', cropped_face, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    with time_stage('base64_encode'):
+        cropped_base64 = base64.b64encode(cropped_encoded).decode()
+    
+    # DON'T upload to Firebase here - only process and return
+    # Upload happens when user clicks "Upload" button
+    
+    logger.info(f'✓ Image processing complete for {student_name}')
+    
+    result = {
+        'success': True,
+        'faces_detected': len(faces),
+        'detection_tier': detection.tier.name,
+        'processed_image': f'data:image/jpeg;base64,{cropped_base64}',
+        'message': f'✓ Detected and processed {len(faces)} face(s). Main subject cropped and enhanced.'
+    }
+    
+    # Create visualization with bounding boxes only when the client asks for it
+    if visualization == 'boxes':
+        result['faces'] = [
+            {'x': int(x), 'y': int(y), 'w': int(w), 'h': int(h)}
+            for x, y, w, h in faces
+        ]
+        result['image_size'] = {'width': image.shape[1], 'height': image.shape[0]}
+    elif visualization == 'preview':
+        with time_stage('visualization'):
+            preview = processor.draw_preview(image, faces, VISUALIZATION_PREVIEW_DIM)
+            _, viz_encoded = cv2.imencode('.jpg', preview, [cv2.IMWRITE_JPEG_QUALITY, VISUALIZATION_PREVIEW_QUALITY])
+            result['visualization'] = f'data:image/jpeg;base64,{base64.b64encode(viz_encoded).decode()}'
+    elif visualization == 'full':
+        with time_stage('visualization'):
+            full = processor.draw_bounding_box(image, faces)
+            _, viz_encoded = cv2.imencode('.jpg', full)
+            result['visualization'] = f'data:image/jpeg;base64,{base64.b64encode(viz_encoded).decode()}'
+    
+    return result, 200
+
+
+# Request metrics: endpoint label = Flask view function name
+@app.before_request
+def start_request_metrics():
+    g.metrics_endpoint = request.endpoint or 'unmatched'
+    g.metrics_start = time.perf_counter()
+    metrics.set_endpoint(g.metrics_endpoint)
+    metrics.IN_FLIGHT.inc(g.metrics_endpoint)
+
+
+@app.after_request
+def record_response_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    endpoint = g.pop('metrics_endpoint', None)
+    if endpoint is None:
+        return
+    # Streamed responses are counted when the handler returns, not when the stream ends
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - g.pop('metrics_start'), endpoint)
+    metrics.REQUESTS.inc(endpoint, g.pop('metrics_status', 500))
+    metrics.IN_FLIGHT.dec(endpoint)
+    metrics.set_endpoint(None)
+
+
+def upload_queue_depths():
+    stats = upload_queue.stats()
+    return {'queued': stats['queued'], 'pending_metadata': stats['pending_metadata']}
+
+
+metrics.REGISTRY.register(metrics.Gauge(
+    'facerec_upload_queue', 'Upload jobs waiting for a worker or for their metadata write', ['queue'],
+    function=upload_queue_depths))
+metrics.REGISTRY.register(metrics.Gauge(
+    'facerec_upload_jobs', 'Tracked upload jobs by state', ['state'],
+    function=lambda: upload_queue.stats()['jobs']))
+metrics.REGISTRY.register(metrics.Gauge(
+    'facerec_live_sessions', 'Live overlay sessions being tracked',
+    function=lambda: {(): len(live_sessions)}))
+metrics.REGISTRY.register(metrics.Gauge(
+    'facerec_face_processors', 'FaceProcessors built in this process',
+    function=lambda: {(): face_processor_pool.size}))
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics of this process"""
+    return Response(metrics.REGISTRY.render(), mimetype=None, content_type=metrics.CONTENT_TYPE)
 
 
 @app.route('/api/health', methods=['GET'])
@@ -245,12 +843,25 @@ def health():
     """Health check endpoint"""
     return jsonify({
         'status': 'ok',
-        'firebase': firebase_initialized,
-        'cascade': cascade is not None,
+        'firebase': firebase_state['initialized'],
+        'storage': storage_backend.name,
+        'ready': warm_up.ready,
+        'face_processors': face_processor_pool.size,
+        'uploads': upload_queue.stats(),
         'timestamp': datetime.now().isoformat()
     })
 
 
+@app.route('/api/ready', methods=['GET'])
+def ready():
+    """
+    Readiness check: 200 once this process has warmed up, 503 until then.
+    The first call starts the warm-up if nothing else has.
+    """
+    warm_up.start()
+    return jsonify(warm_up.to_dict()), 200 if warm_up.ready else 503
+
+
 @app.route('/api/process-image', methods=['POST'])
 def process_image():
     """
@@ -262,129 +873,41 @@ def process_image():
         "studentId": "123456",
         "studentName": "John Doe",
         "className": "10A",
-        "position": "front"  # or "side", "angle", etc.
+        "position": "front",  # or "side", "angle", etc.
+        "visualization": "none"  # or "boxes", "preview", "full"
     }
     
+    The image can also be sent as a raw image/jpeg body (fields in the
+    query string) or as the "image" part of a multipart/form-data upload.
+    
     Response:
     {
         "success": true,
         "faces_detected": 1,
         "processed_image": "base64_encoded_cropped_face",
-        "cropped_face": "base64_encoded_cropped_face",
-        "visualization": "base64_encoded_with_bounding_boxes",
-        "firebase_path": "gs://bucket/..."
+        "visualization": "base64_encoded_with_bounding_boxes",  # "preview"/"full" only
+        "faces": [{"x": 100, "y": 150, "w": 200, "h": 250}],  # "boxes" only
+        "image_size": {"width": 1280, "height": 720}  # "boxes" only
     }
     """
     try:
-        data = request.json
+        nparr, data = read_image_payload()
         
         # Extract request data
-        image_base64 = data.get('image')
         student_id = data.get('studentId')
         student_name = data.get('studentName')
         class_name = data.get('className')
         position = data.get('position', 'front')
         
-        if not all([image_base64, student_id, student_name, class_name]):
+        if nparr is None or not all([student_id, student_name, class_name]):
             return jsonify({
                 'success': False,
                 'error': 'Missing required fields'
             }), 400
         
-        # Decode base64 image
-        logger.info(f'Processing image for {student_name} (ID: {student_id}, Pos: {position})')
-        
-        image_data = base64.b64decode(image_base64.split(',')[1] if ',' in image_base64 else image_base64)
-        nparr = np.frombuffer(image_data, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if image is None:
-            return jsonify({
-                'success': False,
-                'error': 'Failed to decode image'
-            }), 400
-        
-        logger.info(f'Image decoded: {image.shape}')
-        
-        # Optimize image for faster processing (resize to max 720p)
-        height, width = image.shape[:2]
-        max_dim = 720
-        if max(height, width) > max_dim:
-            scale = max_dim / max(height, width)
-            image = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_LINEAR)
-            logger.info(f'Image resized to: {image.shape}')
-        
-        # Detect faces
-        faces = face_processor.detect_faces(image)
-        logger.info(f'Faces detected: {len(faces)}')
-        
-        # Fallback: if no faces detected, try with histogram equalization
-        if len(faces) == 0:
-            logger.info('No faces detected, applying histogram equalization...')
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            gray_eq = cv2.equalizeHist(gray)
-            image_eq = cv2.cvtColor(gray_eq, cv2.COLOR_GRAY2BGR)
-            
-            faces = face_processor.detect_faces(image_eq)
-            if len(faces) > 0:
-                image = image_eq  # Use equalized image for subsequent processing
-                logger.info(f'Faces detected after equalization: {len(faces)}')
-        
-        # Final fallback: try more aggressive detection parameters directly
-        if len(faces) == 0:
-            logger.info('Still no faces, trying aggressive detection...')
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            faces = face_processor.cascade.detectMultiScale(
-                gray,
-                scaleFactor=1.05,    # Maximum sensitivity
-                minNeighbors=2,      # Minimum threshold
-                minSize=(15, 15),    # Very small faces
-                maxSize=(700, 700)   # Large faces
-            )
-            logger.info(f'Aggressive detection result: {len(faces)} faces')
-        
-        if len(faces) == 0:
-            return jsonify({
-                'success': False,
-                'error': 'No faces detected. Try: better lighting, closer face, or face straight to camera',
-                'faces_detected': 0,
-                'suggestion': 'Ensure good lighting and position face clearly in frame'
-            }), 400
-        
-        # Get largest face (main subject)
-        largest_face = max(faces, key=lambda f: f[2] * f[3])
-        
-        try:
-            # Crop and enhance face
-            cropped_face, coords = face_processor.crop_face(image, largest_face)
-        except Exception as e:
-            logger.error(f'Cropping error: {e}')
-            return jsonify({
-                'success': False,
-                'error': f'Failed to crop face: {str(e)}'
-            }), 400
-        
-        # Encode cropped face to base64 with lower quality for speed
-        _, cropped_encoded = cv2.imencode('.jpg', cropped_face, [cv2.IMWRITE_JPEG_QUALITY, 85])
-        cropped_base64 = base64.b64encode(cropped_encoded).decode()
-        
-        # Create visualization with bounding boxes
-        visualization = face_processor.draw_bounding_box(image, faces)
-        _, viz_encoded = cv2.imencode('.jpg', visualization)
-        viz_base64 = base64.b64encode(viz_encoded).decode()
-        
-        # DON'T upload to Firebase here - only process and return
-        # Upload happens when user clicks "Upload" button
-        
-        logger.info(f'✓ Image processing complete for {student_name}')
-        
-        return jsonify({
-            'success': True,
-            'faces_detected': len(faces),
-            'processed_image': f'data:image/jpeg;base64,{cropped_base64}',
-            'visualization': f'data:image/jpeg;base64,{viz_base64}',
-            'message': f'✓ Detected and processed {len(faces)} face(s). Main subject cropped and enhanced.'
-        }), 200
+        visualization = parse_visualization_mode(data.get('visualization'))
+        payload, status = process_face_image(nparr, student_name, student_id, position, visualization)
+        return jsonify(payload), status
         
     except Exception as e:
         logger.error(f'Image processing error: {str(e)}', exc_info=True)
@@ -413,8 +936,15 @@ def batch_process():
         ],
         "studentId": "123456",
         "studentName": "John Doe",
-        "className": "10A"
+        "className": "10A",
+        "visualization": "none",  # same modes as /api/process-image
+        "stream": false
     }
+    
+    With "stream": true (or ?stream=1, or Accept: application/x-ndjson) the
+    response is NDJSON: one line per image as soon as it finishes
+    ({"type": "result", "index": 0, "position": ..., "status": ..., "data": ...}),
+    then a final {"type": "summary", ...} line.
     """
     try:
         data = request.json
@@ -422,6 +952,7 @@ def batch_process():
         student_id = data.get('studentId')
         student_name = data.get('studentName')
         class_name = data.get('className')
+        visualization = parse_visualization_mode(data.get('visualization'))
         
         if not images or not all([student_id, student_name, class_name]):
             return jsonify({
@@ -429,40 +960,57 @@ def batch_process():
                 'error': 'Missing required fields'
             }), 400
         
-        results = []
-        
-        for idx, img_data in enumerate(images):
+        def process_batch_item(item):
+            idx, img_data = item
+            position = img_data.get('position', f'pos_{idx}')
             try:
                 image_base64 = img_data.get('image')
-                position = img_data.get('position', f'pos_{idx}')
-                
-                # Create synthetic request for process_image
-                synthetic_request = {
-                    'image': image_base64,
-                    'studentId': student_id,
-                    'studentName': student_name,
-                    'className': class_name,
-                    'position': position
+                if not image_base64:
+                    payload, status = {'success': False, 'error': 'Missing required fields'}, 400
+                else:
+                    # Runs on a batch pool thread - label its stages with this endpoint
+                    with metrics.endpoint_scope('batch_process'):
+                        nparr = np.frombuffer(decode_base64_image(image_base64), np.uint8)
+                        payload, status = process_face_image(nparr, student_name, student_id, position, visualization)
+                return idx, {
+                    'position': position,
+                    'status': 'success' if status == 200 else 'failed',
+                    'data': payload
                 }
-                
-                # Mock request context
-                with app.test_request_context(
-                    json=synthetic_request,
-                    method='POST'
-                ):
-                    response = process_image()
-                    results.append({
-                        'position': position,
-                        'status': 'success' if response[1] == 200 else 'failed',
-                        'data': response[0].json if hasattr(response[0], 'json') else response[0]
-                    })
-                    
             except Exception as e:
-                results.append({
+                logger.error(f'Batch item {idx} failed: {e}')
+                return idx, {
                     'position': position,
                     'status': 'failed',
                     'error': str(e)
-                })
+                }
+        
+        in_flight = max(1, min(BATCH_MAX_IN_FLIGHT, len(images)))
+        
+        stream = (
+            data.get('stream') is True
+            or request.args.get('stream') in ('1', 'true')
+            or request.accept_mimetypes.best == 'application/x-ndjson'
+        )
+        if stream:
+            def generate():
+                # Emit each result as it finishes - only images in flight are held in memory
+                successful = 0
+                for idx, result in map_bounded(process_batch_item, enumerate(images), in_flight, ordered=False):
+                    successful += result['status'] == 'success'
+                    yield json.dumps({'type': 'result', 'index': idx, **result}) + '\n'
+                yield json.dumps({
+                    'type': 'summary',
+                    'success': True,
+                    'total_processed': len(images),
+                    'successful': successful,
+                    'failed': len(images) - successful
+                }) + '\n'
+            
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        
+        # Images run concurrently on the worker pool, results keep input order
+        results = [result for _, result in map_bounded(process_batch_item, enumerate(images), in_flight)]
         
         successful = sum(1 for r in results if r['status'] == 'success')
         
@@ -485,7 +1033,11 @@ def batch_process():
 @app.route('/api/upload-image', methods=['POST'])
 def upload_image():
     """
-    Upload a single image to Firebase Storage
+    Queue a single image for upload to Firebase Storage
+    
+    The image is spooled to disk and uploaded in the background; the
+    Firestore metadata is written in batches. Poll /api/upload-status/<job_id>
+    for the result.
     
     Request:
     {
@@ -496,11 +1048,13 @@ def upload_image():
         "position": "front"
     }
     
-    Response:
+    Response (202):
     {
         "success": true,
-        "firebase_path": "gs://bucket/...",
-        "message": "Image uploaded successfully"
+        "job_id": "3f2a...",
+        "status": "queued",
+        "firebase_path": "face_dataset/...",
+        "message": "Image queued for upload"
     }
     """
     try:
@@ -520,28 +1074,43 @@ def upload_image():
         # Decode base64 image
         logger.info(f'Uploading image for {student_name} (ID: {student_id}, Pos: {position})')
         
-        # Handle data URL format
-        if ',' in image_base64:
-            image_base64 = image_base64.split(',')[1]
-        
-        image_data = base64.b64decode(image_base64)
-        
-        # Upload to Firebase
-        firebase_path = upload_to_firebase(image_data, student_name, student_id, position)
+        image_data = decode_base64_image(image_base64)
         
-        if not firebase_path:
+        if not storage_ready():
+            logger.warning('Firebase not initialized, skipping upload')
             return jsonify({
                 'success': False,
                 'error': 'Failed to upload image to Firebase'
             }), 500
         
-        logger.info(f'✓ Successfully uploaded: {firebase_path}')
+        # Queue for background upload - returns once the image is spooled to disk
+        try:
+            with time_stage('spool'):
+                job = upload_queue.submit(image_data, student_name, student_id, position)
+        except QueueFullError:
+            return jsonify({
+                'success': False,
+                'error': 'Upload queue is full, try again shortly'
+            }), 503, {'Retry-After': '5'}
+        
+        logger.info(f'✓ Upload queued: {job.blob_path} (job {job.id})')
+        
+        # Searchable by /api/identify right away - no index rebuild
+        enrolled = False
+        if ENROLL_ON_UPLOAD:
+            try:
+                enrolled = enroll_image(image_data, student_id, student_name, position)
+            except Exception as e:
+                logger.error(f'Enrollment of {student_id}/{position} failed: {e}')
         
         return jsonify({
             'success': True,
-            'firebase_path': firebase_path,
-            'message': f'Image uploaded successfully to {firebase_path}'
-        }), 200
+            'job_id': job.id,
+            'status': job.state,
+            'firebase_path': job.blob_path,
+            'enrolled': enrolled,
+            'message': f'Image queued for upload to {job.blob_path}'
+        }), 202
         
     except Exception as e:
         logger.error(f'Upload image error: {str(e)}', exc_info=True)
@@ -551,6 +1120,188 @@ def upload_image():
         }), 500
 
 
+@app.route('/api/upload-status/<job_id>', methods=['GET'])
+def upload_status(job_id):
+    """
+    Status of a queued upload
+    
+    Response:
+    {
+        "success": true,
+        "job": {"job_id": "3f2a...", "state": "done", "attempts": 1, ...}
+    }
+    
+    state: queued, uploading, writing_metadata, done or failed
+    """
+    job = upload_queue.status(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Unknown upload job'
+        }), 404
+    return jsonify({
+        'success': True,
+        'job': job
+    }), 200
+
+
+def identify_faces(nparr, k):
+    """
+    Detect every face of an encoded image and match all of them against the
+    enrolled embeddings with one matrix multiply.
+    
+    Returns:
+        tuple: (response dict, HTTP status code)
+    """
+    processor = get_face_processor()
+    embedder = processor.embedder
+    index = get_face_index()
+    if embedder is None or index is None:
+        return {'success': False, 'error': 'Face identification is not available'}, 503
+    
+    with time_stage('imdecode'):
+        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if image is None:
+        return {'success': False, 'error': 'Failed to decode image'}, 400
+    
+    detection = processor.detect(image)
+    faces = detection.faces
+    record_tier(detection.tier and detection.tier.name)
+    if len(faces) == 0:
+        return {'success': False, 'error': 'No faces detected', 'faces_detected': 0, 'matches': []}, 400
+    
+    source = crop_source_image(image, detection)
+    with time_stage('crop_clahe'):
+        crops = [processor.crop_face(source, face)[0] for face in faces]
+    embeddings = embed_faces(embedder, crops)
+    
+    matches = []
+    for face, candidates in zip(faces, index.search(embeddings, k)):
+        best_id, best_score = candidates[0] if candidates else (None, None)
+        identified = best_score is not None and best_score >= IDENTIFY_THRESHOLD
+        matches.append({
+            'face': {'x': int(face[0]), 'y': int(face[1]), 'w': int(face[2]), 'h': int(face[3])},
+            'studentId': best_id if identified else None,
+            'studentName': index.name(best_id) if identified else None,
+            'score': round(best_score, 4) if best_score is not None else None,
+            'candidates': [
+                {'studentId': sid, 'studentName': index.name(sid), 'score': round(score, 4)}
+                for sid, score in candidates
+            ]
+        })
+    
+    return {
+        'success': True,
+        'faces_detected': len(faces),
+        'enrolled_students': index.students,
+        'threshold': IDENTIFY_THRESHOLD,
+        'matches': matches
+    }, 200
+
+
+@app.route('/api/identify', methods=['POST'])
+def identify():
+    """
+    Identify the faces in an image against the enrolled students
+    
+    Request:
+    {
+        "image": "base64_encoded_image",
+        "k": 3  # optional: candidates per face (max IDENTIFY_MAX_CANDIDATES)
+    }
+    
+    A raw image/jpeg body or a multipart/form-data "image" part is also accepted.
+    
+    Response:
+    {
+        "success": true,
+        "faces_detected": 1,
+        "matches": [{
+            "face": {"x": 100, "y": 150, "w": 200, "h": 250},
+            "studentId": "2470006173",  # null below IDENTIFY_THRESHOLD
+            "studentName": "John Doe",
+            "score": 0.93,
+            "candidates": [{"studentId": "2470006173", "studentName": "John Doe", "score": 0.93}, ...]
+        }]
+    }
+    """
+    try:
+        nparr, data = read_image_payload()
+        if nparr is None:
+            return jsonify({
+                'success': False,
+                'error': 'Missing required fields'
+            }), 400
+        
+        try:
+            k = int(data.get('k', 1))
+        except (TypeError, ValueError):
+            k = 1
+        k = max(1, min(k, IDENTIFY_MAX_CANDIDATES))
+        
+        payload, status = identify_faces(nparr, k)
+        return jsonify(payload), status
+    
+    except Exception as e:
+        logger.error(f'Identification error: {str(e)}', exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/enrollments/<student_id>', methods=['DELETE'])
+def delete_enrollment(student_id):
+    """
+    Remove a student's embeddings from identification
+    
+    Query: ?position=front removes a single image, otherwise every image of the
+    student. The enrollment log gets a tombstone; dead records are dropped by
+    the next compaction.
+    """
+    live = get_live_index()
+    if live is None:
+        return jsonify({
+            'success': False,
+            'error': 'Face identification is not available'
+        }), 503
+    
+    position = request.args.get('position') or None
+    before = len(live.current())
+    index = live.unenroll(student_id, position)
+    removed = before - len(index)
+    logger.info(f'✓ Unenrolled {student_id} ({position or "all positions"}): {removed} embedding(s)')
+    
+    return jsonify({
+        'success': True,
+        'studentId': student_id,
+        'position': position,
+        'removed': removed
+    })
+
+
+def detect_frame(nparr, session_id=None):
+    """
+    Decode a live overlay frame and detect faces in it.
+    
+    Returns:
+        tuple: (faces or None if the frame could not be decoded, search mode or None)
+    """
+    with time_stage('imdecode'):
+        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if image is None:
+        return None, None
+    
+    # Detect faces (on a downscaled proxy, coordinates of the original image)
+    if session_id:
+        session = get_live_session(str(session_id)[:128])
+        with session.lock:
+            faces, mode, tier = session.tracker.update(get_face_processor().detector, image)
+        record_tier(tier and tier.name)
+        return faces, mode
+    return get_face_processor().detect_faces(image), None
+
+
 @app.route('/api/detect-faces', methods=['POST'])
 def detect_faces():
     """
@@ -563,47 +1314,87 @@ def detect_faces():
         "image": "base64_encoded_image"
     }
     
+    A raw image/jpeg body or a multipart/form-data "image" part is also accepted.
+    
+    Optional "sessionId" (field, query string or X-Session-Id header) enables
+    tracking: the server remembers the last face of that client and only
+    searches around it, with a full-frame search every LIVE_FULL_SEARCH_INTERVAL
+    frames or when the face is lost. Tracked frames return the tracked face only.
+    
+    Admission control: frames of a client identified by sessionId or X-Client-Id
+    are coalesced - a frame still waiting when a newer one arrives is answered
+    with "status": "superseded". Beyond DETECT_MAX_CONCURRENCY frames in
+    detection the request is shed with 429.
+    
     Response:
     {
         "success": true,
         "faces_detected": 1,
         "faces": [
             {"x": 100, "y": 150, "w": 200, "h": 250}
-        ]
+        ],
+        "search": "roi"  # with sessionId: "roi" or "full"
     }
+    
+    Boxes are mapped back to pixel coordinates of the uploaded image, not of
+    the DETECTION_MAX_DIM proxy detection runs on (older versions returned
+    coordinates of a 720px working copy).
     """
     try:
-        data = request.json
-        image_base64 = data.get('image')
+        nparr, data = read_image_payload()
+        session_id = data.get('sessionId') or request.headers.get('X-Session-Id')
+        client_id = session_id or request.headers.get('X-Client-Id')
         
-        if not image_base64:
+        if nparr is None:
             return jsonify({
                 'success': False,
                 'faces': [],
                 'faces_detected': 0
             }), 400
         
-        # Decode base64 image
-        image_data = base64.b64decode(image_base64.split(',')[1] if ',' in image_base64 else image_base64)
-        nparr = np.frombuffer(image_data, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # Latest frame wins: skip this frame if the client already sent a newer one
+        gate = get_frame_gate(str(client_id)[:128]) if client_id else None
+        if gate:
+            admission = gate.enter(DETECT_QUEUE_TIMEOUT)
+            if admission == 'superseded':
+                return jsonify({
+                    'success': False,
+                    'status': 'superseded',
+                    'faces': [],
+                    'faces_detected': 0
+                }), 200
+            if admission == 'timeout':
+                return jsonify({
+                    'success': False,
+                    'status': 'busy',
+                    'faces': [],
+                    'faces_detected': 0
+                }), 429, {'Retry-After': '1'}
         
-        if image is None:
+        try:
+            # Shed load instead of queueing frames that would be stale when answered
+            if not detect_slots.acquire(blocking=False):
+                return jsonify({
+                    'success': False,
+                    'status': 'busy',
+                    'faces': [],
+                    'faces_detected': 0
+                }), 429, {'Retry-After': '1'}
+            try:
+                faces, search = detect_frame(nparr, session_id)
+            finally:
+                detect_slots.release()
+        finally:
+            if gate:
+                gate.leave()
+        
+        if faces is None:
             return jsonify({
                 'success': False,
                 'faces': [],
                 'faces_detected': 0
             }), 400
         
-        # Optimize: resize if too large
-        height, width = image.shape[:2]
-        if max(height, width) > 720:
-            scale = 720 / max(height, width)
-            image = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_LINEAR)
-        
-        # Detect faces
-        faces = face_processor.detect_faces(image)
-        
         # Convert to coordinates format
         face_coords = [
             {'x': int(x), 'y': int(y), 'w': int(w), 'h': int(h)}
@@ -612,11 +1403,15 @@ def detect_faces():
         
         logger.debug(f'Detected {len(faces)} faces for real-time display')
         
-        return jsonify({
+        response = {
             'success': True,
             'faces_detected': len(faces),
             'faces': face_coords
-        }), 200
+        }
+        if search:
+            response['sessionId'] = session_id
+            response['search'] = search
+        return jsonify(response), 200
         
     except Exception as e:
         logger.error(f'Face detection error: {str(e)}')
@@ -629,8 +1424,9 @@ def detect_faces():
 
 if __name__ == '__main__':
     logger.info('🚀 Starting Facial Recognition Backend API')
-    logger.info(f'Firebase: {"✓ Initialized" if firebase_initialized else "✗ Not initialized"}')
-    logger.info(f'Face Detection: {"✓ Ready" if cascade else "✗ Not available"}')
+    warm_up.start(background=False)
+    logger.info(f'Firebase: {"✓ Initialized" if firebase_state["initialized"] else "✗ Not initialized"}')
+    logger.info(f'Face Detection: {"✓ Ready" if warm_up.ready else "✗ Not available"}')
     
     # Run Flask app
     app.run(
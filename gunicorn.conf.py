@@ -0,0 +1,13 @@
+"""
+Gunicorn settings (used by the Procfile)
+- The app module is imported once in the master (--preload) - the import is
+  cheap, Firebase and the cascades are initialized per worker
+- Every worker warms up right after it starts, /api/ready reports when it is done
+"""
+
+preload_app = True
+
+
+def post_worker_init(worker):
+    from facial_recognition_backend import warm_up
+    warm_up.start()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Headless Bulk Ingestion
+- Builds face_dataset/<Class>/<Name>/ (metadata.json + 224x224 face crops)
+  from a CSV roster and the videos / photo dumps schools send us, no camera
+  or prompts needed
+- Samples frames from each student's media and scores them with the capture
+  tool's quality heuristic (size, centering, quality threshold)
+- Keeps the best face per position cell and saves the best N distinct ones;
+  crops left over from an earlier run of the same student are removed
+- Students are processed in parallel on a process pool (one per core)
+
+Roster columns: id, name, class (studentId / studentName / className /
+homeroom also work) and an optional source: a video, an image or a folder,
+relative to --media. Without a source, <media>/<id>/ or <media>/<id>.* is used.
+
+Usage:
+    python ingest_dataset.py roster.csv --media school_dump/
+    python ingest_dataset.py roster.csv --media school_dump/ --images 5 --workers 8
+"""
+
+import argparse
+import csv
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+
+from make_dataset import crop_face, make_face_detector, position_key, prepare_person_folder
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.webm', '.m4v')
+
+ROSTER_FIELDS = {
+    'id': ('id', 'studentid', 'binusian_id', 'binusianid'),
+    'name': ('name', 'studentname', 'fullname'),
+    'class': ('class', 'classname', 'homeroom'),
+    'source': ('source', 'file', 'path', 'media')
+}
+
+
+def read_roster(path):
+    """Roster rows as dicts with id, name, class and source (may be empty)"""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        columns = {column.strip().lower().replace(' ', ''): column for column in reader.fieldnames or []}
+        fields = {field: next((columns[alias] for alias in aliases if alias in columns), None)
+                  for field, aliases in ROSTER_FIELDS.items()}
+        missing = [field for field in ('id', 'name', 'class') if fields[field] is None]
+        if missing:
+            raise SystemExit(f"❌ Roster {path} has no {', '.join(missing)} column")
+        students = []
+        for line, row in enumerate(reader, start=2):
+            student = {field: (row.get(column) or '').strip() if column else '' for field, column in fields.items()}
+            if not student['id'] or not student['name']:
+                print(f"⚠️ Roster line {line}: missing id or name, skipped")
+                continue
+            students.append(student)
+        return students
+
+
+def media_files(media_dir, student):
+    """Videos and images for one roster row"""
+    if student['source']:
+        candidates = [os.path.join(media_dir, student['source'])]
+    else:
+        candidates = [os.path.join(media_dir, student['id'])] + glob.glob(os.path.join(media_dir, f"{student['id']}.*"))
+    files = []
+    for candidate in candidates:
+        if os.path.isdir(candidate):
+            files.extend(sorted(glob.glob(os.path.join(candidate, '**', '*'), recursive=True)))
+        elif os.path.isfile(candidate):
+            files.append(candidate)
+    return [path for path in files if path.lower().endswith(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS)]
+
+
+def sample_frames(path, sample_fps, max_frames):
+    """Yield frames of an image (once) or a video (sample_fps frames per second)"""
+    if path.lower().endswith(IMAGE_EXTENSIONS):
+        frame = cv2.imread(path)
+        if frame is not None:
+            yield frame
+        return
+    video = cv2.VideoCapture(path)
+    try:
+        fps = video.get(cv2.CAP_PROP_FPS) or 30
+        step = max(1, int(round(fps / sample_fps)))
+        index = sampled = 0
+        while sampled < max_frames:
+            # grab() skips a frame without converting it to BGR
+            if not video.grab():
+                break
+            if index % step == 0:
+                success, frame = video.retrieve()
+                if not success:
+                    break
+                sampled += 1
+                yield frame
+            index += 1
+    finally:
+        video.release()
+
+
+_worker = {}
+
+
+def _init_worker(quality_threshold, max_dim):
+    """Pool initializer: one cascade per process, OpenCV kept single-threaded"""
+    cv2.setNumThreads(1)
+    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+    _worker['detect'] = make_face_detector(face_cascade, quality_threshold, max_dim)
+
+
+def ingest_student(student, files, dataset_path, images, sample_fps, max_frames):
+    """
+    Pick and save the best `images` distinct-position crops of one student.
+
+    Returns:
+        dict: student, frames sampled, faces found, saved crops and their qualities
+    """
+    detect = _worker['detect']
+    best = {}  # position cell -> (quality, crop); only the best face per cell is kept
+    frames = faces = 0
+    for path in files:
+        for frame in sample_frames(path, sample_fps, max_frames):
+            frames += 1
+            _, best_face, quality = detect(frame)
+            if best_face is None:
+                continue
+            faces += 1
+            cell = position_key(best_face)
+            if cell not in best or quality > best[cell][0]:
+                best[cell] = (quality, crop_face(frame, best_face))
+
+    chosen = sorted(best.values(), key=lambda item: item[0], reverse=True)[:images]
+    saved = []
+    if chosen:
+        person_folder = prepare_person_folder(dataset_path, student['id'], student['name'], student['class'])
+        for count, (quality, crop) in enumerate(chosen):
+            img_path = os.path.join(person_folder, f"{count:03d}.jpg")
+            cv2.imwrite(img_path, crop, [cv2.IMWRITE_JPEG_QUALITY, 95])
+            saved.append((img_path, round(float(quality), 1)))
+        # Re-ingest: the folder holds exactly this run's crops (removed only after the new ones are written)
+        written = {path for path, _ in saved}
+        for stale in glob.glob(os.path.join(person_folder, '*.jpg')):
+            if stale not in written:
+                os.remove(stale)
+    return {'student': student, 'files': len(files), 'frames': frames, 'faces': faces, 'saved': saved}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build face_dataset from a CSV roster plus videos / images')
+    parser.add_argument('roster', help='CSV with id, name, class and optional source columns')
+    parser.add_argument('--media', default='.', help='Folder the roster sources are relative to')
+    parser.add_argument('--dataset', default='face_dataset', help='Dataset root (face_dataset/<Class>/<Name>/)')
+    parser.add_argument('--images', type=int, default=3, help='Distinct-position crops saved per student')
+    parser.add_argument('--sample-fps', type=float, default=2.0, help='Video frames scored per second of footage')
+    parser.add_argument('--max-frames', type=int, default=300, help='Frames scored per video at most')
+    parser.add_argument('--quality-threshold', type=int, default=100, help='Minimum face area for quality check')
+    parser.add_argument('--max-dim', type=int, default=int(os.getenv('CAPTURE_DETECT_MAX_DIM', '0')),
+                        help='Longest side detection runs at (0 = full size, like make_dataset.py); '
+                             'crops come from the full frame')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes')
+    args = parser.parse_args()
+
+    students = read_roster(args.roster)
+    jobs, no_media = [], []
+    for student in students:
+        files = media_files(args.media, student)
+        (jobs if files else no_media).append((student, files))
+    for student, _ in no_media:
+        print(f"⚠️ {student['name']} ({student['id']}): no videos or images found in {os.path.abspath(args.media)}")
+
+    print(f"🎞️ Ingesting {len(jobs)} students on {args.workers} worker process(es)...")
+    start = time.perf_counter()
+    complete, short, failed = 0, [], []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.quality_threshold, args.max_dim)) as pool:
+        futures = {
+            pool.submit(ingest_student, student, files, args.dataset, args.images, args.sample_fps, args.max_frames):
+                student
+            for student, files in jobs
+        }
+        for future in as_completed(futures):
+            student = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failed.append(student)
+                print(f"❌ {student['name']} ({student['id']}): {e}")
+                continue
+            saved = result['saved']
+            qualities = ', '.join(str(quality) for _, quality in saved)
+            print(f"{'✅' if len(saved) >= args.images else '⚠️'} {student['name']} ({student['id']}): "
+                  f"{len(saved)}/{args.images} crops from {result['frames']} frames, "
+                  f"{result['faces']} with a face (quality {qualities or '-'})")
+            if len(saved) >= args.images:
+                complete += 1
+            else:
+                short.append(student)
+
+    elapsed = time.perf_counter() - start
+    print(f"\n📦 {complete} students complete, {len(short)} with fewer than {args.images} distinct crops, "
+          f"{len(failed)} failed, {len(no_media)} without media ({elapsed:.1f}s) -> {os.path.abspath(args.dataset)}")
+    print("   Run enroll_local.py to make them identifiable and sync_dataset.py to upload them.")
+
+
+if __name__ == '__main__':
+    main()
@@ -9,81 +9,183 @@ Features intelligent face detection and optimized image processing.
 import cv2
 import os
 import time
-import shutil
 import json
 import re
 import numpy as np
-import requests
-import base64
-import io
 
-def upload_face_image_to_firebase(image_data, student_id, student_name, class_name, position_num):
+from capture_pipeline import FrameReader, DetectionWorker, TrackingDetector
+from capture_uploader import BackgroundUploader
+
+# Full cascade detection every N frames (1 = every frame), template-match
+# tracking in between; MAX_DIM > 0 runs detection on a downscaled copy
+CAPTURE_DETECT_EVERY = int(os.getenv("CAPTURE_DETECT_EVERY", "5"))
+CAPTURE_DETECT_MAX_DIM = int(os.getenv("CAPTURE_DETECT_MAX_DIM", "0"))
+CAPTURE_TRACK_MIN_CONFIDENCE = float(os.getenv("CAPTURE_TRACK_MIN_CONFIDENCE", "0.6"))
+
+# Saved crops are journaled here and uploaded to Firebase Storage (via the
+# web upload API) in the background; leftovers are uploaded on the next run
+CAPTURE_SPOOL_DIR = os.getenv("CAPTURE_SPOOL_DIR", "capture_spool")
+CAPTURE_UPLOAD_WORKERS = int(os.getenv("CAPTURE_UPLOAD_WORKERS", "2"))
+CAPTURE_UPLOAD_DRAIN_SECONDS = float(os.getenv("CAPTURE_UPLOAD_DRAIN_SECONDS", "10"))
+
+def select_best_face(faces, frame_shape, quality_threshold):
     """
-    Upload a cropped and enhanced face image to Firebase Storage via the web API.
-    
-    Args:
-        image_data: numpy array of image data
-        student_id: Binusian ID
-        student_name: Full name of student
-        class_name: Homeroom/class name
-        position_num: Image position/number (e.g., 0, 1, 2)
+    Pick the face to capture: large and close to the frame centre.
     
     Returns:
-        dict: Response with status and details
+        tuple: (best face (x, y, w, h) or None, quality score)
     """
-    try:
-        # Check if we have the web API available
-        api_url = os.getenv("UPLOAD_API_URL", "http://localhost:3000/api/face/upload")
-        
-        # Convert image to JPEG bytes
-        if image_data is None:
-            print(f"⚠️ No image data to upload for {student_name} position {position_num}")
-            return {"success": False, "error": "No image data"}
-        
-        success, jpeg_data = cv2.imencode('.jpg', image_data, [cv2.IMWRITE_JPEG_QUALITY, 95])
-        if not success:
-            print(f"❌ Failed to encode image for {student_name}")
-            return {"success": False, "error": "Image encoding failed"}
+    best_face = None
+    best_quality = 0
+    
+    for (x, y, w, h) in faces:
+        # Calculate face quality score
+        face_area = w * h
+        center_x = x + w // 2
+        center_y = y + h // 2
+        frame_center_x = frame_shape[1] // 2
+        frame_center_y = frame_shape[0] // 2
         
-        jpeg_bytes = jpeg_data.tobytes()
+        # Distance from center (prefer centered faces)
+        center_distance = np.sqrt((center_x - frame_center_x)**2 + (center_y - frame_center_y)**2)
+        max_distance = np.sqrt(frame_center_x**2 + frame_center_y**2)
+        center_score = 1 - (center_distance / max_distance)
         
-        # Prepare multipart form data
-        files = {
-            'image': ('face.jpg', io.BytesIO(jpeg_bytes), 'image/jpeg')
-        }
-        data = {
-            'studentId': str(student_id),
-            'studentName': str(student_name),
-            'className': str(class_name),
-            'position': str(position_num)
-        }
+        # Size score (prefer larger faces)
+        max_area = frame_shape[0] * frame_shape[1] * 0.25  # 25% of frame
+        size_score = min(face_area / max_area, 1.0)
         
-        print(f"  📤 Uploading to Firebase: {api_url}")
-        print(f"     Student: {student_name} ({student_id})")
-        print(f"     Class: {class_name}, Position: {position_num}")
+        # Overall quality score
+        quality_score = (face_area * 0.4) + (center_score * 100) + (size_score * 100)
         
-        # Send request to web API endpoint
-        response = requests.post(api_url, files=files, data=data, timeout=30)
+        if quality_score > best_quality and face_area > quality_threshold:
+            best_quality = quality_score
+            best_face = (x, y, w, h)
+    
+    return best_face, best_quality
+
+
+def make_face_detector(face_cascade, quality_threshold, max_dim=0):
+    """
+    Detection stage for the capture pipeline: frame -> (faces, best face, quality).
+    With max_dim the cascade runs on a downscaled copy; boxes are in frame pixels.
+    """
+    def detect(frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        scale = min(1.0, max_dim / max(gray.shape[:2])) if max_dim else 1.0
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else gray
+        min_size = int(100 * scale)  # Larger minimum size for better quality
         
-        if response.status_code == 200:
-            result = response.json()
-            if result.get('success'):
-                print(f"  ✅ Firebase upload successful: {result.get('data', {}).get('storageUrl', 'N/A')}")
-                return {"success": True, "url": result.get('data', {}).get('storageUrl')}
-            else:
-                print(f"  ❌ Upload API error: {result.get('error', 'Unknown error')}")
-                return {"success": False, "error": result.get('error', 'Unknown error')}
-        else:
-            print(f"  ❌ Upload failed with status {response.status_code}: {response.text[:200]}")
-            return {"success": False, "error": f"HTTP {response.status_code}"}
-            
-    except requests.exceptions.ConnectionError:
-        print(f"  ⚠️ Could not connect to upload API at {api_url}")
-        print(f"     Make sure the web server is running (npm run dev or similar)")
-        return {"success": False, "error": "Could not connect to upload API"}
+        # Detect faces with enhanced parameters
+        faces = face_cascade.detectMultiScale(
+            small, 
+            scaleFactor=1.1, 
+            minNeighbors=5, 
+            minSize=(min_size, min_size),
+            flags=cv2.CASCADE_SCALE_IMAGE
+        )
+        if len(faces) and scale < 1.0:
+            faces = np.round(np.asarray(faces) / scale).astype(int)
+        best_face, best_quality = select_best_face(faces, gray.shape, quality_threshold)
+        return faces, best_face, best_quality
+    return detect
+
+
+def position_key(face):
+    """Grid cell (50 px) of the face centre, used to encourage pose/position variety"""
+    x, y, w, h = face
+    return f"{(x + w // 2) // 50}_{(y + h // 2) // 50}"
+
+
+def crop_face(frame, face, padding=20):
+    """
+    Padded 224x224 crop of a face, blended with its histogram-equalized copy
+    for better contrast.
+    """
+    x, y, w, h = face
+    # Add some padding around the face
+    x_start = max(0, x - padding)
+    y_start = max(0, y - padding)
+    x_end = min(frame.shape[1], x + w + padding)
+    y_end = min(frame.shape[0], y + h + padding)
+    
+    # Crop and enhance face image
+    face_image = frame[y_start:y_end, x_start:x_end]
+    
+    # Resize to consistent size with high quality
+    face_resized = cv2.resize(face_image, (224, 224), interpolation=cv2.INTER_CUBIC)
+    
+    # Enhance image quality
+    # Histogram equalization for better contrast
+    face_gray = cv2.cvtColor(face_resized, cv2.COLOR_BGR2GRAY)
+    face_eq = cv2.equalizeHist(face_gray)
+    face_enhanced = cv2.cvtColor(face_eq, cv2.COLOR_GRAY2BGR)
+    
+    # Blend original and enhanced
+    return cv2.addWeighted(face_resized, 0.7, face_enhanced, 0.3, 0)
+
+
+def sanitize_name(name: str) -> str:
+    """Basic sanitization for folder names"""
+    name = name.strip()
+    name = re.sub(r"[\\/]+", "_", name)  # replace path separators
+    name = re.sub(r"[^\w\-\s]", "", name)  # keep alnum, underscore, dash, space
+    name = re.sub(r"\s+", " ", name).strip()
+    return name or "unknown"
+
+
+def prepare_person_folder(dataset_path, student_id, student_name, class_name):
+    """Create face_dataset/<Class>/<Name>/ with its metadata.json; returns the folder"""
+    person_folder = os.path.join(dataset_path, sanitize_name(class_name), sanitize_name(student_name))
+    os.makedirs(person_folder, exist_ok=True)
+
+    # Write metadata for traceability
+    try:
+        meta = {
+            "id": student_id,
+            "name": student_name,
+            "class": class_name,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+        }
+        with open(os.path.join(person_folder, "metadata.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
     except Exception as e:
-        print(f"  ❌ Firebase upload error: {e}")
-        return {"success": False, "error": str(e)}
+        print(f"⚠️ Could not write metadata.json: {e}")
+    return person_folder
+
+
+_enrollment = {}
+
+
+def enroll_face_locally(face_image, student_id, student_name, position):
+    """
+    Append the embedding of a saved face crop to the local enrollment log
+    (FACE_STORE_PATH), so identification picks the student up without
+    re-running enroll_local.py.
+    
+    Returns:
+        bool: True if the embedding was appended
+    """
+    if _enrollment.get('disabled'):
+        return False
+    try:
+        if 'store' not in _enrollment:
+            from embedding_store import EmbeddingStore
+            from face_embedding import create_embedder
+            embedder = create_embedder(os.getenv("EMBEDDING_ENGINE", "lbp"),
+                                       os.getenv("SFACE_MODEL_PATH", "models/face_recognition_sface_2021dec.onnx"))
+            store = EmbeddingStore(os.getenv("FACE_STORE_PATH", "face_embeddings.log"), embedder.dim, embedder.name)
+            _enrollment.update(embedder=embedder, store=store)
+        from enroll_local import local_position  # same key enroll_local.py gives the saved crop
+        embedding = _enrollment['embedder'].embed(face_image)
+        _enrollment['store'].add(student_id, local_position(position), embedding, student_name)
+        return True
+    except Exception as e:
+        print(f"  ⚠️ Local enrollment failed: {e} (run enroll_local.py later)")
+        # Do not retry a store/embedder that could not be opened for every capture
+        _enrollment['disabled'] = 'store' not in _enrollment
+        return False
+
 
 def main():
     dataset_path = "face_dataset"
@@ -139,35 +241,10 @@ def main():
     if not class_name:
         class_name = input("Enter the homeroom/class (e.g., 1A): ").strip()
 
-    # Basic sanitization for folder names
-    def _sanitize(name: str) -> str:
-        name = name.strip()
-        name = re.sub(r"[\\/]+", "_", name)  # replace path separators
-        name = re.sub(r"[^\w\-\s]", "", name)  # keep alnum, underscore, dash, space
-        name = re.sub(r"\s+", " ", name).strip()
-        return name or "unknown"
-
-    safe_class = _sanitize(class_name)
-    safe_name = _sanitize(student_name)
+    safe_class = sanitize_name(class_name)
 
     # Create folder hierarchy face_dataset/<Class>/<Name>/
-    person_folder = os.path.join(dataset_path, safe_class, safe_name)
-    os.makedirs(person_folder, exist_ok=True)
-
-    # Write metadata for traceability
-    try:
-        meta = {
-            "id": studentid,
-            "name": student_name,
-            "class": class_name,
-            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S")
-        }
-        with open(os.path.join(person_folder, "metadata.json"), "w", encoding="utf-8") as f:
-            json.dump(meta, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"⚠️ Could not write metadata.json: {e}")
-    
-    
+    person_folder = prepare_person_folder(dataset_path, studentid, student_name, class_name)
 
     # Configuration
     images_to_capture = 3  # Increased for better recognition
@@ -187,53 +264,37 @@ def main():
     last_capture_time = 0
     captured_positions = []  # Track face positions to encourage variety
     
+    # Camera reader and face detector run on their own threads; this loop only
+    # draws the newest frame with the newest detection result
+    uploader = BackgroundUploader(
+        os.getenv("UPLOAD_API_URL", "http://localhost:3000/api/face/upload"),
+        CAPTURE_SPOOL_DIR,
+        workers=CAPTURE_UPLOAD_WORKERS
+    ).start()
+    reader = FrameReader(camera).start()
+    tracking = TrackingDetector(
+        make_face_detector(face_cascade, quality_threshold, CAPTURE_DETECT_MAX_DIM),
+        lambda faces, shape: select_best_face(faces, shape, quality_threshold),
+        detect_every=CAPTURE_DETECT_EVERY,
+        min_confidence=CAPTURE_TRACK_MIN_CONFIDENCE
+    )
+    detector = DetectionWorker(reader, tracking).start()
+    shown_seq = 0
+    
     while count < images_to_capture:
-        success, frame = camera.read()
-        if not success:
-            print("❌ Error: Failed to capture frame.")
+        frame, seq = reader.frames.wait_newer(shown_seq, timeout=1.0)
+        if reader.frames.closed and seq == shown_seq:
+            print(f"❌ Error: {reader.error or 'Camera stopped.'}")
             break
-            
-        # Flip frame for mirror effect
-        frame = cv2.flip(frame, 1)
+        if seq == shown_seq:
+            continue
+        shown_seq = seq
         display_frame = frame.copy()
         
-        # Detect faces with enhanced parameters
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(
-            gray, 
-            scaleFactor=1.1, 
-            minNeighbors=5, 
-            minSize=(100, 100),  # Larger minimum size for better quality
-            flags=cv2.CASCADE_SCALE_IMAGE
-        )
-        
-        # Enhanced face quality assessment
-        best_face = None
-        best_quality = 0
-        
-        for (x, y, w, h) in faces:
-            # Calculate face quality score
-            face_area = w * h
-            center_x = x + w // 2
-            center_y = y + h // 2
-            frame_center_x = frame.shape[1] // 2
-            frame_center_y = frame.shape[0] // 2
-            
-            # Distance from center (prefer centered faces)
-            center_distance = np.sqrt((center_x - frame_center_x)**2 + (center_y - frame_center_y)**2)
-            max_distance = np.sqrt(frame_center_x**2 + frame_center_y**2)
-            center_score = 1 - (center_distance / max_distance)
-            
-            # Size score (prefer larger faces)
-            max_area = frame.shape[0] * frame.shape[1] * 0.25  # 25% of frame
-            size_score = min(face_area / max_area, 1.0)
-            
-            # Overall quality score
-            quality_score = (face_area * 0.4) + (center_score * 100) + (size_score * 100)
-            
-            if quality_score > best_quality and face_area > quality_threshold:
-                best_quality = quality_score
-                best_face = (x, y, w, h)
+        # Latest detection (may be a few frames older than the preview)
+        result, _ = detector.results.get()
+        best_face = result.best_face if result is not None else None
+        best_quality = result.quality if result is not None else 0
         
         # Draw rectangle around best face
         face_detected = False
@@ -262,6 +323,14 @@ def main():
         
         cv2.putText(display_frame, f"Unique positions: {len(set(captured_positions))}", 
                    (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 1)
+        
+        cv2.putText(display_frame, f"Camera {reader.fps.rate:.0f} fps | Detect {detector.fps.rate:.0f} fps ({tracking.mode})", 
+                   (10, 85), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 200, 200), 1)
+
+        if uploader.pending:
+            upload_text = f"Uploads pending: {uploader.pending}" + (" (offline, spooled)" if uploader.offline else "")
+            cv2.putText(display_frame, upload_text,
+                       (10, 105), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 165, 255) if uploader.offline else (200, 200, 200), 1)
                    
         # Status messages
         if not face_detected:
@@ -288,58 +357,29 @@ def main():
                     capturing = False
                     
                     if best_face is not None:
-                        x, y, w, h = best_face
+                        # Crop from the frame the box was detected in
+                        face_final = crop_face(result.frame, best_face)
                         
-                        # Add some padding around the face
-                        padding = 20
-                        x_start = max(0, x - padding)
-                        y_start = max(0, y - padding)
-                        x_end = min(frame.shape[1], x + w + padding)
-                        y_end = min(frame.shape[0], y + h + padding)
-                        
-                        # Crop and enhance face image
-                        face = frame[y_start:y_end, x_start:x_end]
-                        
-                        # Resize to consistent size with high quality
-                        face_resized = cv2.resize(face, (224, 224), interpolation=cv2.INTER_CUBIC)
-                        
-                        # Enhance image quality
-                        # Histogram equalization for better contrast
-                        face_gray = cv2.cvtColor(face_resized, cv2.COLOR_BGR2GRAY)
-                        face_eq = cv2.equalizeHist(face_gray)
-                        face_enhanced = cv2.cvtColor(face_eq, cv2.COLOR_GRAY2BGR)
-                        
-                        # Blend original and enhanced
-                        face_final = cv2.addWeighted(face_resized, 0.7, face_enhanced, 0.3, 0)
-                        
-                        # Save locally
+                        # Save locally (encoded once, the same bytes are uploaded)
                         img_path = os.path.join(person_folder, f"{count:03d}.jpg")
-                        cv2.imwrite(img_path, face_final, [cv2.IMWRITE_JPEG_QUALITY, 95])
+                        _, jpeg_data = cv2.imencode('.jpg', face_final, [cv2.IMWRITE_JPEG_QUALITY, 95])
+                        jpeg_bytes = jpeg_data.tobytes()
+                        with open(img_path, "wb") as f:
+                            f.write(jpeg_bytes)
                         
                         # Track position for variety
-                        center_x = x + w // 2
-                        center_y = y + h // 2
-                        position_key = f"{center_x//50}_{center_y//50}"  # Grid-based position
-                        captured_positions.append(position_key)
+                        position = position_key(best_face)
+                        captured_positions.append(position)
                         
                         print(f"✅ Saved high-quality image {count+1}/{images_to_capture} -> {img_path}")
-                        print(f"   Quality score: {best_quality:.1f}, Position: {position_key}")
+                        print(f"   Quality score: {best_quality:.1f}, Position: {position}")
                         
-                        # Upload to Firebase
-                        print(f"📤 Uploading to Firebase...")
-                        upload_result = upload_face_image_to_firebase(
-                            face_final, 
-                            studentid, 
-                            student_name, 
-                            safe_class, 
-                            count
-                        )
+                        # Make the new crop searchable right away (position = file name)
+                        enroll_face_locally(face_final, studentid, student_name, f"{count:03d}")
                         
-                        if upload_result.get("success"):
-                            print(f"   ✅ Firebase: {upload_result.get('url', 'Success')}")
-                        else:
-                            print(f"   ⚠️ Firebase failed: {upload_result.get('error', 'Unknown error')}")
-                            print(f"   ℹ️ Image saved locally at {img_path}")
+                        # Upload to Firebase in the background (spooled to disk first)
+                        uploader.submit(jpeg_bytes, studentid, student_name, safe_class, count, img_path)
+                        print(f"📤 Queued for Firebase upload ({uploader.pending} pending)")
                         
                         count += 1
                     else:
@@ -366,9 +406,18 @@ def main():
             last_capture_time = time.time()
 
     # Clean up
+    detector.stop()
+    reader.stop()
     camera.release()
     cv2.destroyAllWindows()
     
+    if uploader.pending:
+        print(f"📤 Finishing {uploader.pending} upload(s)...")
+    left = uploader.close(CAPTURE_UPLOAD_DRAIN_SECONDS)
+    print(f"📤 Firebase: {uploader.uploaded} uploaded, {uploader.failed} rejected, {left} still spooled")
+    if left:
+        print(f"   ℹ️ Spooled images are uploaded on the next run ({os.path.abspath(CAPTURE_SPOOL_DIR)})")
+    
     # Report status
     if count >= images_to_capture:
         unique_positions = len(set(captured_positions))
@@ -391,12 +440,13 @@ def main():
     # Instructions for next steps
     print("\n📋 Next steps:")
     print("1. Check Firebase Storage to verify uploads completed successfully")
-    print("2. Run enroll_local.py to rebuild local encodings (encodings.pickle).")
+    print("2. Captured faces are already enrolled for /api/identify (run enroll_local.py for older captures).")
     print("3. Run the main facial recognition system.")
     print("4. The system will automatically detect and recognize the newly added face.")
     print("5. If recognition doesn't work well, try adding more images with different poses and lighting")
-    print("\n💡 NOTE: Images are being uploaded to Firebase Storage in real-time.")
-    print("   If Firebase upload fails, images are still saved locally and can be synced later.")
+    print("\n💡 NOTE: Images are uploaded to Firebase Storage in the background.")
+    print("   If the upload API is unreachable they stay spooled and are uploaded on the next run.")
+    print("   Run python sync_dataset.py to upload anything face_dataset has that storage is missing.")
 
 if __name__ == "__main__":
     main()
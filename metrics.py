@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Pipeline Metrics
+- Counters, gauges and histograms in the Prometheus text format
+- Per-stage timing of the image pipeline (decode, detect tiers, crop, encode, upload)
+- Thread-local endpoint label so stages timed in helpers land under the right route
+
+Metrics are kept per process; scrape every gunicorn worker (or run one worker).
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds - from sub-millisecond codec calls to multi-second uploads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base class: a named metric family with optional labels"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}  # label values tuple -> value
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}')
+        return tuple(str(v) for v in labels)
+
+    def samples(self):
+        """(suffix, label values, extra labels, value) tuples"""
+        with self._lock:
+            return [('', key, (), value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for suffix, key, extra, value in self.samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function  # Read at scrape time: () -> {label values tuple: value}
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        if self.function is None:
+            return super().samples()
+        values = self.function()
+        return [('', self._key(key if isinstance(key, tuple) else (key,)), (), value)
+                for key, value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per bucket (non-cumulative) counts plus +Inf, sum, count
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self):
+        with self._lock:
+            snapshot = [(key, list(entry[0]), entry[1], entry[2]) for key, entry in sorted(self._values.items())]
+        samples = []
+        for key, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                samples.append(('_bucket', key, (('le', _format_value(float(bound))),), cumulative))
+            samples.append(('_sum', key, (), total))
+            samples.append(('_count', key, (), count))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REQUESTS = REGISTRY.register(Counter(
+    'facerec_requests_total', 'HTTP requests by endpoint and status code', ['endpoint', 'status']))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'facerec_request_seconds', 'HTTP request latency by endpoint', ['endpoint']))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    'facerec_requests_in_flight', 'HTTP requests being handled', ['endpoint']))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'facerec_stage_seconds', 'Time spent in each pipeline stage', ['endpoint', 'stage']))
+DETECTION_TIER = REGISTRY.register(Counter(
+    'facerec_detection_tier_total', 'Detections by the fallback tier that found the face (none = no face)',
+    ['endpoint', 'tier']))
+
+# Endpoint the current thread is working for (request threads, batch and upload workers)
+_context = threading.local()
+
+
+def current_endpoint():
+    return getattr(_context, 'endpoint', None) or 'none'
+
+
+def set_endpoint(endpoint):
+    _context.endpoint = endpoint
+
+
+@contextmanager
+def endpoint_scope(endpoint):
+    """Attribute the stages timed in this block to endpoint"""
+    previous = getattr(_context, 'endpoint', None)
+    _context.endpoint = endpoint
+    try:
+        yield
+    finally:
+        _context.endpoint = previous
+
+
+@contextmanager
+def time_stage(stage):
+    """Record the duration of a pipeline stage under the current endpoint"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, current_endpoint(), stage)
+
+
+def record_tier(tier_name):
+    DETECTION_TIER.inc(current_endpoint(), tier_name or 'none')
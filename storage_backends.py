@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Storage Backends
+- One interface for blob storage and image metadata records
+- Firebase (Cloud Storage + Firestore), local disk and in-memory implementations
+- Optional write-through local cache for recently uploaded blobs
+
+Metadata records live under students/{studentId}/images, whatever the backend.
+"""
+
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Firestore accepts at most 500 writes per batch
+FIRESTORE_BATCH_LIMIT = 500
+
+
+class StorageBackend:
+    """
+    Blob storage plus image metadata.
+
+    Implementations must be safe to call from several threads at once.
+    """
+
+    name = 'base'
+
+    def upload_blob(self, path, data, content_type='image/jpeg'):
+        """Store bytes at path, replacing any existing blob"""
+        raise NotImplementedError
+
+    def download_blob(self, path):
+        """Return the bytes stored at path, or None if there is no such blob"""
+        raise NotImplementedError
+
+    def blob_exists(self, path):
+        return self.download_blob(path) is not None
+
+    def write_metadata(self, records):
+        """
+        Write image metadata records in one batch.
+
+        A record with an 'id' replaces the stored record with the same id,
+        so replaying a write does not duplicate it.
+
+        Args:
+            records: list of (student_id, metadata dict)
+        """
+        raise NotImplementedError
+
+    def list_metadata(self, student_id):
+        """All image metadata records of a student"""
+        raise NotImplementedError
+
+    def after_fork(self):
+        """Drop clients inherited from the parent process"""
+
+
+class FirebaseStorage(StorageBackend):
+    """
+    Cloud Storage blobs and Firestore metadata.
+
+    firebase_admin must be initialized before the first call. Every thread
+    gets its own long-lived bucket and Firestore client.
+    """
+
+    name = 'firebase'
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def after_fork(self):
+        self._local = threading.local()
+
+    def _bucket(self):
+        bucket = getattr(self._local, 'bucket', None)
+        if bucket is None:
+            from firebase_admin import storage
+            bucket = self._local.bucket = storage.bucket()
+        return bucket
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            from firebase_admin import firestore
+            db = self._local.db = firestore.client()
+        return db
+
+    def _images(self, student_id):
+        return self._db().collection('students').document(student_id).collection('images')
+
+    def upload_blob(self, path, data, content_type='image/jpeg'):
+        self._bucket().blob(path).upload_from_string(data, content_type=content_type)
+
+    def download_blob(self, path):
+        blob = self._bucket().blob(path)
+        if not blob.exists():
+            return None
+        return blob.download_as_bytes()
+
+    def blob_exists(self, path):
+        return self._bucket().blob(path).exists()
+
+    def write_metadata(self, records):
+        db = self._db()
+        for start in range(0, len(records), FIRESTORE_BATCH_LIMIT):
+            batch = db.batch()
+            for student_id, metadata in records[start:start + FIRESTORE_BATCH_LIMIT]:
+                batch.set(self._images(student_id).document(metadata.get('id')), metadata)
+            batch.commit()
+
+    def list_metadata(self, student_id):
+        return [doc.to_dict() for doc in self._images(student_id).stream()]
+
+
+class MemoryStorage(StorageBackend):
+    """In-process stand-in for load tests and benchmarks"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.blobs = {}
+        self.metadata = {}  # student id -> list of records
+
+    def upload_blob(self, path, data, content_type='image/jpeg'):
+        with self._lock:
+            self.blobs[path] = bytes(data)
+
+    def download_blob(self, path):
+        with self._lock:
+            return self.blobs.get(path)
+
+    def write_metadata(self, records):
+        with self._lock:
+            for student_id, metadata in records:
+                record = dict(metadata)
+                record.setdefault('id', uuid.uuid4().hex)
+                stored = self.metadata.setdefault(student_id, [])
+                stored[:] = [old for old in stored if old['id'] != record['id']]
+                stored.append(record)
+
+    def list_metadata(self, student_id):
+        with self._lock:
+            return [dict(record) for record in self.metadata.get(student_id, [])]
+
+
+class LocalStorage(StorageBackend):
+    """
+    Blobs and metadata on the local filesystem.
+
+    Layout:
+        <root>/blobs/<blob path>
+        <root>/metadata/<student id>.jsonl  (one record per line, the last line of an id wins)
+    """
+
+    name = 'local'
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, 'blobs'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'metadata'), exist_ok=True)
+
+    def _blob_file(self, path):
+        full = os.path.normpath(os.path.join(self.root, 'blobs', path))
+        if not full.startswith(os.path.normpath(os.path.join(self.root, 'blobs')) + os.sep):
+            raise ValueError(f'Invalid blob path: {path}')
+        return full
+
+    def _metadata_file(self, student_id):
+        safe_id = ''.join(ch for ch in str(student_id) if ch.isalnum() or ch in '-_') or 'unknown'
+        return os.path.join(self.root, 'metadata', f'{safe_id}.jsonl')
+
+    def upload_blob(self, path, data, content_type='image/jpeg'):
+        full = self._blob_file(path)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        tmp_path = f'{full}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, full)
+
+    def download_blob(self, path):
+        try:
+            with open(self._blob_file(path), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def blob_exists(self, path):
+        return os.path.exists(self._blob_file(path))
+
+    def delete_blob(self, path):
+        try:
+            os.remove(self._blob_file(path))
+        except FileNotFoundError:
+            pass
+
+    def write_metadata(self, records):
+        with self._lock:
+            for student_id, metadata in records:
+                record = dict(metadata)
+                record.setdefault('id', uuid.uuid4().hex)
+                with open(self._metadata_file(student_id), 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, default=_json_default, ensure_ascii=False) + '\n')
+
+    def list_metadata(self, student_id):
+        try:
+            with open(self._metadata_file(student_id), 'r', encoding='utf-8') as f:
+                records = [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+        return list({record.get('id') or index: record for index, record in enumerate(records)}.values())
+
+
+class CachingStorage(StorageBackend):
+    """
+    Write-through cache in front of another backend.
+
+    Uploads go to the primary backend and to a LocalStorage cache; reads of
+    recently uploaded blobs are served from the cache. Only the newest
+    `max_entries` blobs are kept locally.
+    """
+
+    def __init__(self, primary, cache_dir, max_entries=500):
+        self.primary = primary
+        self.cache = LocalStorage(cache_dir)
+        self.max_entries = max_entries
+        self.name = f'{primary.name}+cache'
+        self._lock = threading.Lock()
+        self._recent = OrderedDict()  # blob path -> None, least recently used first
+
+    def _remember(self, path, data):
+        self.cache.upload_blob(path, data)
+        with self._lock:
+            self._recent[path] = None
+            self._recent.move_to_end(path)
+            evicted = []
+            while len(self._recent) > self.max_entries:
+                evicted.append(self._recent.popitem(last=False)[0])
+        for old_path in evicted:
+            self.cache.delete_blob(old_path)
+
+    def upload_blob(self, path, data, content_type='image/jpeg'):
+        self.primary.upload_blob(path, data, content_type)
+        self._remember(path, data)
+
+    def download_blob(self, path):
+        with self._lock:
+            cached = path in self._recent
+            if cached:
+                self._recent.move_to_end(path)
+        if cached:
+            data = self.cache.download_blob(path)
+            if data is not None:
+                return data
+        data = self.primary.download_blob(path)
+        if data is not None:
+            self._remember(path, data)
+        return data
+
+    def blob_exists(self, path):
+        with self._lock:
+            if path in self._recent:
+                return True
+        return self.primary.blob_exists(path)
+
+    def write_metadata(self, records):
+        self.primary.write_metadata(records)
+
+    def after_fork(self):
+        self.primary.after_fork()
+
+    def list_metadata(self, student_id):
+        return self.primary.list_metadata(student_id)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def init_firebase():
+    """Initialize the Firebase Admin SDK from the FIREBASE_* environment variables"""
+    import firebase_admin
+    from firebase_admin import credentials
+
+    try:
+        # Check if app already exists
+        try:
+            firebase_admin.get_app()
+            logger.info('✓ Firebase app already initialized')
+            return True
+        except ValueError:
+            # App doesn't exist, initialize it
+            pass
+        
+        project_id = os.getenv('FIREBASE_PROJECT_ID')
+        private_key_id = os.getenv('FIREBASE_PRIVATE_KEY_ID')
+        private_key = os.getenv('FIREBASE_PRIVATE_KEY', '').replace('\\n', '\n')
+        client_email = os.getenv('FIREBASE_CLIENT_EMAIL')
+        client_id = os.getenv('FIREBASE_CLIENT_ID')
+        storage_bucket = os.getenv('FIREBASE_STORAGE_BUCKET')
+        
+        if not all([project_id, private_key_id, private_key, client_email, client_id, storage_bucket]):
+            logger.error('Missing Firebase environment variables')
+            return False
+        
+        service_account = {
+            "type": "service_account",
+            "project_id": project_id,
+            "private_key_id": private_key_id,
+            "private_key": private_key,
+            "client_email": client_email,
+            "client_id": client_id,
+            "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+            "token_uri": "https://oauth2.googleapis.com/token",
+            "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
+        }
+        
+        cred = credentials.Certificate(service_account)
+        firebase_admin.initialize_app(cred, {
+            'storageBucket': storage_bucket,
+        })
+        
+        logger.info('✓ Firebase initialized successfully')
+        return True
+    except Exception as e:
+        logger.error(f'Firebase initialization failed: {e}')
+        return False
+
+
+def create_storage(kind='firebase', local_dir='local_storage', cache_dir=None, cache_entries=500):
+    """
+    Build a storage backend.
+
+    Args:
+        kind: 'firebase', 'local' or 'memory'
+        local_dir: root directory of the 'local' backend
+        cache_dir: enable the write-through blob cache in this directory
+        cache_entries: number of recent blobs kept in the cache
+    """
+    if kind == 'firebase':
+        backend = FirebaseStorage()
+    elif kind == 'local':
+        backend = LocalStorage(local_dir)
+    elif kind == 'memory':
+        backend = MemoryStorage()
+    else:
+        raise ValueError(f'Unknown storage backend: {kind}')
+
+    if cache_dir:
+        backend = CachingStorage(backend, cache_dir, cache_entries)
+    logger.info(f'✓ Storage backend: {backend.name}')
+    return backend
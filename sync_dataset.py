@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Dataset Sync
+- Walks face_dataset/<Class>/<Name>/ (metadata.json + face crops) and uploads
+  the crops remote storage does not have yet (STORAGE_BACKEND)
+- An image counts as stored when its SHA-256 matches a record under
+  students/{id}/images; records without a hash are hashed from their blob
+  once, and the hash is journaled so later runs skip the download
+- Bounded pool of upload threads, metadata records written in batches
+- Progress journal in the dataset root, so an interrupted sync resumes
+  without re-checking the students it already finished
+- --dry-run only reports what would be uploaded
+
+Usage:
+    python sync_dataset.py --dry-run
+    python sync_dataset.py --workers 16
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from capture_uploader import UploadSpool
+from enroll_local import iter_students
+from storage_backends import FIRESTORE_BATCH_LIMIT, create_storage, init_firebase
+from upload_queue import UploadJob
+
+load_dotenv()
+
+PROGRESS_FILE = '.sync_progress.jsonl'
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path):
+    with open(path, 'rb') as f:
+        return hash_bytes(f.read())
+
+
+class SyncProgress:
+    """
+    Append-only journal of (backend, student id, sha256) already stored
+    remotely, plus the hashes of remote blobs whose metadata has none.
+    Lines are fsync'd after every write; a torn last line from a crash is
+    ignored.
+    """
+
+    def __init__(self, path, backend):
+        self.path = path
+        self.backend = backend
+        self.done = set()
+        self.blob_hashes = {}  # remote blob path -> sha256
+        self._lock = threading.Lock()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get('backend') != backend:
+                        continue
+                    if 'blobPath' in entry:
+                        self.blob_hashes[entry['blobPath']] = entry['sha256']
+                    else:
+                        self.done.add((entry['studentId'], entry['sha256']))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        self.done.clear()
+        self.blob_hashes.clear()
+
+    def _append(self, entries):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(dict(entry, backend=self.backend)) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def record(self, entries):
+        """Journal [(student id, sha256, local path)] as stored"""
+        with self._lock:
+            new = [entry for entry in entries if entry[:2] not in self.done]
+            if not new:
+                return
+            self._append({'studentId': student_id, 'sha256': sha256, 'path': path}
+                         for student_id, sha256, path in new)
+            self.done.update(entry[:2] for entry in new)
+
+    def record_blob_hashes(self, hashes):
+        """Journal {remote blob path: sha256} computed from downloaded blobs"""
+        with self._lock:
+            new = {path: sha256 for path, sha256 in hashes.items() if self.blob_hashes.get(path) != sha256}
+            if not new:
+                return
+            self._append({'blobPath': path, 'sha256': sha256} for path, sha256 in new.items())
+            self.blob_hashes.update(new)
+
+
+def remote_hashes(storage, progress, student_id):
+    """
+    Content hashes of the images stored for a student.
+
+    Returns:
+        tuple: (set of sha256, number of records, records without hash or blob)
+    """
+    records = storage.list_metadata(student_id)
+    hashes, unknown, computed = set(), 0, {}
+    for record in records:
+        if record.get('sha256'):
+            hashes.add(record['sha256'])
+            continue
+        path = record.get('path')
+        if path in progress.blob_hashes:
+            hashes.add(progress.blob_hashes[path])
+            continue
+        # Older records carry no hash - hash the stored blob instead (once, then journaled)
+        data = storage.download_blob(path) if path else None
+        if data is None:
+            unknown += 1
+        else:
+            computed[path] = hash_bytes(data)
+            hashes.add(computed[path])
+    progress.record_blob_hashes(computed)
+    return hashes, len(records), unknown
+
+
+def plan_student(storage, progress, student_id, name, images):
+    """
+    Local images of one student missing from remote storage.
+
+    Returns:
+        dict: student id, name, local/remote counts, present [(sha256, path)]
+            and missing [(position, path, sha256)]
+    """
+    local = {}  # sha256 -> (position, path); duplicate crops are uploaded once
+    for position, path in images.items():
+        local.setdefault(hash_file(path), (position, path))
+
+    plan = {'studentId': student_id, 'name': name, 'local': len(local), 'remote': None, 'unknown': 0,
+            'present': [], 'missing': []}
+    pending = {sha256 for sha256 in local if (student_id, sha256) not in progress.done}
+    if pending:
+        stored, plan['remote'], plan['unknown'] = remote_hashes(storage, progress, student_id)
+    else:
+        stored = set()
+    for sha256, (position, path) in local.items():
+        if sha256 in pending and sha256 not in stored:
+            plan['missing'].append((position, path, sha256))
+        else:
+            plan['present'].append((sha256, path))
+    return plan
+
+
+def upload_image(storage, job, path, max_attempts):
+    """Upload one blob with exponential backoff; returns the job"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    for attempt in range(1, max_attempts + 1):
+        try:
+            storage.upload_blob(job.blob_path, data)
+            job.uploaded_at = datetime.now()
+            return job
+        except Exception:
+            if attempt >= max_attempts:
+                raise
+            time.sleep(min(2 ** (attempt - 1), 30))
+
+
+def upload_missing(storage, progress, plans, synced_paths, workers, batch_size, max_attempts, missing):
+    """
+    Upload the missing images of every plan on a thread pool, writing their
+    metadata and journal entries in batches.
+
+    On Ctrl+C, uploads not started yet are cancelled, but the ones already
+    running are waited for and recorded, so no stored blob is left without
+    metadata (the next run would upload it again under a new path).
+
+    Returns:
+        tuple: (uploaded, failed)
+    """
+    uploaded = failed = 0
+    batch = []
+    start = time.perf_counter()
+
+    def flush():
+        if not batch:
+            return
+        storage.write_metadata([(job.student_id, job.metadata()) for job, _ in batch])
+        progress.record([(job.student_id, job.sha256, path) for job, path in batch])
+        synced_paths.update(os.path.abspath(path) for _, path in batch)
+        batch.clear()
+
+    def collect(future):
+        nonlocal uploaded, failed
+        job, path = futures.pop(future)
+        try:
+            future.result()
+        except Exception as e:
+            failed += 1
+            print(f"❌ {job.student_name} ({job.student_id}) {path}: {e}")
+            return
+        batch.append((job, path))
+        uploaded += 1
+        if len(batch) >= batch_size:
+            flush()
+        if uploaded % 100 == 0:
+            rate = uploaded / (time.perf_counter() - start)
+            print(f"⬆️ {uploaded}/{missing} uploaded ({rate:.1f} images/s)")
+
+    pool = ThreadPoolExecutor(max_workers=workers)
+    futures = {}
+    try:
+        for plan in plans:
+            for position, path, sha256 in plan['missing']:
+                job = UploadJob(plan['name'], plan['studentId'], position, sha256=sha256)
+                futures[pool.submit(upload_image, storage, job, path, max_attempts)] = (job, path)
+        for future in as_completed(list(futures)):
+            collect(future)
+    except KeyboardInterrupt:
+        print("\n⛔ Interrupted, finishing the uploads in flight and saving progress (run again to resume)...")
+        for future in list(futures):
+            if future.cancel():
+                del futures[future]
+        for future in list(futures):
+            collect(future)  # still running: wait for it
+    finally:
+        flush()
+        pool.shutdown(wait=False)
+    return uploaded, failed
+
+
+def print_report(plans):
+    print(f"\n{'student':<14} {'name':<28} {'local':>6} {'remote':>7} {'missing':>8}")
+    for plan in plans:
+        remote = '-' if plan['remote'] is None else plan['remote']
+        note = f"  ({plan['unknown']} remote record(s) without blob)" if plan['unknown'] else ''
+        print(f"{plan['studentId']:<14} {plan['name'][:28]:<28} {plan['local']:>6} {remote:>7} "
+              f"{len(plan['missing']):>8}{note}")
+    missing = sum(len(plan['missing']) for plan in plans)
+    up_to_date = sum(1 for plan in plans if not plan['missing'])
+    print(f"\n📊 {len(plans)} students, {sum(plan['local'] for plan in plans)} local images, "
+          f"{missing} to upload ({up_to_date} students up to date)")
+    return missing
+
+
+def forget_spooled(spool_dir, synced_paths):
+    """Drop make_dataset.py spool entries whose image is now stored (no double upload)"""
+    spool = UploadSpool(spool_dir)
+    dropped = 0
+    for record in spool.entries():
+        if record.get('localPath') and os.path.abspath(record['localPath']) in synced_paths:
+            spool.remove(record)
+            dropped += 1
+    return dropped
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Upload face_dataset images missing from remote storage')
+    parser.add_argument('--dataset', default='face_dataset', help='Dataset root (face_dataset/<Class>/<Name>/)')
+    parser.add_argument('--backend', default=os.getenv('STORAGE_BACKEND', 'firebase'),
+                        choices=('firebase', 'local'), help='Remote storage (STORAGE_BACKEND)')
+    parser.add_argument('--local-dir', default=os.getenv('LOCAL_STORAGE_DIR', 'local_storage'))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('SYNC_WORKERS', '8')),
+                        help='Concurrent listings / uploads')
+    parser.add_argument('--batch-size', type=int, default=100, help='Metadata records per batched write')
+    parser.add_argument('--max-attempts', type=int, default=int(os.getenv('UPLOAD_MAX_ATTEMPTS', '5')))
+    parser.add_argument('--capture-spool', default=os.getenv('CAPTURE_SPOOL_DIR', 'capture_spool'),
+                        help="make_dataset.py spool; entries for synced images are dropped")
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would be uploaded')
+    parser.add_argument('--full', action='store_true', help='Ignore the progress journal and re-check every student')
+    args = parser.parse_args()
+
+    if args.backend == 'firebase' and not init_firebase():
+        raise SystemExit("❌ Firebase could not be initialized (check the FIREBASE_* variables in .env)")
+    storage = create_storage(args.backend, args.local_dir)
+    progress = SyncProgress(os.path.join(args.dataset, PROGRESS_FILE), storage.name)
+    if args.full:
+        progress.clear()
+
+    students = list(iter_students(args.dataset))
+    print(f"🔍 Comparing {len(students)} students with {storage.name} storage ({args.workers} workers)...")
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        plans = list(pool.map(lambda student: plan_student(storage, progress, *student), students))
+    missing = print_report(plans)
+    if args.dry_run:
+        print("   Dry run, nothing uploaded.")
+        return
+
+    # Already stored remotely but not journaled yet (e.g. uploaded by make_dataset.py)
+    progress.record([(plan['studentId'], sha256, path) for plan in plans for sha256, path in plan['present']])
+    synced_paths = {os.path.abspath(path) for plan in plans for _, path in plan['present']}
+
+    start = time.perf_counter()
+    uploaded, failed = upload_missing(storage, progress, plans, synced_paths, args.workers,
+                                      min(args.batch_size, FIRESTORE_BATCH_LIMIT), args.max_attempts, missing)
+
+    dropped = forget_spooled(args.capture_spool, synced_paths)
+    elapsed = time.perf_counter() - start
+    print(f"\n📦 {uploaded} uploaded, {failed} failed, {missing - uploaded - failed} not attempted "
+          f"in {elapsed:.1f}s -> {storage.name}")
+    if dropped:
+        print(f"   {dropped} make_dataset.py spool entries no longer needed, removed")
+    if failed or uploaded + failed < missing:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
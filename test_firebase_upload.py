@@ -1,20 +1,22 @@
 #!/usr/bin/env python3
 """
 Simple Firebase Image Upload Tester
-Captures image from camera and uploads to Firebase Storage
+Captures image from camera and uploads to Firebase Storage through the
+backend's FirebaseStorage, so it checks the same path as /api/upload-image:
+the blob under face_dataset/<name>/ and a metadata record in the
+students/{studentId}/images subcollection
 """
 
 import cv2
 import os
 import sys
-import json
-import base64
 from datetime import datetime
-from pathlib import Path
 import firebase_admin
 from firebase_admin import credentials, storage, firestore
 import logging
 
+from storage_backends import FirebaseStorage
+
 # Configure logging
 logging.basicConfig(
     level=logging.DEBUG,
@@ -31,7 +33,9 @@ class FirebaseImageUploader:
         self.firebase_initialized = False
         self.bucket = None
         self.db = None
-        self.init_firebase()
+        self.storage = None
+        if self.init_firebase():
+            self.storage = FirebaseStorage()
     
     def init_firebase(self):
         """Initialize Firebase Admin SDK"""
@@ -167,32 +171,32 @@ class FirebaseImageUploader:
             logger.info(f"📁 Image path: {image_path}")
             logger.info(f"📊 File size: {os.path.getsize(image_path)} bytes")
             
-            # Create unique filename
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            blob_path = f"face_dataset/{student_name}/{student_id}_{timestamp}.jpg"
+            # Same blob path and metadata record as the backend upload queue
+            uploaded_at = datetime.now()
+            timestamp = uploaded_at.strftime("%Y%m%d_%H%M%S")
+            file_name = f"{student_id}_test_{timestamp}.jpg"
+            blob_path = f"face_dataset/{student_name}/{file_name}"
             
             logger.info(f"📤 Uploading to: gs://{self.bucket.name}/{blob_path}")
             
-            # Upload file
-            blob = self.bucket.blob(blob_path)
-            blob.upload_from_filename(image_path, content_type='image/jpeg')
+            with open(image_path, 'rb') as f:
+                self.storage.upload_blob(blob_path, f.read())
             
             logger.info("✓ File uploaded to Storage")
             logger.info(f"✓ Blob URL: gs://{self.bucket.name}/{blob_path}")
             
-            # Save metadata to Firestore
+            # Save the image record to students/{studentId}/images
             try:
-                doc_ref = self.db.collection('students').document(student_id)
-                doc_ref.set({
-                    'name': student_name,
-                    'studentId': student_id,
-                    'imageUploaded': True,
-                    'imagePath': blob_path,
-                    'uploadedAt': datetime.now(),
-                    'fileSize': os.path.getsize(image_path)
-                }, merge=True)
+                self.storage.write_metadata([(student_id, {
+                    'fileName': file_name,
+                    'position': 'test',
+                    'uploadedAt': uploaded_at,
+                    'path': blob_path,
+                    'studentName': student_name,
+                    'studentId': student_id
+                })])
                 
-                logger.info("✓ Metadata saved to Firestore")
+                logger.info(f"✓ Metadata saved to Firestore: students/{student_id}/images")
             except Exception as fs_e:
                 logger.warning(f"⚠ Firestore metadata save failed: {fs_e}")
             
@@ -274,6 +278,7 @@ def main():
             logger.info("🎉 Complete workflow successful!")
             logger.info(f"Image saved locally at: {image_path}")
             logger.info("Check your Firebase Console -> Storage -> face_dataset/Test Student/")
+            logger.info("and Firestore -> students/TEST001/images")
             print("\n" + "=" * 60)
             print("✅ TEST COMPLETE - IMAGE UPLOADED SUCCESSFULLY")
             print("=" * 60)
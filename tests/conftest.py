@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# facial_recognition_backend reads its configuration at import time: never
+# let a test run touch Firebase, the real upload spool or the real gallery
+os.environ['STORAGE_BACKEND'] = 'memory'
+os.environ['UPLOAD_SPOOL_DIR'] = tempfile.mkdtemp(prefix='tests_spool_')
+os.environ['FACE_STORE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='tests_faces_'), 'face_embeddings.log')
@@ -0,0 +1,49 @@
+import random
+import threading
+import time
+
+from facial_recognition_backend import map_bounded
+
+
+class InFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = self.peak = 0
+
+    def __call__(self, item):
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+        time.sleep(random.uniform(0, 0.01))
+        with self.lock:
+            self.current -= 1
+        return item * 2
+
+
+def test_results_keep_input_order_and_respect_the_limit():
+    fn = InFlight()
+    assert list(map_bounded(fn, range(30), limit=2)) == [i * 2 for i in range(30)]
+    assert fn.peak <= 2
+
+
+def test_unordered_results_are_complete():
+    fn = InFlight()
+    assert sorted(map_bounded(fn, range(30), limit=3, ordered=False)) == [i * 2 for i in range(30)]
+    assert fn.peak <= 3
+
+
+def test_stopping_early_cancels_calls_not_started():
+    started = []
+    release = threading.Event()
+
+    def slow(item):
+        started.append(item)
+        release.wait(2)
+        return item
+
+    results = map_bounded(slow, range(20), limit=2)
+    threading.Timer(0.05, release.set).start()
+    assert next(results) == 0
+    results.close()  # consumer gone: the call still queued is cancelled
+    time.sleep(0.05)
+    assert set(started) <= {0, 1}
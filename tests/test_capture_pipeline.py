@@ -0,0 +1,41 @@
+import threading
+import time
+
+from capture_pipeline import DetectionWorker, LatestValue
+
+
+class StalledReader:
+    """FrameReader stand-in whose camera delivers one frame, then nothing"""
+
+    def __init__(self):
+        self.frames = LatestValue()
+        self.frames.put('frame-1')
+
+
+def test_wait_newer_returns_current_value_on_timeout():
+    box = LatestValue()
+    box.put('a')
+    assert box.wait_newer(1, timeout=0.01) == ('a', 1)
+
+
+def test_wait_newer_wakes_on_put():
+    box = LatestValue()
+    threading.Timer(0.05, box.put, args=('a',)).start()
+    assert box.wait_newer(0, timeout=2) == ('a', 1)
+
+
+def test_detection_worker_does_not_redetect_a_stalled_frame(monkeypatch):
+    reader = StalledReader()
+    calls = []
+    worker = DetectionWorker(reader, lambda frame: calls.append(frame) or ([], None, 0.0))
+
+    # Make the wait time out quickly so a stalled camera loops several times
+    wait_newer = reader.frames.wait_newer
+    monkeypatch.setattr(reader.frames, 'wait_newer', lambda seq, timeout=None: wait_newer(seq, 0.01))
+    worker.start()
+    time.sleep(0.2)
+    reader.frames.close()
+    worker.stop()
+
+    assert calls == ['frame-1']
+    assert worker.results.get()[1] == 1
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from embedding_index import INDEX_HEADER, EmbeddingIndex, IndexFile, write_index_file
+
+DIM = 16
+
+
+def vectors(count, seed=0):
+    v = np.random.default_rng(seed).standard_normal((count, DIM)).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def roster(count):
+    embeddings = vectors(count)
+    return {f'S{i:04d}': (f'Student {i}', [('front', embeddings[i])]) for i in range(count)}, embeddings
+
+
+def set_version(path, version):
+    with open(path, 'r+b') as f:
+        f.seek(8)  # after the magic
+        f.write(version.to_bytes(2, 'little'))
+
+
+def test_index_file_round_trip(tmp_path):
+    path = str(tmp_path / 'faces.idx')
+    students, embeddings = roster(20)
+    write_index_file(path, students, DIM, 'test')
+
+    index = EmbeddingIndex.open(path)
+    assert index.engine == 'test' and len(index) == 20
+    assert index.search(embeddings[7:8])[0][0][0] == 'S0007'
+    assert index.name('S0007') == 'Student 7'
+
+
+def test_version_1_files_are_still_read(tmp_path):
+    path = str(tmp_path / 'faces.idx')
+    students, embeddings = roster(5)
+    write_index_file(path, students, DIM, 'test')
+    set_version(path, 1)
+
+    base = IndexFile(path)
+    assert base.nlist == 0 and base.rows == 5
+    assert EmbeddingIndex.open(path).search(embeddings[3:4])[0][0][0] == 'S0003'
+
+
+def test_newer_versions_and_foreign_files_are_refused(tmp_path):
+    path = str(tmp_path / 'faces.idx')
+    write_index_file(path, roster(3)[0], DIM, 'test')
+    set_version(path, 3)
+    with pytest.raises(ValueError):
+        IndexFile(path)
+
+    other = tmp_path / 'other.idx'
+    other.write_bytes(b'\0' * INDEX_HEADER.size)
+    with pytest.raises(ValueError):
+        IndexFile(str(other))
+
+
+def test_ivf_lists_round_trip_and_find_exact_matches(tmp_path):
+    path = str(tmp_path / 'faces.idx')
+    students, embeddings = roster(200)
+    write_index_file(path, students, DIM, 'test', nlist=8)
+
+    assert IndexFile(path).nlist == 8
+    index = EmbeddingIndex.open(path, nprobe=8)  # probing every list = exact
+    results = index.search(embeddings[:50])
+    assert [result[0][0] for result in results] == [f'S{i:04d}' for i in range(50)]
+
+
+def test_rows_added_after_the_file_are_searched_and_saved(tmp_path):
+    path = str(tmp_path / 'faces.idx')
+    students, _ = roster(4)
+    write_index_file(path, students, DIM, 'test')
+    index = EmbeddingIndex.open(path)
+    extra = vectors(1, seed=99)
+    index.add('S9999', extra, ['front'], 'New')
+    index.remove('S0000')
+
+    assert index.search(extra)[0][0][0] == 'S9999'
+    index.save(path)
+    reopened = EmbeddingIndex.open(path)
+    assert sorted(reopened.entries()) == ['S0001', 'S0002', 'S0003', 'S9999']
@@ -0,0 +1,91 @@
+import os
+
+import numpy as np
+import pytest
+
+from embedding_store import EmbeddingStore, LiveFaceIndex
+
+DIM = 8
+
+
+def vector(seed):
+    v = np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'faces.log')
+
+
+def open_store(path):
+    return EmbeddingStore(path, DIM, 'test')
+
+
+def test_adds_and_tombstones_replay_after_reopen(path):
+    store = open_store(path)
+    store.add_many('1', ['front', 'left'], [vector(1), vector(2)], 'Ann')
+    store.add('2', 'front', vector(3), 'Bob')
+    store.remove('1', 'left')
+    store.remove('2')
+
+    assert open_store(path).live_keys() == {('1', 'front')}
+
+
+def test_re_enrolling_a_position_replaces_it(path):
+    store = open_store(path)
+    store.add('1', 'front', vector(1), 'Ann')
+    store.add('1', 'front', vector(2), 'Ann')
+
+    index = open_store(path).load_index()[0]
+    assert index.search([vector(2)])[0][0][0] == '1'
+    assert open_store(path).live_keys() == {('1', 'front')}
+    assert len(index) == 1
+
+
+def test_torn_record_is_ignored_then_truncated_by_the_next_append(path):
+    store = open_store(path)
+    store.add('1', 'front', vector(1), 'Ann')
+    size = os.path.getsize(path)
+    with open(path, 'ab') as f:
+        f.write(b'\x40\x00\x00\x00\x01partial')  # crash in the middle of a record
+
+    assert open_store(path).live_keys() == {('1', 'front')}
+    writer = open_store(path)
+    writer.add('2', 'front', vector(2), 'Bob')
+    assert os.path.getsize(path) > size
+    assert open_store(path).live_keys() == {('1', 'front'), ('2', 'front')}
+
+
+def test_compaction_keeps_live_rows_and_empties_the_log(path):
+    store = open_store(path)
+    store.add_many('1', ['front', 'left'], [vector(1), vector(2)], 'Ann')
+    store.remove('1', 'left')
+
+    assert store.compact() == 2  # the replaced left row and its tombstone
+    assert store.read()[0] == []
+    assert os.path.exists(store.index_path)
+    store.add('2', 'front', vector(3), 'Bob')
+    assert open_store(path).live_keys() == {('1', 'front'), ('2', 'front')}
+
+
+def test_engine_mismatch_is_refused(path):
+    open_store(path)
+    with pytest.raises(ValueError):
+        EmbeddingStore(path, DIM, 'other')
+    with pytest.raises(ValueError):
+        EmbeddingStore(path, DIM * 2, 'test')
+
+
+def test_live_index_sees_other_writers_and_compactions(path):
+    live = LiveFaceIndex(open_store(path))
+    other = open_store(path)
+
+    other.add('1', 'front', vector(1), 'Ann')
+    assert live.current().search([vector(1)])[0][0][0] == '1'
+
+    other.compact()
+    other.add('2', 'front', vector(2), 'Bob')
+    assert live.current().search([vector(2)])[0][0][0] == '2'
+    other.remove('1')
+    assert [sid for sid, _ in live.current().search([vector(1)], k=2)[0]] == ['2']
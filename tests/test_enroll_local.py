@@ -0,0 +1,72 @@
+import json
+import os
+import shutil
+
+import cv2
+import numpy as np
+import pytest
+
+from embedding_store import EmbeddingStore
+from enroll_local import sync_store
+from face_embedding import create_embedder
+
+
+@pytest.fixture
+def embedder():
+    return create_embedder('lbp')
+
+
+@pytest.fixture
+def store(tmp_path, embedder):
+    return EmbeddingStore(str(tmp_path / 'faces.log'), embedder.dim, embedder.name)
+
+
+def make_student(dataset, student_id, name, images=('000', '001')):
+    folder = dataset / '10A' / name
+    folder.mkdir(parents=True)
+    (folder / 'metadata.json').write_text(json.dumps({'id': student_id, 'name': name}))
+    rng = np.random.default_rng(int(student_id))
+    for image in images:
+        cv2.imwrite(str(folder / f'{image}.jpg'), rng.integers(0, 255, (224, 224, 3), dtype=np.uint8))
+    return folder
+
+
+def test_sync_enrolls_crops_under_local_positions(tmp_path, store, embedder):
+    make_student(tmp_path / 'ds', '1', 'Ann')
+
+    assert sync_store(store, embedder, str(tmp_path / 'ds')) == (2, 0)
+    assert store.live_keys() == {('1', 'local:000'), ('1', 'local:001')}
+    # Nothing left to do on a second run
+    assert sync_store(store, embedder, str(tmp_path / 'ds')) == (0, 0)
+
+
+def test_api_enrolled_position_survives_sync(tmp_path, store, embedder):
+    folder = make_student(tmp_path / 'ds', '1', 'Ann')
+    store.add('1', 'front', np.ones(embedder.dim, np.float32), 'Ann')
+    store.add('2', 'left', np.ones(embedder.dim, np.float32), 'Bob')
+
+    sync_store(store, embedder, str(tmp_path / 'ds'))
+    os.remove(folder / '001.jpg')
+    assert sync_store(store, embedder, str(tmp_path / 'ds')) == (0, 1)
+
+    assert store.live_keys() == {('1', 'local:000'), ('1', 'front'), ('2', 'left')}
+
+
+def test_deleted_student_folder_is_tombstoned(tmp_path, store, embedder):
+    make_student(tmp_path / 'ds', '1', 'Ann')
+    folder = make_student(tmp_path / 'ds', '2', 'Bob')
+    store.add('2', 'front', np.ones(embedder.dim, np.float32), 'Bob')
+    sync_store(store, embedder, str(tmp_path / 'ds'))
+
+    shutil.rmtree(folder)
+    assert sync_store(store, embedder, str(tmp_path / 'ds')) == (0, 2)
+
+    assert store.live_keys() == {('1', 'local:000'), ('1', 'local:001'), ('2', 'front')}
+
+
+def test_pre_namespace_keys_of_dataset_crops_are_replaced(tmp_path, store, embedder):
+    make_student(tmp_path / 'ds', '1', 'Ann', images=('000',))
+    store.add('1', '000', np.ones(embedder.dim, np.float32), 'Ann')
+
+    assert sync_store(store, embedder, str(tmp_path / 'ds')) == (1, 1)
+    assert store.live_keys() == {('1', 'local:000')}
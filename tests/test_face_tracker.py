@@ -0,0 +1,61 @@
+import numpy as np
+
+from face_detection import DetectionResult, DetectionTier, FaceTracker, best_face_index
+
+TIER = DetectionTier('fake', 'gray', 1.1, 3, 20, 400)
+FACE = (200, 120, 80, 80)
+FALSE_POSITIVE = (10, 10, 180, 180)
+
+
+class FakeDetector:
+    """Finds the bright square in any image; full frames also yield a big, weak false positive"""
+
+    def __init__(self, frame_shape):
+        self.frame_shape = frame_shape
+
+    def detect(self, image, tiers=None, max_dim=None):
+        faces, scores = [], []
+        ys, xs = np.nonzero(image[:, :, 0] == 255)
+        if len(xs):
+            faces.append((xs.min(), ys.min(), xs.max() - xs.min() + 1, ys.max() - ys.min() + 1))
+            scores.append(12.0)
+        if image.shape == self.frame_shape:
+            faces.append(FALSE_POSITIVE)
+            scores.append(3.0)
+        if not faces:
+            return DetectionResult((), None, None, 1.0)
+        return DetectionResult(np.array(faces, np.int32), TIER, None, 1.0, np.array(scores, np.float32))
+
+
+def make_frame():
+    frame = np.zeros((480, 640, 3), np.uint8)
+    x, y, w, h = FACE
+    frame[y:y + h, x:x + w] = 255
+    return frame
+
+
+def test_tracker_follows_the_most_confident_face_not_the_largest():
+    frame = make_frame()
+    tracker = FaceTracker((TIER,), full_search_interval=10)
+    detector = FakeDetector(frame.shape)
+
+    modes = [tracker.update(detector, frame)[1] for _ in range(5)]
+
+    assert modes == ['full', 'roi', 'roi', 'roi', 'roi']
+    assert tracker.last_box == FACE
+
+
+def test_tracker_reports_the_tier_that_hit():
+    frame = make_frame()
+    tracker = FaceTracker((TIER,))
+    detector = FakeDetector(frame.shape)
+
+    assert tracker.update(detector, frame)[2] == TIER
+    assert tracker.update(detector, frame)[2] == TIER
+    assert tracker.update(detector, np.zeros((100, 100, 3), np.uint8))[2] is None
+
+
+def test_best_face_falls_back_to_the_largest_without_scores():
+    faces = np.array([FACE, FALSE_POSITIVE], np.int32)
+    assert best_face_index(DetectionResult(faces, TIER, None, 1.0)) == 1
+    assert best_face_index(DetectionResult(faces, TIER, None, 1.0, np.array([5.0, 1.0]))) == 0
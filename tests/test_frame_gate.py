@@ -0,0 +1,66 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import facial_recognition_backend as backend
+from facial_recognition_backend import FrameGate
+
+
+def blank_jpeg():
+    ok, buffer = cv2.imencode('.jpg', np.zeros((120, 160, 3), np.uint8))
+    assert ok
+    return buffer.tobytes()
+
+
+def test_waiting_frame_is_superseded_by_a_newer_one():
+    gate = FrameGate()
+    assert gate.enter(1) == 'admitted'
+
+    results = {}
+    older = threading.Thread(target=lambda: results.setdefault('older', gate.enter(2)))
+    older.start()
+    time.sleep(0.05)
+    newer = threading.Thread(target=lambda: results.setdefault('newer', gate.enter(2)))
+    newer.start()
+    older.join(1)
+    assert results['older'] == 'superseded'
+
+    gate.leave()
+    newer.join(1)
+    assert results['newer'] == 'admitted'
+
+
+def test_waiting_frame_times_out_while_the_client_is_busy():
+    gate = FrameGate()
+    assert gate.enter(1) == 'admitted'
+    assert gate.enter(0.05) == 'timeout'
+    gate.leave()
+    assert gate.enter(0.05) == 'admitted'
+
+
+def test_detect_faces_sheds_load_when_all_slots_are_taken(monkeypatch):
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()
+    monkeypatch.setattr(backend, 'detect_slots', slots)
+
+    response = backend.app.test_client().post(
+        '/api/detect-faces', data=blank_jpeg(), content_type='image/jpeg')
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
+    assert response.get_json()['status'] == 'busy'
+
+
+def test_detect_faces_answers_busy_client_with_429(monkeypatch):
+    monkeypatch.setattr(backend, 'DETECT_QUEUE_TIMEOUT', 0.05)
+    gate = backend.get_frame_gate('busy-client')
+    assert gate.enter(1) == 'admitted'
+    try:
+        response = backend.app.test_client().post(
+            '/api/detect-faces', data=blank_jpeg(), content_type='image/jpeg',
+            headers={'X-Client-Id': 'busy-client'})
+    finally:
+        gate.leave()
+    assert response.status_code == 429
+    assert response.get_json()['status'] == 'busy'
@@ -0,0 +1,23 @@
+import os
+
+import numpy as np
+
+import ingest_dataset
+
+
+def test_reingest_removes_crops_of_the_previous_run(tmp_path, monkeypatch):
+    faces = iter([(40, 40, 120, 120), (300, 40, 120, 120)])
+    monkeypatch.setitem(ingest_dataset._worker, 'detect', lambda frame: ([], next(faces, None), 50.0))
+    monkeypatch.setattr(ingest_dataset, 'sample_frames',
+                        lambda path, fps, max_frames: (np.full((480, 640, 3), 128, np.uint8) for _ in range(3)))
+    student = {'id': '1', 'name': 'Ann', 'class': '10A', 'source': ''}
+    folder = tmp_path / '10A' / 'Ann'
+    folder.mkdir(parents=True)
+    for name in ('000', '001', '002', '003'):
+        (folder / f'{name}.jpg').write_bytes(b'old')
+
+    result = ingest_dataset.ingest_student(student, ['clip.mp4'], str(tmp_path), 3, 2.0, 10)
+
+    assert len(result['saved']) == 2
+    assert sorted(os.listdir(folder)) == ['000.jpg', '001.jpg', 'metadata.json']
+    assert (folder / '000.jpg').read_bytes() != b'old'
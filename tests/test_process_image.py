@@ -0,0 +1,56 @@
+import base64
+
+import cv2
+import numpy as np
+import pytest
+
+import facial_recognition_backend as backend
+from benchmarks.corpus import RESOLUTIONS, make_frame
+
+
+@pytest.fixture(scope='module')
+def client():
+    return backend.app.test_client()
+
+
+@pytest.fixture(scope='module')
+def frame():
+    image, faces = make_frame(RESOLUTIONS['480p'], [0.3], 1.0, seed=2)
+    return image, faces
+
+
+def post(client, image, **fields):
+    _, encoded = cv2.imencode('.jpg', image)
+    body = dict(image=base64.b64encode(encoded).decode(), studentId='1', studentName='Ann', className='10A')
+    return client.post('/api/process-image', json=dict(body, **fields)).get_json()
+
+
+def test_no_visualization_by_default(client, frame):
+    result = post(client, frame[0])
+
+    assert result['success'] and result['faces_detected'] == 1
+    assert result['processed_image'].startswith('data:image/jpeg;base64,')
+    assert 'visualization' not in result and 'faces' not in result
+
+
+def test_boxes_mode_returns_coordinates_of_the_uploaded_image(client, frame):
+    image, (truth,) = frame
+    result = post(client, image, visualization='boxes')
+
+    assert result['image_size'] == {'width': image.shape[1], 'height': image.shape[0]}
+    box = result['faces'][0]
+    assert abs(box['x'] - truth[0]) < 15 and abs(box['w'] - truth[2]) < 20
+    assert 'visualization' not in result
+
+
+@pytest.mark.parametrize('mode, max_side', [
+    ('preview', backend.VISUALIZATION_PREVIEW_DIM),
+    (True, backend.VISUALIZATION_PREVIEW_DIM),  # legacy boolean flag
+    ('full', 640),
+])
+def test_rendered_visualizations(client, frame, mode, max_side):
+    result = post(client, frame[0], visualization=mode)
+
+    encoded = base64.b64decode(result['visualization'].split(',', 1)[1])
+    rendered = cv2.imdecode(np.frombuffer(encoded, np.uint8), cv2.IMREAD_COLOR)
+    assert max(rendered.shape[:2]) == max_side
@@ -0,0 +1,106 @@
+import time
+
+import sync_dataset
+from storage_backends import MemoryStorage
+from sync_dataset import SyncProgress, upload_missing
+
+
+class SlowStorage(MemoryStorage):
+    def upload_blob(self, path, data, content_type='image/jpeg'):
+        if b'slow' in data:
+            time.sleep(0.3)
+        super().upload_blob(path, data, content_type)
+
+
+def make_plan(tmp_path, contents):
+    missing = []
+    for idx, data in enumerate(contents):
+        path = tmp_path / f'{idx:03d}.jpg'
+        path.write_bytes(data)
+        missing.append((f'{idx:03d}', str(path), sync_dataset.hash_bytes(data)))
+    return {'studentId': 'S1', 'name': 'Ann', 'missing': missing}
+
+
+def test_interrupt_waits_for_running_uploads(tmp_path, monkeypatch):
+    storage = SlowStorage()
+    progress = SyncProgress(str(tmp_path / 'progress.jsonl'), storage.name)
+    plan = make_plan(tmp_path, [b'slow-1', b'slow-2', b'queued-1', b'queued-2'])
+
+    def interrupted_as_completed(futures):
+        # Ctrl+C while the first two uploads are running and two are queued
+        time.sleep(0.05)
+        raise KeyboardInterrupt
+        yield
+
+    monkeypatch.setattr(sync_dataset, 'as_completed', interrupted_as_completed)
+    uploaded, failed = upload_missing(storage, progress, [plan], set(), 2, 10, 1, 4)
+
+    assert (uploaded, failed) == (2, 0)
+    # Every stored blob has its metadata record and journal entry
+    records = storage.list_metadata('S1')
+    assert sorted(record['path'] for record in records) == sorted(storage.blobs)
+    assert len(progress.done) == 2
+    assert {record['position'] for record in records} == {'000', '001'}
+
+
+class CountingStorage(MemoryStorage):
+    def __init__(self):
+        super().__init__()
+        self.downloads = 0
+
+    def download_blob(self, path):
+        self.downloads += 1
+        return super().download_blob(path)
+
+
+def test_journal_survives_a_torn_last_line(tmp_path):
+    path = str(tmp_path / 'progress.jsonl')
+    progress = SyncProgress(path, 'memory')
+    progress.record([('S1', 'aa', 'a.jpg'), ('S1', 'bb', 'b.jpg')])
+    progress.record_blob_hashes({'face_dataset/Ann/old.jpg': 'cc'})
+    with open(path, 'a') as f:
+        f.write('{"backend": "memory", "studentId": "S1", "sha')
+
+    reloaded = SyncProgress(path, 'memory')
+    assert reloaded.done == {('S1', 'aa'), ('S1', 'bb')}
+    assert reloaded.blob_hashes == {'face_dataset/Ann/old.jpg': 'cc'}
+    # Entries of another backend are not ours
+    assert SyncProgress(path, 'local').done == set()
+
+
+def test_legacy_blobs_are_downloaded_once(tmp_path):
+    storage = CountingStorage()
+    storage.upload_blob('face_dataset/Ann/old.jpg', b'old')
+    storage.write_metadata([('S1', {'path': 'face_dataset/Ann/old.jpg'}), ('S1', {'sha256': 'new'})])
+    path = str(tmp_path / 'progress.jsonl')
+
+    first = sync_dataset.remote_hashes(storage, SyncProgress(path, 'memory'), 'S1')
+    second = sync_dataset.remote_hashes(storage, SyncProgress(path, 'memory'), 'S1')
+
+    assert first == second == ({sync_dataset.hash_bytes(b'old'), 'new'}, 2, 0)
+    assert storage.downloads == 1
+
+
+def test_plan_skips_journaled_and_stored_images(tmp_path):
+    storage = MemoryStorage()
+    a, b, c = (tmp_path / f'{name}.jpg' for name in 'abc')
+    for path, data in ((a, b'a'), (b, b'b'), (c, b'c')):
+        path.write_bytes(data)
+    storage.write_metadata([('S1', {'sha256': sync_dataset.hash_bytes(b'b')})])
+    progress = SyncProgress(str(tmp_path / 'progress.jsonl'), 'memory')
+    progress.record([('S1', sync_dataset.hash_bytes(b'a'), str(a))])
+
+    plan = sync_dataset.plan_student(storage, progress, 'S1', 'Ann', {'000': str(a), '001': str(b), '002': str(c)})
+
+    assert [(position, path) for position, path, _ in plan['missing']] == [('002', str(c))]
+    assert len(plan['present']) == 2
+
+
+def test_positions_are_uploaded_as_strings(tmp_path):
+    storage = MemoryStorage()
+    progress = SyncProgress(str(tmp_path / 'progress.jsonl'), storage.name)
+    plan = make_plan(tmp_path, [b'one'])
+
+    upload_missing(storage, progress, [plan], set(), 1, 10, 1, 1)
+
+    assert [record['position'] for record in storage.list_metadata('S1')] == ['000']
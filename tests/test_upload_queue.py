@@ -0,0 +1,131 @@
+import json
+import os
+
+import pytest
+
+from storage_backends import LocalStorage, MemoryStorage
+from upload_queue import UploadQueue
+
+
+class FailingStorage(MemoryStorage):
+    def upload_blob(self, path, data, content_type='image/jpeg'):
+        raise ConnectionError('offline')
+
+
+def make_queue(storage, spool_dir, **kwargs):
+    return UploadQueue(storage, str(spool_dir), backoff=0.001, flush_interval=0.01, **kwargs)
+
+
+def spool_an_entry(spool_dir):
+    """Spool one job without uploading it, as a process that crashed right after submit()"""
+    queue = make_queue(MemoryStorage(), spool_dir)
+    queue._started = True  # no workers
+    job = queue.submit(b'jpeg', 'Ann', 'S1', 'front')
+    queue._release(job)
+    return job
+
+
+def test_submit_uploads_and_empties_the_spool(tmp_path):
+    storage = MemoryStorage()
+    queue = make_queue(storage, tmp_path)
+    job = queue.submit(b'jpeg', 'Ann', 'S1', 'front')
+    queue.join()
+
+    assert queue.status(job.id)['state'] == 'done'
+    assert storage.blobs[job.blob_path] == b'jpeg'
+    assert [record['id'] for record in storage.list_metadata('S1')] == [job.id]
+    assert os.listdir(tmp_path) == []
+
+
+def test_start_recovers_an_unclaimed_entry(tmp_path):
+    job = spool_an_entry(tmp_path)
+    storage = MemoryStorage()
+    queue = make_queue(storage, tmp_path)
+    queue.start()
+    queue.join()
+
+    assert storage.blobs[job.blob_path] == b'jpeg'
+    assert queue.status(job.id)['state'] == 'done'
+    assert os.listdir(tmp_path) == []
+
+
+def test_entry_claimed_by_another_queue_is_not_recovered(tmp_path):
+    owner = make_queue(MemoryStorage(), tmp_path)
+    owner._started = True
+    job = owner.submit(b'jpeg', 'Ann', 'S1', 'front')
+
+    other = make_queue(MemoryStorage(), tmp_path)
+    assert other._recover() == 0
+    owner._release(job)
+    assert other._recover() == 1
+
+
+def test_failed_entry_stays_spooled_and_is_not_retried(tmp_path):
+    queue = make_queue(FailingStorage(), tmp_path, max_attempts=2)
+    job = queue.submit(b'jpeg', 'Ann', 'S1', 'front')
+    queue.join()
+
+    assert queue.status(job.id)['state'] == 'failed'
+    with open(tmp_path / f'{job.id}.json') as f:
+        assert json.load(f)['state'] == 'failed'
+    assert make_queue(MemoryStorage(), tmp_path)._recover() == 0
+
+
+def test_recovery_removes_orphaned_lock_files(tmp_path):
+    (tmp_path / 'deadbeef.lock').write_text('')
+    job = spool_an_entry(tmp_path)
+    queue = make_queue(MemoryStorage(), tmp_path)
+    queue._started = True
+
+    assert queue._recover() == 1
+    assert sorted(os.listdir(tmp_path)) == sorted(f'{job.id}.{ext}' for ext in ('jpg', 'json', 'lock'))
+
+
+def test_entry_finished_during_recovery_leaves_no_lock_file(tmp_path, monkeypatch):
+    job = spool_an_entry(tmp_path)
+    queue = make_queue(MemoryStorage(), tmp_path)
+    queue._started = True
+    listdir = os.listdir
+
+    def listdir_then_finish(path):
+        # The owner finishes the job between the listing and the claim
+        names = listdir(path)
+        for ext in ('json', 'jpg', 'lock'):
+            os.remove(tmp_path / f'{job.id}.{ext}')
+        return names
+
+    monkeypatch.setattr(os, 'listdir', listdir_then_finish)
+    assert queue._recover() == 0
+    monkeypatch.undo()
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize('backend', ['memory', 'local'])
+def test_replayed_metadata_write_overwrites(tmp_path, backend):
+    storage = MemoryStorage() if backend == 'memory' else LocalStorage(str(tmp_path))
+    record = {'id': 'job-1', 'path': 'face_dataset/Ann/a.jpg', 'position': 'front'}
+    storage.write_metadata([('S1', record)])
+    storage.write_metadata([('S1', dict(record, position='left'))])
+    storage.write_metadata([('S1', {'path': 'face_dataset/Ann/b.jpg'})])
+
+    records = storage.list_metadata('S1')
+    assert len(records) == 2
+    assert [r['position'] for r in records if r['id'] == 'job-1'] == ['left']
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork()')
+def test_forked_child_does_not_recover_the_parents_jobs(tmp_path):
+    parent = make_queue(MemoryStorage(), tmp_path)
+    parent._started = True
+    job = parent.submit(b'jpeg', 'Ann', 'S1', 'front')
+
+    pid = os.fork()
+    if pid == 0:
+        child = parent
+        child.after_fork()  # drops (and closes) the inherited claims
+        os._exit(child._recover())
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0  # nothing recovered: the parent still owns the job
+
+    parent._release(job)
+    assert make_queue(MemoryStorage(), tmp_path)._recover() == 1
@@ -0,0 +1,52 @@
+import json
+import os
+
+import pytest
+
+import facial_recognition_backend as backend
+
+
+def test_ready_turns_green_after_warm_up():
+    client = backend.app.test_client()
+    backend.warm_up.start(background=False)
+
+    response = client.get('/api/ready')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['ready'] and body['face_processors'] >= 1
+
+
+def test_warm_up_failure_is_reported(monkeypatch):
+    warm_up = backend.WarmUp()
+    monkeypatch.setattr(backend.face_processor_pool, 'prewarm', lambda count: False)
+    warm_up.start(background=False)
+    assert warm_up.state == 'failed' and not warm_up.ready
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork()')
+def test_forked_worker_drops_inherited_state():
+    backend.warm_up.start(background=False)
+    assert backend.get_live_index() is not None
+    parent_pool = id(backend.batch_pool)
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # Child: register_at_fork has run reset_after_fork()
+        try:
+            state = {
+                'warm_up': backend.warm_up.state,
+                'live_index': backend.face_index_state['live'] is None,
+                'upload_queue_started': backend.upload_queue._started,
+                'new_batch_pool': id(backend.batch_pool) != parent_pool,
+            }
+            os.write(write_fd, json.dumps(state).encode())
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        state = json.loads(f.read())
+    os.waitpid(pid, 0)
+
+    assert state == {'warm_up': 'pending', 'live_index': True, 'upload_queue_started': False, 'new_batch_pool': True}
+    assert backend.warm_up.ready  # the parent keeps its state
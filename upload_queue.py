@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+"""
+Background Upload Queue
+- Bounded job queue, spooled to disk before the HTTP request returns
+- Worker threads uploading through a pluggable storage backend
+- Metadata records grouped into batched writes
+- Retry with exponential backoff and pollable job status
+- Spool entries claimed with a file lock, so worker processes sharing the
+  spool never upload the same job twice
+"""
+
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from metrics import endpoint_scope, time_stage
+from storage_backends import FIRESTORE_BATCH_LIMIT
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the upload queue has no room for another job"""
+
+
+class UploadJob:
+    """One image waiting to be uploaded and recorded in the image metadata"""
+
+    def __init__(self, student_name, student_id, position, job_id=None, created_at=None, sha256=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.student_name = student_name
+        self.student_id = student_id
+        self.position = position
+        self.created_at = created_at or datetime.now()
+        timestamp = self.created_at.strftime("%Y%m%d_%H%M%S")
+        self.file_name = f'{student_id}_{position}_{timestamp}.jpg'
+        self.blob_path = f'face_dataset/{student_name}/{self.file_name}'
+        self.sha256 = sha256  # content hash, lets sync_dataset.py skip images already stored
+        self.state = 'queued'  # queued -> uploading -> writing_metadata -> done | failed
+        self.attempts = 0
+        self.error = None
+        self.uploaded_at = None
+        self.updated_at = time.time()
+        self.claim = None  # open lock file while this process owns the spool entry
+
+    def set_state(self, state, error=None):
+        self.state = state
+        self.error = error
+        self.updated_at = time.time()
+
+    def metadata(self):
+        """Metadata record for students/{id}/images, keyed by the job id so a replayed write overwrites"""
+        return {
+            'id': self.id,
+            'fileName': self.file_name,
+            'position': self.position,
+            'uploadedAt': self.uploaded_at or datetime.now(),
+            'path': self.blob_path,
+            'studentName': self.student_name,
+            'studentId': self.student_id,
+            'sha256': self.sha256
+        }
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'state': self.state,
+            'attempts': self.attempts,
+            'error': self.error,
+            'firebase_path': self.blob_path,
+            'studentId': self.student_id,
+            'position': self.position,
+            'created_at': self.created_at.isoformat()
+        }
+
+
+class UploadQueue:
+    """
+    Upload images in the background.
+
+    submit() writes the image and its job record to the spool directory
+    (fsync'd) and returns; worker threads upload the blobs and hand the
+    metadata to a single writer that commits it in batches.
+    Spooled jobs left over from a crash are picked up again by start().
+    Every spool entry is claimed with an exclusive lock on <id>.lock for as
+    long as a process works on it; the lock goes away with the process, so
+    a crashed worker's jobs are recovered by the next start().
+
+    Args:
+        storage: StorageBackend the blobs and metadata are written to
+    """
+
+    def __init__(self, storage, spool_dir, workers=2, max_size=256, max_attempts=5,
+                 backoff=1.0, batch_size=50, flush_interval=0.5, max_tracked_jobs=1000):
+        self.storage = storage
+        self.spool_dir = spool_dir
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.batch_size = min(batch_size, FIRESTORE_BATCH_LIMIT)
+        self.flush_interval = flush_interval
+        self.max_tracked_jobs = max_tracked_jobs
+
+        self.max_size = max_size
+        self._reset()
+
+    def _reset(self):
+        self._jobs = queue.Queue(maxsize=self.max_size)
+        self._metadata = queue.Queue()
+        self._status = OrderedDict()  # job id -> UploadJob, oldest first
+        self._lock = threading.Lock()
+        self._started = False
+
+    def after_fork(self):
+        """
+        Forget the parent's queue and workers (threads do not survive fork).
+        Jobs still spooled by the parent are recovered by start().
+        """
+        with self._lock:
+            jobs = list(self._status.values())
+        for job in jobs:
+            # Close the inherited descriptors only - the parent keeps its locks
+            if job.claim is not None:
+                job.claim.close()
+                job.claim = None
+        self._reset()
+
+    # ------------------------------------------------------------------
+    # Spool
+    # ------------------------------------------------------------------
+
+    def _spool_path(self, job_id, ext):
+        return os.path.join(self.spool_dir, f'{job_id}.{ext}')
+
+    def _write_durably(self, path, data):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _spool(self, job, image_data):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._write_durably(self._spool_path(job.id, 'jpg'), bytes(image_data))
+        record = {
+            'job_id': job.id,
+            'studentName': job.student_name,
+            'studentId': job.student_id,
+            'position': job.position,
+            'created_at': job.created_at.isoformat(),
+            'sha256': job.sha256
+        }
+        # The job record is written last - it marks the spool entry complete
+        self._write_durably(self._spool_path(job.id, 'json'), json.dumps(record).encode())
+
+    def _claim(self, job_id):
+        """Lock a spool entry for this process; returns the lock file, or None if another process has it"""
+        os.makedirs(self.spool_dir, exist_ok=True)
+        path = self._spool_path(job_id, 'lock')
+        while True:
+            claim = open(path, 'a')
+            if fcntl is None:
+                return claim
+            try:
+                fcntl.flock(claim.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                claim.close()
+                return None
+            # The previous owner may have unlinked the lock file between open and flock
+            try:
+                if os.fstat(claim.fileno()).st_ino == os.stat(path).st_ino:
+                    return claim
+            except FileNotFoundError:
+                pass
+            claim.close()
+
+    def _release(self, job):
+        if job.claim is not None:
+            job.claim.close()
+            job.claim = None
+
+    def _remove_lock(self, job_id):
+        try:
+            os.remove(self._spool_path(job_id, 'lock'))
+        except FileNotFoundError:
+            pass
+
+    def _unspool(self, job):
+        # The job record goes first - without it the entry is never recovered
+        for ext in ('json', 'jpg'):
+            try:
+                os.remove(self._spool_path(job.id, ext))
+            except FileNotFoundError:
+                pass
+        self._release(job)
+        self._remove_lock(job.id)
+
+    def _read_image(self, job):
+        with open(self._spool_path(job.id, 'jpg'), 'rb') as f:
+            return f.read()
+
+    def _recover(self):
+        """Re-queue spooled jobs no live process owns (left over from a crash or restart)"""
+        if not os.path.isdir(self.spool_dir):
+            return 0
+        recovered = 0
+        names = sorted(os.listdir(self.spool_dir))
+        self._sweep_locks(names)
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            job_id = name[:-len('.json')]
+            with self._lock:
+                if job_id in self._status:
+                    continue  # submitted by this process meanwhile
+            claim = self._claim(job_id)
+            if claim is None:
+                continue  # another worker is uploading it
+            try:
+                # Re-read under the claim: the owner may have finished it since the listing
+                with open(os.path.join(self.spool_dir, name), 'r', encoding='utf-8') as f:
+                    record = json.load(f)
+                if record.get('state') == 'failed':
+                    claim.close()
+                    continue
+                job = UploadJob(
+                    record['studentName'], record['studentId'], record['position'],
+                    job_id=record['job_id'], created_at=datetime.fromisoformat(record['created_at']),
+                    sha256=record.get('sha256')
+                )
+                job.claim = claim
+                self._jobs.put_nowait(job)
+                self._track(job)
+                recovered += 1
+            except queue.Full:
+                claim.close()
+                logger.warning('Upload queue full, remaining spooled jobs stay on disk')
+                break
+            except FileNotFoundError:
+                # Finished by its owner since the listing - the entry is gone for good
+                claim.close()
+                self._remove_lock(job_id)
+            except Exception as e:
+                claim.close()
+                logger.error(f'Could not recover spooled upload {name}: {e}')
+        if recovered:
+            logger.info(f'✓ Recovered {recovered} spooled upload(s)')
+        return recovered
+
+    def _sweep_locks(self, names):
+        """Remove lock files left without a job record (owner crashed while unspooling)"""
+        records = {name[:-len('.json')] for name in names if name.endswith('.json')}
+        for name in names:
+            job_id = name[:-len('.lock')]
+            if not name.endswith('.lock') or job_id in records:
+                continue
+            claim = self._claim(job_id)
+            if claim is None:
+                continue  # held: a submit is writing the entry right now
+            try:
+                if not os.path.exists(self._spool_path(job_id, 'json')):
+                    os.remove(self._spool_path(job_id, 'lock'))
+            except FileNotFoundError:
+                pass
+            finally:
+                claim.close()
+
+    # ------------------------------------------------------------------
+    # Job tracking
+    # ------------------------------------------------------------------
+
+    def _track(self, job):
+        with self._lock:
+            self._status[job.id] = job
+            # Forget the oldest finished jobs
+            while len(self._status) > self.max_tracked_jobs:
+                oldest_id, oldest = next(iter(self._status.items()))
+                if oldest.state not in ('done', 'failed'):
+                    break
+                del self._status[oldest_id]
+
+    def status(self, job_id):
+        """Job status dict, or None if the job is unknown"""
+        with self._lock:
+            job = self._status.get(job_id)
+            return job.to_dict() if job else None
+
+    def stats(self):
+        with self._lock:
+            states = {}
+            for job in self._status.values():
+                states[job.state] = states.get(job.state, 0) + 1
+        return {'queued': self._jobs.qsize(), 'pending_metadata': self._metadata.qsize(), 'jobs': states}
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Start the worker threads (once) and recover spooled jobs"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for idx in range(self.workers):
+            threading.Thread(target=self._upload_worker, name=f'upload-{idx}', daemon=True).start()
+        threading.Thread(target=self._metadata_writer, name='upload-metadata', daemon=True).start()
+        self._recover()
+
+    def submit(self, image_data, student_name, student_id, position):
+        """
+        Spool an image and queue it for upload.
+
+        Returns:
+            UploadJob: the queued job
+
+        Raises:
+            QueueFullError: when the queue is at capacity
+        """
+        self.start()
+        if self._jobs.full():
+            raise QueueFullError('Upload queue is full')
+        job = UploadJob(student_name, student_id, position, sha256=hashlib.sha256(image_data).hexdigest())
+        # Claimed before the job record exists, so no other process can recover it mid-spool
+        job.claim = self._claim(job.id)
+        self._spool(job, image_data)
+        self._track(job)
+        try:
+            self._jobs.put_nowait(job)
+        except queue.Full:
+            # Lost the race for the last slot - keep the spool file for the next restart
+            job.set_state('failed', 'Upload queue is full')
+            self._release(job)
+            raise QueueFullError('Upload queue is full')
+        return job
+
+    def _retry_delay(self, attempt):
+        return min(self.backoff * (2 ** (attempt - 1)), 60)
+
+    def _fail(self, job, error):
+        logger.error(f'Upload {job.id} failed after {job.attempts} attempt(s): {error}')
+        job.set_state('failed', str(error))
+        # Keep the spooled image, marked failed, so it can be synced later
+        try:
+            path = self._spool_path(job.id, 'json')
+            with open(path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+            record.update({'state': 'failed', 'error': str(error)})
+            self._write_durably(path, json.dumps(record).encode())
+        except Exception as e:
+            logger.error(f'Could not mark spooled upload {job.id} as failed: {e}')
+        self._release(job)
+
+    def _upload_worker(self):
+        with endpoint_scope('upload_image'):
+            self._upload_loop()
+
+    def _upload_loop(self):
+        while True:
+            job = self._jobs.get()
+            try:
+                image_data = self._read_image(job)
+                while True:
+                    job.attempts += 1
+                    job.set_state('uploading')
+                    try:
+                        with time_stage('storage_upload'):
+                            self.storage.upload_blob(job.blob_path, image_data)
+                        break
+                    except Exception as e:
+                        if job.attempts >= self.max_attempts:
+                            raise
+                        delay = self._retry_delay(job.attempts)
+                        logger.warning(f'Upload {job.id} attempt {job.attempts} failed ({e}), retrying in {delay:.1f}s')
+                        job.set_state('queued', str(e))
+                        time.sleep(delay)
+                job.uploaded_at = datetime.now()
+                logger.info(f'✓ Uploaded to {self.storage.name}: {job.blob_path}')
+                job.set_state('writing_metadata')
+                self._metadata.put(job)
+            except Exception as e:
+                self._fail(job, e)
+            finally:
+                self._jobs.task_done()
+
+    def _next_metadata_batch(self):
+        """Block for one job, then collect more until the batch is full or the interval ends"""
+        batch = [self._metadata.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._metadata.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _metadata_writer(self):
+        with endpoint_scope('upload_image'):
+            self._metadata_loop()
+
+    def _metadata_loop(self):
+        while True:
+            jobs = self._next_metadata_batch()
+            attempt = 0
+            while True:
+                attempt += 1
+                try:
+                    with time_stage('metadata_write'):
+                        self.storage.write_metadata([(job.student_id, job.metadata()) for job in jobs])
+                    logger.info(f'✓ Metadata saved to {self.storage.name} ({len(jobs)} record(s))')
+                    for job in jobs:
+                        job.set_state('done')
+                        self._unspool(job)
+                    break
+                except Exception as e:
+                    if attempt >= self.max_attempts:
+                        for job in jobs:
+                            self._fail(job, f'Metadata write failed: {e}')
+                        break
+                    delay = self._retry_delay(attempt)
+                    logger.warning(f'Metadata batch write failed ({e}), retrying in {delay:.1f}s')
+                    time.sleep(delay)
+            for _ in jobs:
+                self._metadata.task_done()
+
+    def join(self):
+        """Block until every queued job has been uploaded and recorded (used by tools/tests)"""
+        self._jobs.join()
+        self._metadata.join()
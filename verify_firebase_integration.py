@@ -134,7 +134,7 @@ def test_make_dataset_file():
             content = f.read()
         
         checks = {
-            'upload_face_image_to_firebase': 'Firebase upload function',
+            'BackgroundUploader': 'Background Firebase uploader',
             'UPLOAD_API_URL': 'Environment variable check',
             'firebase': 'Firebase references',
         }
@@ -67,6 +67,7 @@ export default function CapturePage({ studentData, onBack, onUploadComplete }) {
           studentName: studentData.studentName,
           className: studentData.className,
           position: POSITIONS[currentPosition],
+          visualization: 'preview',
         }),
       });
 
@@ -93,6 +94,7 @@ export default function CapturePage({ studentData, onBack, onUploadComplete }) {
             studentName: studentData.studentName,
             className: studentData.className,
             position: POSITIONS[currentPosition],
+            visualization: 'preview',
           }),
         });
         
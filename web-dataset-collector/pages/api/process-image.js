@@ -4,7 +4,7 @@ export default async function handler(req, res) {
   }
 
   try {
-    const { image, studentId, studentName, className, position } = req.body;
+    const { image, studentId, studentName, className, position, visualization } = req.body;
 
     if (!image || !studentId || !studentName || !className || !position) {
       return res.status(400).json({
@@ -27,6 +27,7 @@ export default async function handler(req, res) {
         studentName,
         className,
         position,
+        visualization: visualization || 'none',
       }),
     });
 